@@ -0,0 +1,172 @@
+import re
+import threading
+import time as clock
+from bisect import bisect_left, insort
+from typing import Dict, List, Tuple
+from django.db.models import Max
+from .models import Patient, Doctor
+
+class PrefixIndex:
+    """
+    Per-process typeahead index over patient and doctor names, phones and
+    doctor specializations.
+
+    Keys live in one sorted list of ``(key, kind, id)`` tuples, so a prefix
+    lookup is a ``bisect`` plus a short forward scan. The index is refreshed
+    lazily: at most every ``REFRESH_SECONDS`` it loads only rows whose
+    ``updated_at`` is past the stored watermark, and every
+    ``REBUILD_SECONDS`` it reloads everything so deleted rows drop out.
+    """
+    KINDS = ('patient', 'doctor')
+    REFRESH_SECONDS = 5
+    REBUILD_SECONDS = 300
+    MAX_SCAN = 500
+
+    _lock = threading.Lock()
+    # (entries, keys, items, watermarks): writers build new structures and
+    # replace the tuple in one assignment, so readers need no lock
+    _state: Tuple[List[Tuple[str, str, int]], Dict[Tuple[str, int], List[str]], Dict[Tuple[str, int], Dict],
+                  Dict[str, object]] = ([], {}, {}, {})
+    _checked_at = None
+    _built_at = None
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return ' '.join(re.findall(r'\w+', (text or '').lower()))
+
+    @staticmethod
+    def digits(text: str) -> str:
+        return re.sub(r'\D', '', text or '')
+
+    @classmethod
+    def _querysets(cls):
+        return {
+            'patient': Patient.objects.select_related('user').order_by(),
+            'doctor': Doctor.objects.select_related('user').order_by(),
+        }
+
+    @classmethod
+    def describe(cls, kind: str, obj) -> Tuple[Dict, List[str]]:
+        """
+        The JSON payload for ``obj`` and the index keys that should find it
+        """
+        user = obj.user
+        name = user.get_full_name() or user.username
+        keys = {cls.normalize(name), cls.normalize(user.username)}
+        keys.update(cls.normalize(part) for part in (user.first_name, user.last_name))
+        phone = cls.digits(obj.phone)
+        if phone:
+            keys.add(phone)
+
+        item = {'id': obj.pk, 'type': kind, 'label': name}
+        if kind == 'doctor':
+            specialization = obj.get_specialization_display()
+            keys.update({cls.normalize(obj.specialization), cls.normalize(specialization)})
+            item.update(label=f"Dr. {name}", detail=specialization, available=obj.is_available)
+        else:
+            item['detail'] = obj.phone
+        return item, sorted(key for key in keys if key)
+
+    @staticmethod
+    def _remove(entries, keys, items, ident: Tuple[str, int]):
+        for key in keys.pop(ident, []):
+            i = bisect_left(entries, (key,) + ident)
+            if i < len(entries) and entries[i] == (key,) + ident:
+                del entries[i]
+        items.pop(ident, None)
+
+    @classmethod
+    def _add(cls, entries, keys, items, kind: str, obj, bulk: bool = False):
+        ident = (kind, obj.pk)
+        item, item_keys = cls.describe(kind, obj)
+        items[ident] = item
+        keys[ident] = item_keys
+        for key in item_keys:
+            if bulk:
+                entries.append((key,) + ident)
+            else:
+                insort(entries, (key,) + ident)
+
+    @classmethod
+    def _rebuild(cls):
+        entries, keys, items, watermarks = [], {}, {}, {}
+        for kind, queryset in cls._querysets().items():
+            watermarks[kind] = queryset.aggregate(latest=Max('updated_at'))['latest']
+            for obj in queryset.iterator(chunk_size=2000):
+                cls._add(entries, keys, items, kind, obj, bulk=True)
+        entries.sort()
+        cls._state = (entries, keys, items, watermarks)
+        cls._built_at = cls._checked_at = clock.monotonic()
+
+    @classmethod
+    def rebuild(cls):
+        with cls._lock:
+            cls._rebuild()
+
+    @classmethod
+    def refresh(cls, force: bool = False):
+        """
+        Fold in rows changed since the last watermark, or rebuild when due
+        """
+        now = clock.monotonic()
+        built_at, checked_at = cls._built_at, cls._checked_at
+        if (not force and built_at is not None and checked_at is not None
+                and now - built_at < cls.REBUILD_SECONDS and now - checked_at < cls.REFRESH_SECONDS):
+            return
+
+        with cls._lock:
+            # Another thread may have refreshed while this one waited
+            now = clock.monotonic()
+            if force or cls._built_at is None or now - cls._built_at >= cls.REBUILD_SECONDS:
+                cls._rebuild()
+                return
+            if now - cls._checked_at < cls.REFRESH_SECONDS:
+                return
+
+            entries, keys, items, watermarks = cls._state
+            changes = {}
+            for kind, queryset in cls._querysets().items():
+                watermark = watermarks.get(kind)
+                changes[kind] = list(queryset.filter(updated_at__gt=watermark) if watermark else queryset)
+            if any(changes.values()):
+                entries, keys, items, watermarks = list(entries), dict(keys), dict(items), dict(watermarks)
+                for kind, changed in changes.items():
+                    for obj in changed:
+                        cls._remove(entries, keys, items, (kind, obj.pk))
+                        cls._add(entries, keys, items, kind, obj)
+                        if watermarks.get(kind) is None or obj.updated_at > watermarks[kind]:
+                            watermarks[kind] = obj.updated_at
+                cls._state = (entries, keys, items, watermarks)
+            cls._checked_at = now
+
+    @classmethod
+    def search(cls, text: str, kinds=KINDS, limit: int = 10, available_only: bool = False) -> List[Dict]:
+        cls.refresh()
+        phone = cls.digits(text)
+        query = phone if phone and not re.search(r'[^\d\s()+-]', text) else cls.normalize(text)
+        if not query:
+            return []
+
+        results, seen = [], set()
+        state = cls._state
+        entries, items = state[0], state[2]
+        i = bisect_left(entries, (query,))
+        for key, kind, pk in entries[i:i + cls.MAX_SCAN]:
+            if not key.startswith(query):
+                break
+            if kind not in kinds or (kind, pk) in seen:
+                continue
+            item = items.get((kind, pk))
+            if item is None or (available_only and not item.get('available', True)):
+                continue
+            seen.add((kind, pk))
+            results.append(item)
+            if len(results) >= limit:
+                break
+        return results
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._state = ([], {}, {}, {})
+            cls._built_at = cls._checked_at = None
@@ -0,0 +1,57 @@
+import re
+from typing import Dict, List
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+def pragma_statements(pragmas: Dict) -> List[str]:
+    """
+    ``PRAGMA`` statements for a ``{name: value}`` mapping; values come from
+    the environment, so only plain words and integers are accepted
+    """
+    statements = []
+    for name, value in pragmas.items():
+        if not re.fullmatch(r'\w+', str(name)) or not re.fullmatch(r'-?\w+', str(value)):
+            raise ImproperlyConfigured(f'Invalid SQLite pragma {name!r} = {value!r}')
+        statements.append(f'PRAGMA {name} = {value}')
+    return statements
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    ``django.db.backends.sqlite3`` with per-connection tuning, configured by
+    two extra ``OPTIONS`` that are not passed on to ``sqlite3.connect()``:
+
+    ``pragmas``
+        ``{name: value}`` applied to every new connection, e.g. WAL
+        journaling, ``synchronous = NORMAL`` and a ``busy_timeout``.
+    ``transaction_mode``
+        ``DEFERRED``, ``IMMEDIATE`` or ``EXCLUSIVE``, used to ``BEGIN`` the
+        transactions ``atomic()`` opens (Django 5.1 has the same option).
+        With ``IMMEDIATE`` the write lock is taken up front, so a
+        transaction that reads before it writes waits out ``busy_timeout``
+        behind another writer instead of failing with ``database is
+        locked`` when it tries to upgrade its lock.
+    """
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pragmas', None)
+        mode = params.pop('transaction_mode', None)
+        if mode is not None and mode.upper() not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f"settings.DATABASES {self.alias!r} transaction_mode must be one of {', '.join(TRANSACTION_MODES)}"
+            )
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for statement in pragma_statements(self.settings_dict['OPTIONS'].get('pragmas', {})):
+            conn.execute(statement).fetchall()
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode')
+        self.cursor().execute(f'BEGIN {mode.upper()}' if mode else 'BEGIN')
@@ -0,0 +1,262 @@
+import logging
+import random
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from pydantic import ValidationError as PydanticValidationError
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, OperationalError, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Appointment, Doctor, Patient, HospitalStats
+from .scheduling import ConflictChecker
+from .schemas import BulkAppointmentItem
+from .signals import schedule_availability_refresh
+
+logger = logging.getLogger(__name__)
+
+class BookingService:
+    """
+    Race-free appointment booking.
+
+    Each attempt runs in one transaction that first takes a write lock on
+    the doctor's row with a no-op conditional UPDATE (a row lock on
+    PostgreSQL/MySQL, the database write lock on SQLite), then checks for
+    overlaps and inserts. Concurrent bookings for the same doctor are
+    therefore serialised, and a lost race surfaces as a structured conflict
+    rather than an IntegrityError.
+    """
+    MAX_RETRIES = 5
+    RETRY_DELAY = 0.05  # seconds, doubled per retry with jitter
+
+    @staticmethod
+    def describe(appointment: Appointment) -> Dict:
+        begin, end = ConflictChecker.bounds(
+            appointment.appointment_date, appointment.appointment_time, appointment.duration
+        )
+        return {
+            'appointment_id': appointment.pk,
+            'date': appointment.appointment_date.isoformat(),
+            'start': begin.strftime('%H:%M'),
+            'end': end.strftime('%H:%M'),
+        }
+
+    @classmethod
+    def _attempt(cls, appointment: Appointment) -> List[Dict]:
+        with transaction.atomic():
+            # Lock the doctor row before reading its bookings
+            if not Doctor.objects.filter(pk=appointment.doctor_id).update(updated_at=F('updated_at')):
+                raise Doctor.DoesNotExist('Doctor not found')
+            conflicts = ConflictChecker.conflicts_for(appointment)
+            if conflicts:
+                return [cls.describe(conflict) for conflict in conflicts]
+            appointment.save()
+        return []
+
+    @classmethod
+    def book(cls, appointment: Appointment) -> Tuple[Optional[Appointment], List[Dict]]:
+        """
+        Validate and insert an unsaved appointment.
+
+        Returns ``(appointment, [])`` on success or ``(None, conflicts)`` when
+        the interval is taken. Raises ``ValidationError`` for invalid input
+        and ``OperationalError`` if the database stays locked after retries.
+        """
+        # created_by is nullable but not blank=True; system bookings leave it empty
+        appointment.clean_fields(exclude=['created_by'])
+        appointment.clean_schedule()
+
+        for attempt in range(cls.MAX_RETRIES + 1):
+            try:
+                conflicts = cls._attempt(appointment)
+                return (None, conflicts) if conflicts else (appointment, [])
+            except IntegrityError:
+                # Lost a race on the unique (doctor, date, time) constraint
+                appointment.pk = None
+                conflicts = ConflictChecker.conflicts_for(appointment)
+                if conflicts:
+                    return None, [cls.describe(conflict) for conflict in conflicts]
+            except OperationalError as e:
+                if 'locked' not in str(e) or attempt == cls.MAX_RETRIES:
+                    raise
+                appointment.pk = None
+                logger.warning(f"Booking retry {attempt + 1} for doctor {appointment.doctor_id}: {str(e)}")
+            time.sleep(cls.RETRY_DELAY * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+        raise OperationalError('Could not book appointment after retries')
+
+
+class BulkBookingService:
+    """
+    Book or reschedule a batch of appointments in one transaction.
+
+    Every item is validated with a fixed number of set-based queries
+    (appointments being moved, doctors, patients, conflicts) however large
+    the batch is; new appointments are written with ``bulk_create`` and moved
+    ones with ``bulk_update``. Recurring items expand server-side into one
+    occurrence per repeat. Each occurrence gets its own result entry.
+    """
+    MAX_OCCURRENCES = 1000
+
+    @staticmethod
+    def _expand(index: int, item: BulkAppointmentItem) -> List[Tuple[Dict, BulkAppointmentItem, date]]:
+        count = item.repeat.count if item.repeat else 1
+        interval = item.repeat.interval_days if item.repeat else 0
+        occurrences = []
+        for occurrence in range(count):
+            day = item.appointment_date + timedelta(days=occurrence * interval)
+            result = {
+                'index': index,
+                'occurrence': occurrence,
+                'date': day.isoformat(),
+                'time': item.appointment_time,
+            }
+            occurrences.append((result, item, day))
+        return occurrences
+
+    @staticmethod
+    def _invalid(result: Dict, *errors: str) -> None:
+        result.update(status='invalid', errors=list(errors))
+
+    @classmethod
+    def process(cls, items: List[Dict], created_by=None, all_or_nothing: bool = False) -> Dict:
+        results = []
+        occurrences = []
+        for index, raw in enumerate(items):
+            try:
+                item = BulkAppointmentItem(**raw)
+            except (TypeError, PydanticValidationError) as e:
+                errors = [error['msg'] for error in e.errors()] if isinstance(e, PydanticValidationError) else [str(e)]
+                results.append({'index': index, 'occurrence': 0, 'status': 'invalid', 'errors': errors})
+                continue
+            if item.appointment_id and item.repeat:
+                results.append({'index': index, 'occurrence': 0, 'status': 'invalid',
+                                'errors': ['A reschedule cannot repeat']})
+                continue
+            expanded = cls._expand(index, item)
+            results.extend(result for result, _, _ in expanded)
+            occurrences.extend(expanded)
+
+        if len(occurrences) > cls.MAX_OCCURRENCES:
+            raise ValidationError(f'A batch may contain at most {cls.MAX_OCCURRENCES} appointments')
+
+        moving = Appointment.objects.in_bulk(
+            {item.appointment_id for _, item, _ in occurrences if item.appointment_id}
+        )
+        doctors = Doctor.objects.in_bulk(
+            {item.doctor_id for _, item, _ in occurrences if item.doctor_id}
+            | {appointment.doctor_id for appointment in moving.values()}
+        )
+        patients = set(Patient.objects.filter(
+            pk__in={item.patient_id for _, item, _ in occurrences if item.patient_id}
+        ).order_by().values_list('pk', flat=True))
+        previous_doctors = {appointment.doctor_id for appointment in moving.values()}
+        today = timezone.localdate()
+
+        candidates = []
+        seen_moves = set()
+        for result, item, day in occurrences:
+            start = datetime.strptime(item.appointment_time, '%H:%M').time()
+            if item.appointment_id:
+                appointment = moving.get(item.appointment_id)
+                if appointment is None:
+                    cls._invalid(result, 'Appointment not found')
+                    continue
+                if appointment.pk in seen_moves:
+                    cls._invalid(result, 'Appointment listed more than once')
+                    continue
+                if appointment.status in Appointment.RELEASED_STATUSES:
+                    cls._invalid(result, 'Cannot reschedule a cancelled appointment')
+                    continue
+                seen_moves.add(appointment.pk)
+                appointment.doctor_id = item.doctor_id or appointment.doctor_id
+                appointment.appointment_date = day
+                appointment.appointment_time = start
+                appointment.duration = item.duration or appointment.duration
+            else:
+                missing = [field for field in ('patient_id', 'doctor_id', 'reason') if not getattr(item, field)]
+                if missing:
+                    cls._invalid(result, f"Missing required fields: {', '.join(missing)}")
+                    continue
+                if item.patient_id not in patients:
+                    cls._invalid(result, 'Patient not found')
+                    continue
+                appointment = Appointment(
+                    patient_id=item.patient_id,
+                    doctor_id=item.doctor_id,
+                    appointment_date=day,
+                    appointment_time=start,
+                    duration=item.duration or Appointment._meta.get_field('duration').default,
+                    reason=item.reason,
+                    created_by=created_by
+                )
+
+            doctor = doctors.get(appointment.doctor_id)
+            if doctor is None:
+                cls._invalid(result, 'Doctor not found')
+            elif not doctor.is_available:
+                cls._invalid(result, 'Doctor is not available for appointments')
+            elif day < today:
+                cls._invalid(result, 'Cannot create appointment in the past')
+            else:
+                candidates.append((result, appointment))
+
+        with transaction.atomic():
+            # Same doctor-row write lock as BookingService, taken once per batch
+            Doctor.objects.filter(
+                pk__in={appointment.doctor_id for _, appointment in candidates}
+            ).update(updated_at=F('updated_at'))
+            conflicts = ConflictChecker.find_conflicts([appointment for _, appointment in candidates])
+
+            accepted, accepted_set = [], set()
+            for position, (result, appointment) in enumerate(candidates):
+                blocking = [
+                    candidates[other][1] if isinstance(other, int) else other
+                    for other in conflicts.get(position, [])
+                    if not isinstance(other, int) or other in accepted_set
+                ]
+                if blocking:
+                    result.update(status='conflict', conflicts=[BookingService.describe(c) for c in blocking])
+                else:
+                    accepted.append(position)
+                    accepted_set.add(position)
+
+            if all_or_nothing and len(accepted) < len(results):
+                for position in accepted:
+                    candidates[position][0]['status'] = 'skipped'
+                return cls._summary(results)
+
+            created = [candidates[position] for position in accepted if candidates[position][1].pk is None]
+            moved = [candidates[position] for position in accepted if candidates[position][1].pk is not None]
+
+            Appointment.objects.bulk_create([appointment for _, appointment in created])
+            now = timezone.now()
+            for _, appointment in moved:
+                appointment.updated_at = now
+            Appointment.objects.bulk_update(
+                [appointment for _, appointment in moved],
+                ['doctor', 'appointment_date', 'appointment_time', 'duration', 'updated_at']
+            )
+
+            for status, batch in (('created', created), ('rescheduled', moved)):
+                for result, appointment in batch:
+                    result.update(status=status, appointment_id=appointment.pk)
+
+            # bulk_create/bulk_update bypass the model signals
+            HospitalStats.apply_deltas(total_appointments=len(created), appointments_scheduled=len(created))
+            schedule_availability_refresh(
+                {appointment.doctor_id for _, appointment in created + moved} | previous_doctors
+            )
+
+        return cls._summary(results)
+
+    @staticmethod
+    def _summary(results: List[Dict]) -> Dict:
+        counts = Counter(result['status'] for result in results)
+        return {
+            'created': counts['created'],
+            'rescheduled': counts['rescheduled'],
+            'rejected': counts['invalid'] + counts['conflict'],
+            'results': results,
+        }
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Cache backends whose entries other worker processes cannot see
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def check_session_cache(app_configs, **kwargs):
+    """
+    ``core.sessions`` trusts its cache entry over the database, so a cache
+    that is not shared by every worker serves stale sessions
+    """
+    if settings.SESSION_ENGINE != 'core.sessions':
+        return []
+    alias = settings.SESSION_CACHE_ALIAS
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend in PROCESS_LOCAL_CACHES:
+        return [Error(
+            f"SESSION_CACHE_ALIAS {alias!r} uses {backend}, which is local to one process",
+            hint="Point it at a shared cache (file-based, database or Redis), e.g. CACHES['sessions'].",
+            id='core.E001',
+        )]
+    return []
@@ -0,0 +1,169 @@
+import mmap
+import os
+import re
+from typing import Optional, Tuple
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+from .models import Attachment
+from .previews import PreviewPool, derivative_path
+from .roles import RoleResolver
+
+class AttachmentServer:
+    """
+    Serves stored attachments after the permission check.
+
+    ``ATTACHMENT_SERVE_MODE`` picks who moves the bytes:
+
+    * ``'x-accel'``: nginx, via ``X-Accel-Redirect`` to
+      ``ATTACHMENT_ACCEL_PREFIX`` + the storage path (an ``internal``
+      location aliased to ``MEDIA_ROOT``)
+    * ``'x-sendfile'``: Apache/lighttpd, via ``X-Sendfile`` with the
+      absolute path
+    * ``'django'`` (default): Django answers conditional requests and single
+      byte ranges itself. Whole files go out as a ``FileResponse`` so the
+      WSGI server can use ``sendfile``; ranges are sliced from an ``mmap``
+
+    The ETag is the blob's SHA-256, which is a strong validator because
+    stored content never changes.
+    """
+    BLOCK_SIZE = 64 * 1024
+    RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+    @staticmethod
+    def can_view(user, attachment: Attachment) -> bool:
+        record = attachment.medical_record
+        if record is not None and not record.visible_to(user):
+            return False
+        if any(RoleResolver.has(user, role) for role in ('adminprofile', 'employee', 'doctor')):
+            return True
+        if RoleResolver.has(user, 'patient'):
+            patient_id = user.patient.pk
+            owners = [attachment.patient_id]
+            if record is not None:
+                owners.append(record.patient_id)
+            if attachment.lab_test is not None:
+                owners.append(attachment.lab_test.patient_id)
+            return patient_id in owners
+        return False
+
+    @staticmethod
+    def mode() -> str:
+        return getattr(settings, 'ATTACHMENT_SERVE_MODE', 'django')
+
+    @classmethod
+    def parse_range(cls, header: str, size: int) -> Optional[Tuple[int, int]]:
+        """
+        ``(start, end)`` inclusive for a single satisfiable byte range,
+        ``None`` when the header should be ignored (absent, malformed or
+        multi-range), or raise ``ValueError`` when it cannot be satisfied
+        """
+        match = cls.RANGE_RE.match(header.strip()) if header else None
+        if not match or match.groups() == ('', ''):
+            return None
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            if last and int(last) < start:
+                return None
+        else:
+            suffix = int(last)
+            if suffix == 0:
+                raise ValueError('Empty suffix range')
+            start, end = max(size - suffix, 0), size - 1
+        if start >= size:
+            raise ValueError('Range starts past the end of the file')
+        return start, end
+
+    @staticmethod
+    def _if_range_matches(request, etag: str, last_modified: int) -> bool:
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if not if_range:
+            return True
+        if if_range.startswith(('"', 'W/')):
+            return if_range == etag
+        return parse_http_date_safe(if_range) == last_modified
+
+    @classmethod
+    def _mmap_blocks(cls, path: str, start: int, end: int):
+        with open(path, 'rb') as handle:
+            with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                position = start
+                while position <= end:
+                    stop = min(position + cls.BLOCK_SIZE, end + 1)
+                    yield mapped[position:stop]
+                    position = stop
+
+    @classmethod
+    def serve(cls, request, attachment: Attachment, variant: Optional[str] = None):
+        """
+        The attachment itself, or with ``variant`` one of its generated
+        previews, shown inline
+        """
+        blob = attachment.blob
+        relative, content_type, tag, file_name = blob.path, blob.content_type, blob.sha256, attachment.file_name
+        if variant is not None:
+            if not PreviewPool.available(blob.path, variant):
+                raise Http404('Preview not available')
+            relative, content_type, tag = derivative_path(blob.path, variant), 'image/jpeg', f'{blob.sha256}-{variant}'
+            file_name = f'{os.path.splitext(file_name)[0]}-{variant}.jpg'
+        as_attachment = variant is None
+        headers = {
+            'Content-Type': content_type,
+            'Content-Disposition': content_disposition_header(as_attachment, file_name),
+        }
+
+        mode = cls.mode()
+        if mode == 'x-accel':
+            prefix = getattr(settings, 'ATTACHMENT_ACCEL_PREFIX', '/protected-media/')
+            response = HttpResponse(headers=headers)
+            response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + relative.replace(os.sep, '/')
+            return response
+        if mode == 'x-sendfile':
+            response = HttpResponse(headers=headers)
+            response['X-Sendfile'] = default_storage.path(relative)
+            return response
+
+        path = default_storage.path(relative)
+        stat = os.stat(path)
+        size = stat.st_size
+        etag = quote_etag(tag)
+        last_modified = int(stat.st_mtime)
+        headers.update({
+            'ETag': etag,
+            'Last-Modified': http_date(last_modified),
+            'Accept-Ranges': 'bytes',
+        })
+
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            for name, value in headers.items():
+                if name in ('ETag', 'Last-Modified'):
+                    not_modified[name] = value
+            return not_modified
+
+        byte_range = None
+        if request.method == 'GET' and cls._if_range_matches(request, etag, last_modified):
+            try:
+                byte_range = cls.parse_range(request.META.get('HTTP_RANGE', ''), size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+
+        if byte_range is None or byte_range == (0, size - 1):
+            response = FileResponse(
+                open(path, 'rb'), as_attachment=as_attachment, filename=file_name, content_type=content_type
+            )
+            for name in ('ETag', 'Last-Modified', 'Accept-Ranges'):
+                response[name] = headers[name]
+            return response
+
+        start, end = byte_range
+        response = StreamingHttpResponse(cls._mmap_blocks(path, start, end), status=206, headers=headers)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+        return response
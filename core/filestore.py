@@ -0,0 +1,134 @@
+import logging
+import os
+import uuid
+from typing import Optional
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from .models import Attachment, StoredFile
+from .previews import PreviewPool
+from .utils import FileHandler
+
+logger = logging.getLogger(__name__)
+
+class ContentStore:
+    """
+    Deduplicating, content-addressed file store under ``MEDIA_ROOT``.
+
+    Uploads are streamed to a temporary name while being hashed, then moved
+    to ``<directory>/<aa>/<sha256><ext>``. Content that is already stored is
+    not written twice: the temporary copy is discarded and the existing
+    ``StoredFile`` returned. Blobs are referenced by ``Attachment`` rows
+    (counted by ``core.signals``) and by callers of ``FileHandler.save_file``
+    that keep only the path (``retain``); ``release`` drops a reference and
+    the file is unlinked after the last one goes.
+
+    Looking up an existing blob and dropping its last reference both lock
+    its row (on SQLite, the write lock our transactions take at ``BEGIN
+    IMMEDIATE``), so a blob cannot be deleted between ``put`` returning it
+    and the caller referencing it in the same transaction.
+
+    Blobs are moved into place with ``os.replace``, so ``default_storage``
+    must be a local ``FileSystemStorage``.
+    """
+    DEFAULT_DIRECTORY = 'attachments'
+    TEMP_DIRECTORY = 'tmp'
+
+    @staticmethod
+    def blob_path(directory: str, digest: str, extension: str) -> str:
+        return os.path.join(directory, digest[:2], f"{digest}{extension}")
+
+    @staticmethod
+    def _move(source: str, target: str):
+        try:
+            target_path = default_storage.path(target)
+        except NotImplementedError:
+            raise ImproperlyConfigured('ContentStore needs a local FileSystemStorage as default_storage')
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        # Atomic on one filesystem; racing writers of the same digest write identical bytes
+        os.replace(default_storage.path(source), target_path)
+
+    @classmethod
+    def put(cls, file, content_type: str, directory: str = DEFAULT_DIRECTORY) -> StoredFile:
+        """
+        Store ``file`` unless identical content is already stored; the
+        caller is expected to have validated it. The blob comes back
+        unreferenced: ``retain`` or ``attach`` it in the same transaction
+        """
+        extension = FileHandler.ALLOWED_EXTENSIONS.get(content_type, '')
+        temp_name = os.path.join(directory, cls.TEMP_DIRECTORY, f"{uuid.uuid4().hex}.part")
+        temp_path, digest, size = FileHandler.stream_to_storage(file, temp_name)
+
+        try:
+            with transaction.atomic():
+                existing = StoredFile.objects.select_for_update().filter(sha256=digest).first()
+                if existing is not None:
+                    if default_storage.exists(existing.path):
+                        logger.info(f"Deduplicated upload {digest} -> {existing.path}")
+                    else:
+                        cls._move(temp_path, existing.path)
+                    return existing
+
+                path = cls.blob_path(directory, digest, extension)
+                cls._move(temp_path, path)
+                try:
+                    with transaction.atomic():
+                        return StoredFile.objects.create(
+                            sha256=digest, path=path, size=size, content_type=content_type
+                        )
+                except IntegrityError:
+                    # Another request stored the same content first
+                    return StoredFile.objects.select_for_update().get(sha256=digest)
+        finally:
+            if default_storage.exists(temp_path):
+                default_storage.delete(temp_path)
+
+    @staticmethod
+    def retain(blob: StoredFile):
+        """
+        Take a reference to ``blob`` for a caller that keeps only its path
+        """
+        if not StoredFile.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1):
+            raise StoredFile.DoesNotExist(f'Blob {blob.sha256} was removed')
+
+    @staticmethod
+    def attach(blob: StoredFile, file_name: str, uploaded_by=None, **owners) -> Attachment:
+        """
+        Reference ``blob`` from a patient, medical record and/or lab test
+        """
+        return Attachment.objects.create(blob=blob, file_name=file_name, uploaded_by=uploaded_by, **owners)
+
+    @classmethod
+    def release(cls, blob_id: int, attachment: bool = False) -> Optional[int]:
+        """
+        Drop one reference to a blob and return how many are left, or
+        ``None`` if there was nothing to release: the blob is gone or, for a
+        path reference, only attachments still hold it. The last reference
+        deletes the row, and the file once the transaction commits
+        """
+        with transaction.atomic():
+            blob = StoredFile.objects.select_for_update().filter(pk=blob_id).first()
+            if blob is None or (not attachment and blob.ref_count <= blob.attachments.count()):
+                return None
+            if blob.ref_count > 1:
+                StoredFile.objects.filter(pk=blob_id).update(ref_count=F('ref_count') - 1)
+                return blob.ref_count - 1
+            blob.delete()
+            transaction.on_commit(lambda: cls.unlink_unreferenced(blob.sha256, blob.path))
+            return 0
+
+    @classmethod
+    def unlink_unreferenced(cls, digest: str, path: str):
+        with transaction.atomic():
+            # The same content may have been stored again since the row was deleted
+            if StoredFile.objects.select_for_update().filter(sha256=digest).exists():
+                return
+            cls.unlink(path)
+
+    @staticmethod
+    def unlink(path: str):
+        if default_storage.exists(path):
+            default_storage.delete(path)
+            logger.info(f"Unreferenced file deleted: {path}")
+        PreviewPool.remove(path)
@@ -0,0 +1,336 @@
+import json
+import re
+import time as clock
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+from django.apps import apps
+from django.db import connection, models, transaction
+
+COLUMN = r'"(\w+)"\."(\w+)"'
+
+
+def model_for_table(table: str):
+    for model in apps.get_models():
+        if model._meta.db_table == table:
+            return model
+    return None
+
+
+class QueryShape:
+    """
+    The indexable predicates of one logged statement, per table: equality
+    (``=``, ``IN``, ``IS NULL``), boolean, range and ``ORDER BY`` columns,
+    plus every column the statement reads
+    """
+
+    def __init__(self, statement: str, params=None):
+        self.statement = statement
+        self.params = params
+        self.aliases = self.parse_aliases(statement)
+        self.columns = self._columns(statement, COLUMN)
+        where = self.strip_filters(statement)
+        self.equal = self._columns(where, COLUMN + r' (?:= %s|IN \(|IS NULL)')
+        self.ranges = self._columns(where, COLUMN + r' (?:>=|<=|>|<|BETWEEN) ')
+        self.booleans = defaultdict(list)
+        for negated, alias, column in re.findall(r'(NOT )?' + COLUMN + r'(?=\)| AND | OR |$)', where):
+            table = self.aliases.get(alias, alias)
+            self.booleans[table].append((column, not negated))
+        self.order = defaultdict(list)
+        order_by = statement.rsplit(' ORDER BY ', 1)[1] if ' ORDER BY ' in statement else ''
+        for alias, column, direction in re.findall(COLUMN + r' (ASC|DESC)', order_by):
+            self.order[self.aliases.get(alias, alias)].append((column, direction == 'DESC'))
+
+    @staticmethod
+    def parse_aliases(statement: str) -> Dict[str, str]:
+        aliases = {}
+        for table, alias in re.findall(r'(?:FROM|JOIN) "(\w+)"(?: "?([A-Z]\d+)"?)?', statement):
+            aliases[alias or table] = table
+        return aliases
+
+    @staticmethod
+    def strip_filters(statement: str) -> str:
+        """
+        The statement without ``FILTER (WHERE ...)`` aggregate clauses or
+        negated groups, whose predicates cannot use an index
+        """
+        for marker in ('FILTER (WHERE', 'NOT ('):
+            while marker in statement:
+                start = statement.index(marker)
+                depth, i = 0, statement.index('(', start)
+                for i in range(i, len(statement)):
+                    depth += {'(': 1, ')': -1}.get(statement[i], 0)
+                    if depth == 0:
+                        break
+                statement = statement[:start] + statement[i + 1:]
+        return statement
+
+    def _columns(self, sql: str, pattern: str) -> Dict[str, List[str]]:
+        found = defaultdict(list)
+        for alias, column in re.findall(pattern, sql):
+            table = self.aliases.get(alias, alias)
+            if column not in found[table]:
+                found[table].append(column)
+        return found
+
+    def tables(self) -> Iterable[str]:
+        return set(self.equal) | set(self.ranges) | set(self.booleans) | set(self.order)
+
+
+class IndexCandidate:
+
+    def __init__(self, table: str, columns: List[Tuple[str, bool]], condition: Optional[Tuple[str, bool]]):
+        self.table = table
+        self.columns = columns          # (column, descending)
+        self.condition = condition      # (boolean column, value) for a partial index
+        self.fingerprints = set()
+        self.callers = set()
+        self.calls = 0
+        self.total_ms = 0.0
+        self.plans: List[Tuple[List[str], List[str]]] = []
+        self.timings: List[Tuple[float, float]] = []
+
+    @property
+    def key(self):
+        return self.table, tuple(self.columns), self.condition
+
+    def create_sql(self, name: str) -> str:
+        quote = connection.ops.quote_name
+        columns = ', '.join(quote(column) + (' DESC' if descending else '') for column, descending in self.columns)
+        sql = f'CREATE INDEX {quote(name)} ON {quote(self.table)} ({columns})'
+        if self.condition:
+            column, value = self.condition
+            sql += f' WHERE {"" if value else "NOT "}{quote(column)}'
+        return sql
+
+    def django_index(self) -> str:
+        """
+        The ``Meta.indexes`` entry for this candidate; only partial indexes
+        need an explicit name
+        """
+        model = model_for_table(self.table)
+        by_column = {field.column: field.name for field in model._meta.concrete_fields} if model else {}
+        fields = [('-' if descending else '') + by_column.get(column, column) for column, descending in self.columns]
+        index = f"models.Index(fields={fields!r}"
+        if self.condition:
+            column, value = self.condition
+            name = '_'.join([self.table.split('_', 1)[-1][:8]] + [field.lstrip('-')[:6] for field in fields])
+            index += f", condition=models.Q({by_column.get(column, column)}={value!r}), name={name[:21] + '_partial'!r}"
+        return index + ')'
+
+
+class IndexAdvisor:
+    """
+    Suggests indexes from captured query shapes.
+
+    Each statement from the slow query log (captured with
+    ``SLOW_QUERY_THRESHOLD_MS=0``, e.g. over a test run) is explained
+    against the current schema. Tables that are scanned, sorted with a
+    temporary B-tree, or read row by row after an index search get a
+    candidate index (see ``candidate_for``). A candidate is kept only if
+    it removes the problem: it is created inside a transaction, the
+    statement is explained again, and the transaction is rolled back.
+    SQLite only.
+
+    Queries issued from the test module are left out: lookups that only
+    assertions make should not cost every write an index.
+    """
+    PROBE_NAME = 'index_advisor_probe'
+    MAX_COVERING_COLUMNS = 4
+    IGNORED_CALLERS = ('core/tests.py',)
+
+    @staticmethod
+    def explain(statement: str, params) -> List[str]:
+        connection.ensure_connection()
+        cursor = connection.create_cursor()
+        try:
+            cursor.execute('EXPLAIN QUERY PLAN ' + statement, params)
+            return [row[3] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def existing_indexes(table: str) -> List[List[str]]:
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, table)
+        return [info['columns'] for info in constraints.values() if info['index'] or info['unique']]
+
+    @staticmethod
+    def problems(plan: List[str], aliases: Dict[str, str]) -> Dict[str, str]:
+        """
+        Per table: ``scan`` (full scan), ``lookup`` (searched through an index
+        that does not cover the query); ``<order>`` if the result is sorted
+        with a temporary B-tree
+        """
+        found = {}
+        for line in plan:
+            match = re.match(r'(SCAN|SEARCH) (\w+)', line)
+            if not match or 'COVERING INDEX' in line or 'PRIMARY KEY' in line:
+                continue
+            table = aliases.get(match.group(2), match.group(2))
+            found[table] = 'scan' if match.group(1) == 'SCAN' else 'lookup'
+        if any('TEMP B-TREE FOR ORDER BY' in line for line in plan):
+            found['<order>'] = 'sort'
+        return found
+
+    @classmethod
+    def candidate_for(cls, shape: QueryShape, table: str, problem: str) -> Optional[IndexCandidate]:
+        """
+        The index for one problem: equality columns (foreign keys first),
+        then the ``ORDER BY`` columns for a sort or else one range column,
+        with a boolean predicate as the partial index condition. A lookup,
+        or a scan with nothing to search on, gets a covering index of every
+        column the statement reads instead, when that is a narrow index
+        """
+        model = model_for_table(table)
+        fields = model._meta.concrete_fields if model else []
+        equal = sorted(shape.equal.get(table, []), key=lambda column: not column.endswith('_id'))
+        columns = [(column, False) for column in equal]
+        order = shape.order.get(table, [])
+        if problem == 'sort' and order and set(shape.order) == {table}:
+            columns += [item for item in order if item[0] not in equal]
+        elif shape.ranges.get(table):
+            columns.append((shape.ranges[table][0], False))
+
+        if problem == 'lookup' or (problem == 'scan' and not columns):
+            primary_key = model._meta.pk.column if model else 'id'
+            indexed = {column for column, _ in columns}
+            columns += [
+                (column, False) for column in shape.columns.get(table, [])
+                if column not in indexed and column != primary_key
+            ]
+            if not columns or len(columns) > cls.MAX_COVERING_COLUMNS:
+                return None
+            return IndexCandidate(table, columns, None)
+
+        boolean_columns = {field.column for field in fields if isinstance(field, models.BooleanField)}
+        booleans = [item for item in shape.booleans.get(table, []) if item[0] in boolean_columns]
+        condition = booleans[0] if booleans else None
+        if not columns:
+            if condition is None:
+                return None
+            columns = [(condition[0], False)]
+        return IndexCandidate(table, columns, condition)
+
+    @classmethod
+    def covered(cls, candidate: IndexCandidate) -> bool:
+        wanted = [column for column, _ in candidate.columns]
+        return candidate.condition is None and any(
+            existing[:len(wanted)] == wanted for existing in cls.existing_indexes(candidate.table)
+        )
+
+    @staticmethod
+    def replayable(statement: str) -> bool:
+        """
+        Only ``SELECT`` statements are executed for timing; writes are only
+        ever explained
+        """
+        return statement.lstrip().upper().startswith('SELECT')
+
+    @classmethod
+    def _time(cls, statement: str, params, repeat: int) -> float:
+        if not cls.replayable(statement):
+            raise ValueError('Only SELECT statements are replayed')
+        connection.ensure_connection()
+        cursor = connection.create_cursor()
+        try:
+            start = clock.perf_counter()
+            for _ in range(repeat):
+                cursor.execute(statement, params)
+                cursor.fetchall()
+            return (clock.perf_counter() - start) * 1000 / repeat
+        finally:
+            cursor.close()
+
+    @classmethod
+    def probe(cls, candidate: IndexCandidate, shape: QueryShape, repeat: int = 0):
+        """
+        ``(plan_with_index, plan_problems, ms_before, ms_after)`` with the
+        candidate created for the duration of the probe only. The problems
+        only count plans that use the candidate. Timings are taken for
+        ``SELECT`` statements only, both inside the rolled-back transaction
+        """
+        repeat = repeat if cls.replayable(shape.statement) else 0
+        with transaction.atomic():
+            try:
+                before = cls._time(shape.statement, shape.params, repeat) if repeat else None
+                with connection.cursor() as cursor:
+                    cursor.execute(candidate.create_sql(cls.PROBE_NAME))
+                plan = cls.explain(shape.statement, shape.params)
+                after = cls._time(shape.statement, shape.params, repeat) if repeat else None
+            finally:
+                transaction.set_rollback(True)
+        if not any(cls.PROBE_NAME in line for line in plan):
+            return plan, None, before, after
+        return plan, cls.problems(plan, shape.aliases), before, after
+
+    @staticmethod
+    def solved(problem: str, table: str, remaining: Optional[Dict[str, str]]) -> bool:
+        """
+        Whether a probe's plan problems no longer include ``problem``
+        """
+        if remaining is None:
+            return False
+        if problem == 'sort':
+            return '<order>' not in remaining
+        if problem == 'scan':
+            return remaining.get(table) != 'scan'
+        return table not in remaining
+
+    @classmethod
+    def advise(cls, entries: Iterable[dict], repeat: int = 0) -> List[IndexCandidate]:
+        """
+        Verified candidates from slow query log entries, most total logged
+        time first
+        """
+        statements = {}
+        stats = defaultdict(lambda: [0, 0.0])
+        callers = defaultdict(set)
+        for entry in entries:
+            caller = entry.get('query_caller', '')
+            if caller.startswith(cls.IGNORED_CALLERS):
+                continue
+            fingerprint = entry['query_fingerprint']
+            stats[fingerprint][0] += 1
+            stats[fingerprint][1] += entry['query_ms']
+            callers[fingerprint].add(caller.split(' in ')[0])
+            statement = entry.get('query_statement')
+            if not statement:
+                continue
+            if entry.get('query_params'):
+                statements[fingerprint] = (statement, json.loads(entry['query_params']))
+            elif '%s' not in statement:
+                statements[fingerprint] = (statement, [])
+
+        candidates: Dict[tuple, IndexCandidate] = {}
+        for fingerprint, (statement, params) in statements.items():
+            if not statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            shape = QueryShape(statement, params)
+            try:
+                plan = cls.explain(statement, params)
+            except Exception:
+                continue
+            problems = cls.problems(plan, shape.aliases)
+            targets = [(table, problem) for table, problem in problems.items() if table in shape.columns]
+            if problems.pop('<order>', None) and len(shape.order) == 1:
+                targets.append((next(iter(shape.order)), 'sort'))
+            for table, problem in targets:
+                candidate = cls.candidate_for(shape, table, problem)
+                if candidate is None or cls.covered(candidate):
+                    continue
+                candidate = candidates.setdefault(candidate.key, candidate)
+                if fingerprint in candidate.fingerprints:
+                    continue
+                new_plan, remaining, before, after = cls.probe(candidate, shape, repeat)
+                if not cls.solved(problem, table, remaining):
+                    continue
+                candidate.fingerprints.add(fingerprint)
+                candidate.callers |= callers[fingerprint]
+                candidate.calls += stats[fingerprint][0]
+                candidate.total_ms += stats[fingerprint][1]
+                candidate.plans.append((plan, new_plan))
+                if before is not None:
+                    candidate.timings.append((before, after))
+
+        useful = [candidate for candidate in candidates.values() if candidate.fingerprints]
+        return sorted(useful, key=lambda candidate: candidate.total_ms, reverse=True)
@@ -0,0 +1,177 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import threading
+import time as clock
+import weakref
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, WatchedFileHandler
+from typing import Dict, Optional
+
+# LogRecord attributes that are not user-supplied ``extra`` fields
+RESERVED_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line. ``extra={...}`` fields are kept as
+    top-level keys.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'process': record.process,
+            'thread': record.thread,
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        for key, value in vars(record).items():
+            if key not in RESERVED_ATTRS and key not in entry:
+                entry[key] = value
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Caps how many records at ``level`` or above each logger may emit per
+    ``period`` seconds, so that an error storm cannot flood the sink. The
+    limit comes from the most specific entry in ``rates`` (dotted logger
+    prefixes, ``''`` for the rest). The first record let through after a
+    window with drops carries ``suppressed`` with the number dropped.
+    """
+
+    def __init__(self, rates: Optional[Dict[str, int]] = None, period: float = 60,
+                 level='WARNING', name: str = ''):
+        super().__init__(name)
+        self.rates = dict(rates or {})
+        self.period = period
+        self.level = logging._checkLevel(level)
+        self._windows: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def rate_for(self, logger_name: str) -> Optional[int]:
+        name = logger_name
+        while True:
+            if name in self.rates:
+                return self.rates[name]
+            if not name:
+                return None
+            name = name.rpartition('.')[0]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.level:
+            return True
+        rate = self.rate_for(record.name)
+        if rate is None:
+            return True
+
+        now = clock.monotonic()
+        with self._lock:
+            window = self._windows.get(record.name)
+            if window is None or now - window[0] >= self.period:
+                suppressed = window[2] if window else 0
+                window = self._windows[record.name] = [now, 0, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+            if window[1] >= rate:
+                window[2] += 1
+                return False
+            window[1] += 1
+        return True
+
+
+# Open handlers, so the process-wide fork and exit hooks below reach them
+# without registering a callback per instance (dictConfig reloads create new ones)
+_handlers = weakref.WeakSet()
+
+
+def _start_handlers():
+    # A forked worker inherits the handlers but not their listener threads
+    for handler in list(_handlers):
+        handler.start()
+
+
+def _stop_handlers():
+    for handler in list(_handlers):
+        handler.stop()
+
+
+os.register_at_fork(after_in_child=_start_handlers)
+atexit.register(_stop_handlers)
+
+
+class QueueLogHandler(QueueHandler):
+    """
+    Request threads only put records on an in-memory queue. A listener
+    thread formats them as JSON and appends them to one file (and
+    optionally the console). Records are flattened before they are queued:
+    the message is interpolated and any traceback is rendered to text, so
+    no arguments or frames are kept alive in the queue. When the queue is
+    full, records are dropped rather than blocking the request.
+
+    Every worker process appends to the same file, so it is rotated outside
+    the application (logrotate, naming rotations ``LOG_FILE.1``,
+    ``LOG_FILE.2``...): each process notices the file was moved and reopens
+    it, where in-process rotation would have workers renaming the file
+    under each other.
+    """
+
+    def __init__(self, filename: str, console: bool = True, queue_size: int = 10000):
+        super().__init__(queue.Queue(queue_size))
+        self.dropped = 0
+        self.sinks = [WatchedFileHandler(filename, delay=True)]
+        if console:
+            self.sinks.append(logging.StreamHandler())
+        for sink in self.sinks:
+            sink.setFormatter(JsonFormatter())
+        self.listener = None
+        self.closed = False
+        self.start()
+        _handlers.add(self)
+
+    def start(self):
+        if self.closed:
+            return
+        self.listener = QueueListener(self.queue, *self.sinks, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        if self.listener is not None and self.listener._thread is not None:
+            self.listener.stop()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Other handlers may still see the original record
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        # e.g. django.request passes the request object itself as an extra
+        for key, value in vars(record).items():
+            if key not in RESERVED_ATTRS and not isinstance(value, (str, int, float, bool, type(None))):
+                setattr(record, key, str(value))
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        self.closed = True
+        _handlers.discard(self)
+        self.stop()
+        for sink in self.sinks:
+            sink.close()
+        super().close()
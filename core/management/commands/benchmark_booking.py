@@ -0,0 +1,112 @@
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time as clock
+from collections import Counter
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.utils import timezone
+from core.booking import BookingService
+from core.models import Appointment, Doctor, Patient
+from core.scheduling import SlotEngine
+
+
+class Command(BaseCommand):
+    help = (
+        'Hammer BookingService from many threads against a scratch copy of the schema and report '
+        'bookings/sec and conflict rate'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=8, help='Concurrent booking threads')
+        parser.add_argument('--attempts', type=int, default=50, help='Booking attempts per client')
+        parser.add_argument('--days', type=int, default=1, help='Days of slots the clients compete for')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The default database is not SQLite')
+        # Bookings fire the real signals (stats, availability, search index),
+        # so they run against a migrated scratch database, never the configured one
+        configured = connections.settings[DEFAULT_DB_ALIAS]
+        directory = tempfile.mkdtemp(prefix='benchmark_booking_')
+        try:
+            self.use_database({**configured, 'NAME': os.path.join(directory, 'booking.sqlite3')})
+            call_command('migrate', verbosity=0, interactive=False)
+            self.run(options)
+        finally:
+            self.use_database(configured)
+            shutil.rmtree(directory, ignore_errors=True)
+
+    @staticmethod
+    def use_database(settings_dict):
+        connections[DEFAULT_DB_ALIAS].close()
+        del connections[DEFAULT_DB_ALIAS]
+        connections.settings[DEFAULT_DB_ALIAS] = settings_dict
+
+    def run(self, options):
+        doctor = Doctor.objects.create(
+            user=User.objects.create_user('bench_doctor'),
+            max_patients_per_day=10 ** 6
+        )
+        patients = [
+            Patient.objects.create(user=User.objects.create_user(f'bench_patient_{i}'))
+            for i in range(options['clients'])
+        ]
+        start_day = timezone.localdate() + timedelta(days=1)
+        slots = [
+            (start_day + timedelta(days=day), slot)
+            for day in range(options['days'])
+            for slot in SlotEngine.slot_times()
+        ]
+
+        results = Counter()
+        errors = Counter()
+        lock = threading.Lock()
+
+        def client(patient):
+            local, local_errors = Counter(), Counter()
+            try:
+                for _ in range(options['attempts']):
+                    day, slot = random.choice(slots)
+                    try:
+                        booked, conflicts = BookingService.book(Appointment(
+                            patient=patient, doctor=doctor, appointment_date=day,
+                            appointment_time=slot, reason='Benchmark booking',
+                            created_by=patient.user
+                        ))
+                        local['booked' if booked else 'conflict'] += 1
+                    except Exception as e:
+                        # By type, so a bug is not mistaken for lock contention
+                        local['error'] += 1
+                        local_errors[type(e).__name__] += 1
+            finally:
+                connection.close()
+                with lock:
+                    results.update(local)
+                    errors.update(local_errors)
+
+        threads = [threading.Thread(target=client, args=(patient,)) for patient in patients]
+        started = clock.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = clock.perf_counter() - started
+
+        attempts = sum(results.values())
+        stored = Appointment.objects.filter(doctor=doctor).count()
+        self.stdout.write(f'clients={options["clients"]} attempts={attempts} slots={len(slots)} elapsed={elapsed:.2f}s')
+        self.stdout.write(f'booked={results["booked"]} conflicts={results["conflict"]} errors={results["error"]}')
+        for name, count in errors.most_common():
+            self.stdout.write(self.style.ERROR(f'  {name}: {count}'))
+        self.stdout.write(f'bookings/sec={results["booked"] / elapsed:.1f} attempts/sec={attempts / elapsed:.1f}')
+        self.stdout.write(f'conflict rate={results["conflict"] / max(attempts, 1):.1%}')
+        if stored != results['booked'] or stored > len(slots):
+            self.stdout.write(self.style.ERROR(f'Inconsistent result: {stored} appointments stored'))
+        else:
+            self.stdout.write(self.style.SUCCESS('No double bookings'))
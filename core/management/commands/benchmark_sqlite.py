@@ -0,0 +1,151 @@
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time as clock
+from collections import Counter, defaultdict
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections, transaction
+
+ALIAS = 'sqlite_benchmark'
+
+# Django's own SQLite defaults: rollback journal, synchronous=FULL, deferred
+# transactions and a new connection per request
+STOCK = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'OPTIONS': {},
+    'CONN_MAX_AGE': 0,
+    'CONN_HEALTH_CHECKS': False,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Run concurrent readers and writers against a scratch SQLite database, with Django\'s stock '
+        'SQLite settings and with the configured ones, and report throughput, latency and lock errors'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8, help='Concurrent reading threads')
+        parser.add_argument('--writers', type=int, default=4, help='Concurrent writing threads')
+        parser.add_argument('--seconds', type=float, default=5.0, help='Duration of each run')
+        parser.add_argument('--rows', type=int, default=50000, help='Rows in the scratch table')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The default database is not SQLite')
+        configured = {key: connection.settings_dict[key] for key in STOCK}
+
+        directory = tempfile.mkdtemp(prefix='benchmark_sqlite_')
+        try:
+            results = {}
+            for name, profile in (('stock', STOCK), ('configured', configured)):
+                path = os.path.join(directory, f'{name}.sqlite3')
+                self.seed(path, options['rows'])
+                connections.settings[ALIAS] = {**connection.settings_dict, **profile, 'NAME': path}
+                try:
+                    results[name] = self.run(options)
+                finally:
+                    connections[ALIAS].close()
+                    del connections[ALIAS]
+                    del connections.settings[ALIAS]
+                self.report(name, results[name], options['seconds'])
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        stock, tuned = results['stock'], results['configured']
+        self.stdout.write(
+            f"configured vs stock: reads x{self.ratio(tuned, stock, 'read'):.2f}, "
+            f"writes x{self.ratio(tuned, stock, 'write'):.2f}, "
+            f"lock errors {stock['counts']['locked']} -> {tuned['counts']['locked']}"
+        )
+
+    @staticmethod
+    def seed(path: str, rows: int):
+        with sqlite3.connect(path) as db:
+            db.execute(
+                'CREATE TABLE bench_visit (id INTEGER PRIMARY KEY, patient_id INTEGER NOT NULL, '
+                'amount INTEGER NOT NULL, note TEXT NOT NULL)'
+            )
+            db.execute('CREATE INDEX bench_visit_patient ON bench_visit (patient_id)')
+            db.executemany(
+                'INSERT INTO bench_visit (patient_id, amount, note) VALUES (?, ?, ?)',
+                ((random.randrange(1000), random.randrange(10, 900), 'x' * 200) for _ in range(rows))
+            )
+        db.close()
+
+    @staticmethod
+    def read():
+        with connections[ALIAS].cursor() as cursor:
+            cursor.execute(
+                'SELECT COUNT(*), SUM(amount) FROM bench_visit WHERE patient_id = %s', [random.randrange(1000)]
+            )
+            cursor.fetchone()
+
+    @staticmethod
+    def write():
+        # Read, then write in the same transaction, as BookingService does
+        patient = random.randrange(1000)
+        with transaction.atomic(using=ALIAS):
+            with connections[ALIAS].cursor() as cursor:
+                cursor.execute('SELECT COUNT(*) FROM bench_visit WHERE patient_id = %s', [patient])
+                visits = cursor.fetchone()[0]
+                cursor.execute(
+                    'INSERT INTO bench_visit (patient_id, amount, note) VALUES (%s, %s, %s)',
+                    [patient, visits, 'x' * 200]
+                )
+
+    def run(self, options):
+        counts = Counter()
+        latencies = defaultdict(list)
+        lock = threading.Lock()
+        deadline = clock.perf_counter() + options['seconds']
+
+        def client(kind, operation):
+            local, timings = Counter(), []
+            try:
+                while clock.perf_counter() < deadline:
+                    start = clock.perf_counter()
+                    try:
+                        operation()
+                        local[kind] += 1
+                        timings.append((clock.perf_counter() - start) * 1000)
+                    except OperationalError as e:
+                        local['locked' if 'locked' in str(e) else 'error'] += 1
+                    # End of "request": what request_finished does
+                    connections[ALIAS].close_if_unusable_or_obsolete()
+            finally:
+                connections[ALIAS].close()
+                with lock:
+                    counts.update(local)
+                    latencies[kind].extend(timings)
+
+        threads = [threading.Thread(target=client, args=('read', self.read)) for _ in range(options['readers'])]
+        threads += [threading.Thread(target=client, args=('write', self.write)) for _ in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return {'counts': counts, 'latencies': latencies}
+
+    @staticmethod
+    def percentile(values, fraction: float) -> float:
+        values = sorted(values)
+        return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0.0
+
+    def report(self, name: str, result, seconds: float):
+        counts, latencies = result['counts'], result['latencies']
+        self.stdout.write(self.style.MIGRATE_HEADING(name))
+        for kind in ('read', 'write'):
+            self.stdout.write(
+                f'  {kind}s/sec={counts[kind] / seconds:.1f} '
+                f'p50={self.percentile(latencies[kind], 0.5):.2f}ms p95={self.percentile(latencies[kind], 0.95):.2f}ms'
+            )
+        style = self.style.ERROR if counts['locked'] or counts['error'] else self.style.SUCCESS
+        self.stdout.write(style(f"  locked={counts['locked']} errors={counts['error']}"))
+
+    @staticmethod
+    def ratio(tuned, stock, kind: str) -> float:
+        return tuned['counts'][kind] / max(stock['counts'][kind], 1)
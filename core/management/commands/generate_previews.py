@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from core.models import StoredFile
+from core.previews import PreviewPool
+
+
+class Command(BaseCommand):
+    help = 'Generate missing thumbnails and previews for stored uploads'
+
+    def handle(self, *args, **options):
+        futures = [
+            PreviewPool.submit(blob.path, blob.content_type)
+            for blob in StoredFile.objects.filter(content_type__in=PreviewPool.CONTENT_TYPES).iterator()
+        ]
+        written = failed = 0
+        for future in filter(None, futures):
+            if future.exception() is not None:
+                failed += 1
+            else:
+                written += len(future.result())
+        PreviewPool.shutdown()
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {written} derivatives for {len(futures)} files ({failed} failed)'
+        ))
@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from core.indexes import IndexAdvisor
+from core.slowqueries import SlowQueryLog
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay query shapes captured by the slow query log (run with SLOW_QUERY_THRESHOLD_MS=0) '
+        'and suggest composite or partial indexes that SQLite would use'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=None, help='Log file (default: LOG_FILE and its rotations)')
+        parser.add_argument('--since', help='Only records at or after this ISO timestamp')
+        parser.add_argument('--benchmark', type=int, default=0, metavar='N',
+                            help='Time each statement N times with and without the index')
+        parser.add_argument('--plans', action='store_true', help='Show query plans before and after')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The index advisor reads SQLite query plans')
+        path = options['file'] or getattr(settings, 'LOG_FILE', None)
+        if not path:
+            raise CommandError('No log file given and LOG_FILE is not set')
+
+        candidates = IndexAdvisor.advise(SlowQueryLog.read_log(path, options['since']), options['benchmark'])
+        if not candidates:
+            self.stdout.write(self.style.SUCCESS('No missing indexes found'))
+            return
+
+        for rank, candidate in enumerate(candidates, 1):
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{rank}. {candidate.table}: {len(candidate.fingerprints)} query shapes, '
+                f'{candidate.calls} logged calls, {candidate.total_ms:.1f} ms'
+            ))
+            self.stdout.write(f'   {candidate.django_index()}')
+            self.stdout.write(f'   {candidate.create_sql("<name>")}')
+            for caller in sorted(candidate.callers):
+                self.stdout.write(f'   from {caller}')
+            if candidate.timings:
+                before = sum(timing[0] for timing in candidate.timings)
+                after = sum(timing[1] for timing in candidate.timings)
+                self.stdout.write(f'   replayed: {before:.3f} ms -> {after:.3f} ms per round of its queries')
+            if options['plans']:
+                for old, new in candidate.plans:
+                    self.stdout.write('   before: ' + ' | '.join(old))
+                    self.stdout.write('   after:  ' + ' | '.join(new))
+            self.stdout.write('')
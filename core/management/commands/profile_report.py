@@ -0,0 +1,81 @@
+import io
+import os
+import pstats
+from collections import Counter, defaultdict
+from django.core.management.base import BaseCommand, CommandError
+from core.profiling import ViewProfiler
+
+
+class Command(BaseCommand):
+    help = 'Aggregate request profiles written by ProfilingMiddleware into a hot-function report per view'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=None, help='Profile directory (default: PROFILING_DIR)')
+        parser.add_argument('--view', action='append', help='Only these URL names (repeatable)')
+        parser.add_argument('--sort', choices=['tottime', 'cumulative', 'ncalls'], default='tottime',
+                            help='Sort order for cProfile output')
+        parser.add_argument('--limit', type=int, default=20, help='Functions to show per view')
+        parser.add_argument('--folded-out', help='Also write all sampled stacks, merged, to this file')
+
+    def handle(self, *args, **options):
+        root = options['dir'] or ViewProfiler.directory()
+        if not os.path.isdir(root):
+            raise CommandError(f'No profiles in {root}')
+
+        merged = Counter()
+        for view in sorted(os.listdir(root)):
+            directory = os.path.join(root, view)
+            if not os.path.isdir(directory) or (options['view'] and view not in options['view']):
+                continue
+            files = defaultdict(list)
+            for name in sorted(os.listdir(directory)):
+                files[os.path.splitext(name)[1]].append(os.path.join(directory, name))
+
+            if files['.prof']:
+                self.report_pstats(view, files['.prof'], options['sort'], options['limit'])
+            if files['.folded']:
+                stacks = self.read_folded(files['.folded'])
+                merged.update(stacks)
+                self.report_samples(view, len(files['.folded']), stacks, options['limit'])
+
+        if options['folded_out']:
+            with open(options['folded_out'], 'w') as out:
+                for stack, count in merged.most_common():
+                    out.write(f'{stack} {count}\n')
+            self.stdout.write(self.style.SUCCESS(f"Merged stacks written to {options['folded_out']}"))
+
+    def report_pstats(self, view, paths, sort, limit):
+        buffer = io.StringIO()
+        stats = pstats.Stats(*paths, stream=buffer)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        self.stdout.write(self.style.MIGRATE_HEADING(f'{view}: {len(paths)} cProfile runs'))
+        # Drop pstats' own preamble (file list), keep the totals line and the table
+        lines = buffer.getvalue().splitlines()
+        start = next((i for i, line in enumerate(lines) if 'function calls' in line), 0)
+        self.stdout.write('\n'.join(lines[start:]).rstrip() + '\n')
+
+    @staticmethod
+    def read_folded(paths):
+        stacks = Counter()
+        for path in paths:
+            with open(path) as folded:
+                for line in folded:
+                    stack, _, count = line.rstrip('\n').rpartition(' ')
+                    if stack and count.isdigit():
+                        stacks[stack] += int(count)
+        return stacks
+
+    def report_samples(self, view, runs, stacks, limit):
+        total = sum(stacks.values())
+        own, inclusive = Counter(), Counter()
+        for stack, count in stacks.items():
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            for frame in set(frames):
+                inclusive[frame] += count
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'{view}: {runs} sampled runs, {total} samples'))
+        self.stdout.write(f"{'self %':>7} {'total %':>8}  function")
+        for frame, count in own.most_common(limit):
+            self.stdout.write(f'{100 * count / total:>6.1f}% {100 * inclusive[frame] / total:>7.1f}%  {frame}')
+        self.stdout.write('')
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.models import HospitalStats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the HospitalStats rollup from the source tables and report any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report drift; exit with status 1 if the rollup is out of date',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            stats = HospitalStats.objects.select_for_update().filter(pk=HospitalStats.SINGLETON_ID).first()
+            drift = stats.drift() if stats else {field: (None, None) for field in HospitalStats.COUNTER_FIELDS}
+
+            if stats is None:
+                self.stdout.write(self.style.WARNING('No rollup row exists yet'))
+            elif drift:
+                for field, (stored, actual) in drift.items():
+                    self.stdout.write(self.style.WARNING(f'{field}: stored {stored}, actual {actual}'))
+            else:
+                self.stdout.write(self.style.SUCCESS('Rollup matches source tables'))
+
+            if options['check']:
+                if drift:
+                    raise SystemExit(1)
+                return
+
+            HospitalStats.rebuild()
+        self.stdout.write(self.style.SUCCESS('HospitalStats rebuilt'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.search import SearchIndex
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for patients and medical records'
+
+    def handle(self, *args, **options):
+        if not SearchIndex.enabled():
+            self.stdout.write(self.style.WARNING('Full-text search needs SQLite FTS5; nothing to do'))
+            return
+
+        with transaction.atomic():
+            patients, records = SearchIndex.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {patients} patients and {records} medical records'
+        ))
@@ -0,0 +1,55 @@
+from collections import Counter
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.slowqueries import SlowQueryLog
+
+
+class Command(BaseCommand):
+    help = 'Rank slow query shapes from the JSON log by total time, with their query plans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=None, help='Log file (default: LOG_FILE and its rotations)')
+        parser.add_argument('--limit', type=int, default=15, help='Shapes to show')
+        parser.add_argument('--since', help='Only records at or after this ISO timestamp')
+
+    def handle(self, *args, **options):
+        path = options['file'] or getattr(settings, 'LOG_FILE', None)
+        if not path:
+            raise CommandError('No log file given and LOG_FILE is not set')
+
+        shapes = {}
+        for entry in SlowQueryLog.read_log(path, options['since']):
+            shape = shapes.setdefault(entry['query_fingerprint'], {
+                'sql': entry.get('query_sql', ''), 'count': 0, 'total': 0.0, 'max': 0.0,
+                'plan': '', 'params': '', 'callers': Counter(),
+            })
+            shape['count'] += 1
+            shape['total'] += entry['query_ms']
+            shape['max'] = max(shape['max'], entry['query_ms'])
+            shape['callers'][entry.get('query_caller', 'unknown')] += 1
+            shape['plan'] = entry.get('query_plan') or shape['plan']
+            shape['params'] = entry.get('query_params') or shape['params']
+
+        if not shapes:
+            self.stdout.write(self.style.WARNING('No slow queries logged'))
+            return
+
+        ranked = sorted(shapes.items(), key=lambda item: item[1]['total'], reverse=True)
+        for rank, (fingerprint, shape) in enumerate(ranked[:options['limit']], 1):
+            full_scan = any(
+                line.strip().startswith('SCAN ') and ' USING ' not in line for line in shape['plan'].splitlines()
+            )
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{rank}. [{fingerprint}] total {shape['total']:.1f} ms, {shape['count']} calls, "
+                f"mean {shape['total'] / shape['count']:.1f} ms, max {shape['max']:.1f} ms"
+                + (' - FULL SCAN' if full_scan else '')
+            ))
+            self.stdout.write(f"   {shape['sql']}")
+            if shape['params']:
+                self.stdout.write(f"   last params: {shape['params']}")
+            for caller, count in shape['callers'].most_common(3):
+                self.stdout.write(f'   from {caller} ({count}x)')
+            for line in shape['plan'].splitlines():
+                self.stdout.write(f'   | {line}')
+            self.stdout.write('')
+        self.stdout.write(f'{len(shapes)} distinct shapes, {sum(s["count"] for s in shapes.values())} slow queries')
@@ -0,0 +1,149 @@
+import linecache
+import os
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# Frames from these files are bookkeeping, not application allocations
+IGNORED_FILES = (tracemalloc.__file__, linecache.__file__, '<frozen importlib._bootstrap>',
+                 '<frozen importlib._bootstrap_external>', '<unknown>')
+
+
+class AllocationPeak:
+    """
+    Result of ``MemoryTracer.measure()``; byte counts relative to the
+    start of the block
+    """
+    peak = 0
+    retained = 0
+
+
+class MemoryTracer:
+    """
+    Process-wide ``tracemalloc`` control for the admin diagnostics endpoint.
+
+    Tracing costs CPU and memory on every allocation, so it is off until
+    started. Named snapshots are kept in this process so that two points
+    in time (e.g. before and after a few hundred requests) can be diffed;
+    with several workers each keeps its own, and the endpoint only sees
+    the worker that answered.
+    """
+    DEFAULT_FRAMES = 10
+    MAX_SNAPSHOTS = 10
+    KEY_TYPES = ('lineno', 'filename', 'traceback')
+
+    _lock = threading.Lock()
+    _snapshots: Dict[str, tracemalloc.Snapshot] = {}
+
+    @staticmethod
+    def tracing() -> bool:
+        return tracemalloc.is_tracing()
+
+    @classmethod
+    def start(cls, frames: int = DEFAULT_FRAMES):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(max(1, min(frames, 100)))
+
+    @classmethod
+    def stop(cls):
+        """
+        Stop tracing; stored snapshots are dropped too, as they cannot be
+        compared with anything taken after a restart
+        """
+        tracemalloc.stop()
+        with cls._lock:
+            cls._snapshots = {}
+
+    @staticmethod
+    def status() -> Dict:
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        return {
+            'tracing': tracemalloc.is_tracing(),
+            'frames': tracemalloc.get_traceback_limit(),
+            'current_bytes': current,
+            'peak_bytes': peak,
+            'overhead_bytes': tracemalloc.get_tracemalloc_memory(),
+            'pid': os.getpid(),
+        }
+
+    @staticmethod
+    def _take() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, name) for name in IGNORED_FILES]
+        )
+
+    @classmethod
+    def snapshot(cls, label: str) -> tracemalloc.Snapshot:
+        if not tracemalloc.is_tracing():
+            raise ValueError('tracemalloc is not running')
+        snapshot = cls._take()
+        with cls._lock:
+            cls._snapshots.pop(label, None)
+            while len(cls._snapshots) >= cls.MAX_SNAPSHOTS:
+                cls._snapshots.pop(next(iter(cls._snapshots)))
+            cls._snapshots[label] = snapshot
+        return snapshot
+
+    @classmethod
+    def labels(cls) -> List[str]:
+        with cls._lock:
+            return list(cls._snapshots)
+
+    @classmethod
+    def _get(cls, label: Optional[str]) -> tracemalloc.Snapshot:
+        if label is None:
+            if not tracemalloc.is_tracing():
+                raise ValueError('tracemalloc is not running')
+            return cls._take()
+        with cls._lock:
+            if label not in cls._snapshots:
+                raise ValueError(f'No snapshot named {label!r}')
+            return cls._snapshots[label]
+
+    @staticmethod
+    def _site(traceback: tracemalloc.Traceback) -> List[str]:
+        return [f'{frame.filename}:{frame.lineno}' for frame in traceback]
+
+    @classmethod
+    def top(cls, label: Optional[str] = None, limit: int = 20, key_type: str = 'lineno') -> List[Dict]:
+        """
+        Largest allocation sites in a stored snapshot, or right now
+        """
+        stats = cls._get(label).statistics(key_type)[:limit]
+        return [{'site': cls._site(stat.traceback), 'size': stat.size, 'count': stat.count} for stat in stats]
+
+    @classmethod
+    def diff(cls, older: str, newer: Optional[str] = None, limit: int = 20,
+             key_type: str = 'lineno') -> List[Dict]:
+        """
+        Sites whose allocations grew most between ``older`` and ``newer``
+        (a stored label, or right now)
+        """
+        stats = cls._get(newer).compare_to(cls._get(older), key_type)[:limit]
+        return [
+            {'site': cls._site(stat.traceback), 'size': stat.size, 'size_diff': stat.size_diff,
+             'count': stat.count, 'count_diff': stat.count_diff}
+            for stat in stats
+        ]
+
+    @staticmethod
+    @contextmanager
+    def measure():
+        """
+        Peak and retained allocation inside the block. Reuses a running
+        trace (resetting its peak) or traces just for the block
+        """
+        result = AllocationPeak()
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        try:
+            yield result
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            result.peak, result.retained = peak - baseline, current - baseline
+            if started:
+                tracemalloc.stop()
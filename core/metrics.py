@@ -0,0 +1,225 @@
+import threading
+import time as clock
+from bisect import bisect_left
+from contextlib import ExitStack
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template as DjangoTemplate
+
+# The measurements of the request being handled on this thread, if any
+current: ContextVar[Optional['RequestTimer']] = ContextVar('request_timer', default=None)
+
+
+class RequestTimer:
+    """
+    Accumulates one request's database and template time
+    """
+
+    def __init__(self):
+        self.started = clock.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self._template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        start = clock.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_seconds += clock.perf_counter() - start
+
+    @property
+    def elapsed(self) -> float:
+        return clock.perf_counter() - self.started
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram in the Prometheus sense
+    """
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+class RequestMetrics:
+    """
+    Per-process request histograms keyed by URL name and method.
+
+    Each process keeps its own totals, so a scrape of
+    ``/metrics/`` behind several workers sees one worker at a time; the
+    series are counters and can be summed by the collector.
+    """
+    SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+    SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+    SERIES = {
+        'request_duration_seconds': ('Wall time per request', SECONDS_BUCKETS),
+        'request_db_seconds': ('Database time per request', SECONDS_BUCKETS),
+        'request_db_queries': ('Database queries per request', QUERY_BUCKETS),
+        'request_template_seconds': ('Template render time per request', SECONDS_BUCKETS),
+        'response_size_bytes': ('Response body size', SIZE_BUCKETS),
+    }
+    PREFIX = 'hospital_'
+
+    _lock = threading.Lock()
+    _histograms: Dict[Tuple[str, str, str], Histogram] = {}
+
+    @classmethod
+    def observe(cls, view: str, method: str, values: Dict[str, float]):
+        with cls._lock:
+            for series, value in values.items():
+                key = (series, view, method)
+                histogram = cls._histograms.get(key)
+                if histogram is None:
+                    histogram = cls._histograms[key] = Histogram(cls.SERIES[series][1])
+                histogram.observe(value)
+
+    @staticmethod
+    def _labels(**labels) -> str:
+        def escape(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels.items()) + '}'
+
+    @classmethod
+    def exposition(cls) -> str:
+        """
+        Everything recorded so far in the Prometheus text format (0.0.4)
+        """
+        from .sessions import SessionStore
+
+        lines = []
+        with cls._lock:
+            histograms = sorted(cls._histograms.items())
+            snapshot = [(key, list(histogram.cumulative()), histogram.sum, histogram.count)
+                        for key, histogram in histograms]
+        for series, (help_text, _) in cls.SERIES.items():
+            name = cls.PREFIX + series
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+            for (key_series, view, method), buckets, total, count in snapshot:
+                if key_series != series:
+                    continue
+                for bound, cumulative in buckets:
+                    le = '+Inf' if bound == float('inf') else repr(float(bound))
+                    lines.append(f'{name}_bucket{cls._labels(view=view, method=method, le=le)} {cumulative}')
+                lines.append(f'{name}_sum{cls._labels(view=view, method=method)} {total}')
+                lines.append(f'{name}_count{cls._labels(view=view, method=method)} {count}')
+
+        name = cls.PREFIX + 'session_saves_total'
+        lines += [f'# HELP {name} Session saves, written or skipped as unchanged', f'# TYPE {name} counter']
+        for outcome in ('written', 'avoided'):
+            lines.append(f'{name}{cls._labels(outcome=outcome)} {SessionStore.metrics[outcome]}')
+        return '\n'.join(lines) + '\n'
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._histograms = {}
+
+
+class TimedTemplates(DjangoTemplates):
+    """
+    The Django template engine, with render time charged to the current
+    request's ``RequestTimer``
+    """
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+
+class TimedTemplate:
+
+    def __init__(self, template: DjangoTemplate):
+        self._wrapped = template
+
+    def __getattr__(self, name):
+        return getattr(self._wrapped, name)
+
+    def render(self, context=None, request=None):
+        timer = current.get()
+        if timer is None:
+            return self._wrapped.render(context, request)
+        # Only the outermost render counts; nested render_to_string calls are inside it
+        timer._template_depth += 1
+        start = clock.perf_counter()
+        try:
+            return self._wrapped.render(context, request)
+        finally:
+            timer._template_depth -= 1
+            if not timer._template_depth:
+                timer.template_seconds += clock.perf_counter() - start
+
+
+class RequestMetricsMiddleware:
+    """
+    Times every request and records it under its URL name. Goes first in
+    ``MIDDLEWARE`` so the session save and the other middleware are
+    included. With ``SERVER_TIMING`` on (the default only under ``DEBUG``),
+    the breakdown is also sent to the browser as a ``Server-Timing`` header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    @staticmethod
+    def view_name(request) -> str:
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return '<unresolved>'
+        return match.view_name or match._func_path
+
+    @staticmethod
+    def response_size(response) -> int:
+        if response.streaming:
+            return int(response.get('Content-Length') or 0)
+        return len(response.content)
+
+    def __call__(self, request):
+        timer = RequestTimer()
+        token = current.set(timer)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timer))
+                response = self.get_response(request)
+        finally:
+            current.reset(token)
+
+        elapsed = timer.elapsed
+        RequestMetrics.observe(self.view_name(request), request.method, {
+            'request_duration_seconds': elapsed,
+            'request_db_seconds': timer.db_seconds,
+            'request_db_queries': timer.queries,
+            'request_template_seconds': timer.template_seconds,
+            'response_size_bytes': self.response_size(response),
+        })
+        if getattr(settings, 'SERVER_TIMING', False):
+            response['Server-Timing'] = (
+                f'db;dur={timer.db_seconds * 1000:.1f};desc="{timer.queries} queries", '
+                f'tpl;dur={timer.template_seconds * 1000:.1f}, '
+                f'app;dur={elapsed * 1000:.1f}'
+            )
+        return response
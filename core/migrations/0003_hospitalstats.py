@@ -0,0 +1,48 @@
+# Generated by Django 4.2 on 2026-10-18 17:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0002_bed_emergencycase_emergencyteam_hospitalpolicy_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HospitalStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("total_patients", models.IntegerField(default=0)),
+                ("total_doctors", models.IntegerField(default=0)),
+                ("total_employees", models.IntegerField(default=0)),
+                ("total_appointments", models.IntegerField(default=0)),
+                ("appointments_scheduled", models.IntegerField(default=0)),
+                ("appointments_completed", models.IntegerField(default=0)),
+                ("appointments_cancelled", models.IntegerField(default=0)),
+                ("appointments_no_show", models.IntegerField(default=0)),
+                ("total_bills", models.IntegerField(default=0)),
+                (
+                    "paid_revenue",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                (
+                    "pending_revenue",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name_plural": "hospital stats",
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2 on 2026-10-18 17:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0003_hospitalstats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DoctorAvailability",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("next_free_datetime", models.DateTimeField(blank=True, null=True)),
+                ("free_slots_today", models.IntegerField(default=0)),
+                ("as_of_date", models.DateField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "doctor",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="availability",
+                        to="core.doctor",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "doctor availability",
+            },
+        ),
+    ]
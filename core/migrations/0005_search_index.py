@@ -0,0 +1,48 @@
+from django.db import migrations
+
+OPTIONS = "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'"
+
+CREATE = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS core_patient_fts USING fts5(name, phone, allergies, {OPTIONS})",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS core_medicalrecord_fts USING fts5(diagnosis, prescription, notes, {OPTIONS})",
+    "INSERT INTO core_patient_fts (rowid, name, phone, allergies) "
+    "SELECT p.id, u.first_name || ' ' || u.last_name || ' ' || u.username, "
+    "COALESCE(p.phone, ''), COALESCE(p.allergies, '') "
+    "FROM core_patient p JOIN auth_user u ON u.id = p.user_id",
+    "INSERT INTO core_medicalrecord_fts (rowid, diagnosis, prescription, notes) "
+    "SELECT id, diagnosis, prescription, notes FROM core_medicalrecord",
+]
+
+DROP = [
+    "DROP TABLE IF EXISTS core_patient_fts",
+    "DROP TABLE IF EXISTS core_medicalrecord_fts",
+]
+
+
+def has_fts5(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        return any(option == "ENABLE_FTS5" for option, in cursor.fetchall())
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        # FTS5 is SQLite-only, and optional in SQLite builds; without it there
+        # is simply no search index (SearchIndex.enabled() is False)
+        if schema_editor.connection.vendor != "sqlite" or not has_fts5(schema_editor.connection):
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0004_doctoravailability"),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE), run(DROP)),
+    ]
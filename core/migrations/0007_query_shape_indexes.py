@@ -0,0 +1,80 @@
+# Generated by Django 4.2 on 2026-10-18 18:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0006_attachments"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="medicalrecord",
+            name="core_medica_patient_07c587_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="medicalrecord",
+            name="core_medica_doctor__081581_idx",
+        ),
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                fields=["patient", "appointment_date", "status"],
+                name="core_appoin_patient_9bf7a2_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                fields=["doctor", "appointment_date", "status", "patient"],
+                name="core_appoin_doctor__67d923_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                fields=["appointment_date", "status", "patient"],
+                name="core_appoin_appoint_3d11de_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="bill",
+            index=models.Index(
+                fields=["patient", "payment_status"],
+                name="core_bill_patient_ce710a_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="bill",
+            index=models.Index(
+                fields=["patient", "-created_at"], name="core_bill_patient_f400df_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="bill",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="core_bill_created_7dc290_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="bill",
+            index=models.Index(
+                fields=["payment_status", "paid", "amount"],
+                name="core_bill_payment_a09b7b_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="medicalrecord",
+            index=models.Index(
+                fields=["patient", "-created_at"], name="core_medica_patient_baff0c_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="medicalrecord",
+            index=models.Index(
+                fields=["doctor", "-created_at"], name="core_medica_doctor__6d92de_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2 on 2026-10-18 18:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0007_query_shape_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name="appointment",
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name="appointment",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(
+                    ("status__in", ["CANCELLED", "NO_SHOW"]), _negated=True
+                ),
+                fields=("doctor", "appointment_date", "appointment_time"),
+                name="appointment_unique_active_start",
+            ),
+        ),
+    ]
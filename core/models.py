@@ -124,22 +124,12 @@ class Doctor(BaseModel):
         return f"Dr. {self.user.first_name} {self.user.last_name}"
 
     def get_available_slots(self, date):
-        from datetime import timedelta
-        slots = []
-        start_time = timezone.datetime.strptime('09:00', '%H:%M').time()
-        end_time = timezone.datetime.strptime('17:00', '%H:%M').time()
-        current_time = start_time
-
-        while current_time < end_time:
-            if not self.appointments.filter(
-                appointment_date=date,
-                appointment_time=current_time,
-                status__in=['PENDING', 'CONFIRMED']
-            ).exists():
-                slots.append(current_time)
-            current_time = (timezone.datetime.combine(timezone.now().date(), current_time) + 
-                          timedelta(minutes=30)).time()
-        return slots
+        from .scheduling import SlotEngine
+        date = SlotEngine.as_date(date)
+        return SlotEngine.free_slots(self, date)[date]
+
+RELEASED_APPOINTMENT_STATUSES = ['CANCELLED', 'NO_SHOW']
+
 
 class Appointment(BaseModel):
     STATUS_CHOICES = [
@@ -149,6 +139,9 @@ class Appointment(BaseModel):
         ('NO_SHOW', 'No Show')
     ]
 
+    # Statuses that no longer hold their time slot
+    RELEASED_STATUSES = RELEASED_APPOINTMENT_STATUSES
+
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='appointments')
     doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='appointments')
     appointment_date = models.DateField()
@@ -165,32 +158,40 @@ class Appointment(BaseModel):
 
     class Meta:
         ordering = ['-appointment_date', '-appointment_time']
-        unique_together = ['doctor', 'appointment_date', 'appointment_time']
+        constraints = [
+            # A released appointment gives its start back for rebooking
+            models.UniqueConstraint(
+                fields=['doctor', 'appointment_date', 'appointment_time'],
+                condition=~models.Q(status__in=RELEASED_APPOINTMENT_STATUSES),
+                name='appointment_unique_active_start'
+            ),
+        ]
         indexes = [
             models.Index(fields=['appointment_date', 'appointment_time']),
             models.Index(fields=['status']),
+            # Covering indexes for the DashboardStats aggregates
+            models.Index(fields=['patient', 'appointment_date', 'status']),
+            models.Index(fields=['doctor', 'appointment_date', 'status', 'patient']),
+            models.Index(fields=['appointment_date', 'status', 'patient']),
         ]
 
     def __str__(self):
         return f"{self.patient} - {self.doctor} - {self.appointment_date}"
 
     def clean(self):
+        self.clean_schedule()
+
+        # Check for overlapping appointments, taking duration into account
+        from .scheduling import ConflictChecker
+        if ConflictChecker.conflicts_for(self):
+            raise ValidationError(_('This time slot is already booked'))
+
+    def clean_schedule(self):
         if self.appointment_date < timezone.now().date():
             raise ValidationError(_('Cannot create appointment in the past'))
         
         if not self.doctor.is_available:
             raise ValidationError(_('Doctor is not available for appointments'))
-        
-        # Check for overlapping appointments
-        overlapping = Appointment.objects.filter(
-            doctor=self.doctor,
-            appointment_date=self.appointment_date,
-            appointment_time=self.appointment_time,
-            status__in=['PENDING', 'CONFIRMED']
-        ).exclude(pk=self.pk)
-        
-        if overlapping.exists():
-            raise ValidationError(_('This time slot is already booked'))
 
     def is_past(self):
         return self.appointment_date < timezone.now().date()
@@ -212,13 +213,25 @@ class MedicalRecord(BaseModel):
     class Meta:
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['patient']),
-            models.Index(fields=['doctor']),
+            models.Index(fields=['patient', '-created_at']),
+            models.Index(fields=['doctor', '-created_at']),
         ]
 
     def __str__(self):
         return f"{self.patient} - {self.created_at.date()}"
 
+    def visible_to(self, user) -> bool:
+        """
+        Confidential records are only visible to admins, the record's doctor
+        and its patient, whatever other roles would otherwise allow
+        """
+        if not self.is_confidential:
+            return True
+        from .roles import RoleResolver
+        if RoleResolver.has(user, 'adminprofile'):
+            return True
+        return user.pk in (self.doctor.user_id, self.patient.user_id)
+
     def clean(self):
         if self.follow_up_date and self.follow_up_date < timezone.now().date():
             raise ValidationError(_('Follow-up date cannot be in the past'))
@@ -253,6 +266,14 @@ class Bill(BaseModel):
     insurance_provider = models.CharField(max_length=100, blank=True, null=True)
     insurance_policy_number = models.CharField(max_length=50, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'payment_status']),
+            models.Index(fields=['patient', '-created_at']),
+            models.Index(fields=['-created_at', '-id']),
+            models.Index(fields=['payment_status', 'paid', 'amount']),
+        ]
+
     def __str__(self):
         return f"{self.patient} - ${self.amount}"
 
@@ -471,3 +492,240 @@ class Notification(BaseModel):
 
     def __str__(self):
         return f"{self.title} - {self.user}"
+
+class HospitalStats(models.Model):
+    """
+    Single-row rollup of hospital-wide totals, kept current by the signal
+    handlers in ``core.signals`` and rebuilt by ``rebuild_hospital_stats``.
+    Appointment status and bill status/amount changes must go through
+    ``save()``/``delete()``: ``QuerySet.update()`` and bulk writes bypass the
+    signals and have to apply their own deltas, as ``BulkBookingService`` does
+    """
+    SINGLETON_ID = 1
+
+    APPOINTMENT_STATUS_FIELDS = {
+        'SCHEDULED': 'appointments_scheduled',
+        'COMPLETED': 'appointments_completed',
+        'CANCELLED': 'appointments_cancelled',
+        'NO_SHOW': 'appointments_no_show',
+    }
+
+    COUNTER_FIELDS = [
+        'total_patients', 'total_doctors', 'total_employees',
+        'total_appointments', 'appointments_scheduled', 'appointments_completed',
+        'appointments_cancelled', 'appointments_no_show',
+        'total_bills', 'paid_revenue', 'pending_revenue',
+    ]
+
+    total_patients = models.IntegerField(default=0)
+    total_doctors = models.IntegerField(default=0)
+    total_employees = models.IntegerField(default=0)
+    total_appointments = models.IntegerField(default=0)
+    appointments_scheduled = models.IntegerField(default=0)
+    appointments_completed = models.IntegerField(default=0)
+    appointments_cancelled = models.IntegerField(default=0)
+    appointments_no_show = models.IntegerField(default=0)
+    total_bills = models.IntegerField(default=0)
+    paid_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    pending_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'hospital stats'
+
+    def __str__(self):
+        return f"Hospital stats ({self.updated_at})"
+
+    @classmethod
+    def get(cls):
+        stats = cls.objects.filter(pk=cls.SINGLETON_ID).first()
+        return stats if stats is not None else cls.rebuild()
+
+    @classmethod
+    def compute(cls):
+        """
+        Recount every counter from the source tables
+        """
+        from django.db.models import Count, Q, Sum
+
+        appointments = Appointment.objects.aggregate(
+            total=Count('id'),
+            **{
+                field: Count('id', filter=Q(status=status))
+                for status, field in cls.APPOINTMENT_STATUS_FIELDS.items()
+            }
+        )
+        bills = Bill.objects.aggregate(
+            total=Count('id'),
+            paid=Sum('amount', filter=Q(payment_status='PAID')),
+            pending=Sum('amount', filter=Q(payment_status='PENDING'))
+        )
+        counters = {
+            'total_patients': Patient.objects.count(),
+            'total_doctors': Doctor.objects.count(),
+            'total_employees': Employee.objects.count(),
+            'total_appointments': appointments.pop('total'),
+            'total_bills': bills['total'],
+            'paid_revenue': bills['paid'] or 0,
+            'pending_revenue': bills['pending'] or 0,
+        }
+        counters.update(appointments)
+        return counters
+
+    @classmethod
+    def rebuild(cls):
+        stats, _ = cls.objects.update_or_create(pk=cls.SINGLETON_ID, defaults=cls.compute())
+        return stats
+
+    def drift(self):
+        """
+        Return ``{field: (stored, actual)}`` for every counter that no longer
+        matches the source tables
+        """
+        actual = self.compute()
+        return {
+            field: (getattr(self, field), actual[field])
+            for field in self.COUNTER_FIELDS
+            if getattr(self, field) != actual[field]
+        }
+
+    @classmethod
+    def apply_deltas(cls, **deltas):
+        """
+        Shift counters in place with a single UPDATE; the row is rebuilt
+        from scratch if it does not exist yet
+        """
+        from django.db.models import F
+
+        deltas = {field: delta for field, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        updated = cls.objects.filter(pk=cls.SINGLETON_ID).update(
+            updated_at=timezone.now(),
+            **{field: F(field) + delta for field, delta in deltas.items()}
+        )
+        if not updated:
+            cls.rebuild()
+
+class DoctorAvailability(models.Model):
+    """
+    Per-doctor availability summary shown on the directory pages. Refreshed
+    by ``core.signals`` whenever one of the doctor's appointments changes,
+    and lazily once it goes stale (new day, or the next free slot passed)
+    """
+    HORIZON_DAYS = 30
+
+    doctor = models.OneToOneField(Doctor, on_delete=models.CASCADE, related_name='availability')
+    next_free_datetime = models.DateTimeField(null=True, blank=True)
+    free_slots_today = models.IntegerField(default=0)
+    as_of_date = models.DateField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'doctor availability'
+
+    def __str__(self):
+        return f"{self.doctor} - next free {self.next_free_datetime}"
+
+    def is_stale(self, now=None):
+        now = now or timezone.now()
+        if self.as_of_date != timezone.localdate(now):
+            return True
+        return self.next_free_datetime is not None and self.next_free_datetime <= now
+
+    @classmethod
+    def refresh(cls, doctor):
+        """
+        Recompute the summary for one doctor from a single appointments scan
+        """
+        from datetime import timedelta
+        from .scheduling import SlotEngine
+
+        now = SlotEngine.local_now()
+        today = now.date()
+        next_free = None
+        free_today = 0
+        if doctor.is_available:
+            days = SlotEngine.date_range(today, today + timedelta(days=cls.HORIZON_DAYS - 1))
+            occupied = SlotEngine.occupancy([doctor.pk], days[0], days[-1])
+            for moment, _doctor_id, day, _slot in SlotEngine.openings(doctor, days, occupied, now):
+                if next_free is None:
+                    next_free = timezone.make_aware(moment)
+                if day != today:
+                    break
+                free_today += 1
+
+        availability, _created = cls.objects.update_or_create(
+            doctor=doctor,
+            defaults={
+                'next_free_datetime': next_free,
+                'free_slots_today': free_today,
+                'as_of_date': today,
+            }
+        )
+        return availability
+
+    @classmethod
+    def attach(cls, doctors):
+        """
+        Make ``doctor.availability`` current for every doctor in ``doctors``,
+        which should be fetched with ``select_related('availability')``;
+        only missing or stale rows are recomputed
+        """
+        doctors = list(doctors)
+        now = timezone.now()
+        for doctor in doctors:
+            try:
+                availability = doctor.availability
+            except cls.DoesNotExist:
+                availability = None
+            if availability is None or availability.is_stale(now):
+                doctor.availability = cls.refresh(doctor)
+        return doctors
+
+class StoredFile(models.Model):
+    """
+    One blob in the content-addressed store, keyed by its SHA-256.
+    ``ref_count`` is the number of ``Attachment`` rows pointing at it
+    (maintained by ``core.signals``) plus the paths handed out by
+    ``FileHandler.save_file``; the file is unlinked when it drops to zero
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    path = models.CharField(max_length=255, db_index=True)
+    size = models.BigIntegerField()
+    content_type = models.CharField(max_length=100)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.ref_count} refs)"
+
+class Attachment(BaseModel):
+    blob = models.ForeignKey(StoredFile, on_delete=models.PROTECT, related_name='attachments')
+    file_name = models.CharField(max_length=255)
+    uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    patient = models.ForeignKey(
+        Patient, on_delete=models.CASCADE, null=True, blank=True, related_name='attachments'
+    )
+    medical_record = models.ForeignKey(
+        MedicalRecord, on_delete=models.CASCADE, null=True, blank=True, related_name='attachments'
+    )
+    lab_test = models.ForeignKey(
+        LabTest, on_delete=models.CASCADE, null=True, blank=True, related_name='attachments'
+    )
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.CheckConstraint(
+                check=(
+                    models.Q(patient__isnull=False)
+                    | models.Q(medical_record__isnull=False)
+                    | models.Q(lab_test__isnull=False)
+                ),
+                name='attachment_has_owner',
+            ),
+        ]
+
+    def __str__(self):
+        return self.file_name
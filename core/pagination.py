@@ -0,0 +1,161 @@
+import base64
+import binascii
+import json
+from datetime import date, time
+from decimal import Decimal
+from typing import Any, List, Optional
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Model, Q
+from django.http import QueryDict
+
+class KeysetPage:
+    """
+    One page of a ``KeysetPaginator``; iterates like a list of objects
+    """
+
+    def __init__(self, object_list: List, next_cursor: Optional[str], previous_cursor: Optional[str],
+                 params: Optional[QueryDict] = None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.params = params if params is not None else QueryDict()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    def has_other_pages(self) -> bool:
+        return self.has_next() or self.has_previous()
+
+    def _querystring(self, key: str, cursor: str) -> str:
+        params = self.params.copy()
+        params.pop(KeysetPaginator.AFTER, None)
+        params.pop(KeysetPaginator.BEFORE, None)
+        params[key] = cursor
+        return params.urlencode()
+
+    @property
+    def next_querystring(self) -> str:
+        return self._querystring(KeysetPaginator.AFTER, self.next_cursor) if self.has_next() else ''
+
+    @property
+    def previous_querystring(self) -> str:
+        return self._querystring(KeysetPaginator.BEFORE, self.previous_cursor) if self.has_previous() else ''
+
+
+class KeysetPaginator:
+    """
+    Seek pagination over a queryset's ordering.
+
+    The sort key is the queryset's ``order_by()``, else the model's
+    ``Meta.ordering``, with the primary key appended as a tie-breaker so the
+    key is unique. A cursor is the encoded sort key of the last (or first)
+    row shown, and the next page is ``WHERE key > cursor ORDER BY key LIMIT
+    n + 1``: one query whatever the depth, with no ``COUNT(*)`` and no
+    ``OFFSET``. Cursors stay valid when rows are added or removed.
+    Ordering fields are assumed to be non-null.
+    """
+    AFTER = 'after'
+    BEFORE = 'before'
+    DEFAULT_PER_PAGE = 25
+
+    def __init__(self, queryset, per_page: int = DEFAULT_PER_PAGE, ordering: Optional[List[str]] = None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.model = queryset.model
+        ordering = list(ordering or queryset.query.order_by or self.model._meta.ordering or [])
+        if not any(name.lstrip('-') in ('pk', self.model._meta.pk.name) for name in ordering):
+            descending = bool(ordering) and ordering[-1].startswith('-')
+            ordering.append('-pk' if descending else 'pk')
+        self.keys = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+    def _field(self, path: str):
+        model, field = self.model, None
+        for part in path.split('__'):
+            field = model._meta.pk if part == 'pk' else model._meta.get_field(part)
+            if field.is_relation:
+                model = field.related_model
+        return field.target_field if field.is_relation else field
+
+    @staticmethod
+    def _value(obj, path: str) -> Any:
+        for part in path.split('__'):
+            obj = getattr(obj, part)
+        return obj.pk if isinstance(obj, Model) else obj
+
+    @staticmethod
+    def _serialize(value: Any) -> Any:
+        if isinstance(value, (date, time)):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return str(value)
+        return value
+
+    def encode(self, obj) -> str:
+        values = [self._serialize(self._value(obj, path)) for path, _ in self.keys]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+    def decode(self, cursor: str) -> List[Any]:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(self.keys):
+            raise ValueError('Cursor does not match this ordering')
+        return [self._field(path).to_python(value) for (path, _), value in zip(self.keys, values)]
+
+    def _seek(self, values: List[Any], forward: bool) -> Q:
+        """
+        Rows strictly past ``values`` in key order:
+        ``(a > x) OR (a = x AND b > y) OR ...`` with per-column direction
+        """
+        condition = Q()
+        for i, ((path, descending), value) in enumerate(zip(self.keys, values)):
+            lookup = 'gt' if descending != forward else 'lt'
+            clause = Q(**{f'{path}__{lookup}': value})
+            for (prior, _), prior_value in zip(self.keys[:i], values[:i]):
+                clause &= Q(**{prior: prior_value})
+            condition |= clause
+        return condition
+
+    def _order(self, forward: bool) -> List[str]:
+        return [f'{"-" if descending == forward else ""}{path}' for path, descending in self.keys]
+
+    def page(self, after: Optional[str] = None, before: Optional[str] = None,
+             params: Optional[QueryDict] = None) -> KeysetPage:
+        forward = not before
+        cursor = after if forward else before
+        queryset = self.queryset
+        if cursor:
+            queryset = queryset.filter(self._seek(self.decode(cursor), forward))
+        rows = list(queryset.order_by(*self._order(forward))[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if forward:
+            next_cursor = self.encode(rows[-1]) if more else None
+            previous_cursor = self.encode(rows[0]) if cursor and rows else None
+        else:
+            rows.reverse()
+            next_cursor = self.encode(rows[-1]) if rows else None
+            previous_cursor = self.encode(rows[0]) if more else None
+        return KeysetPage(rows, next_cursor, previous_cursor, params)
+
+    def get_page(self, params: QueryDict) -> KeysetPage:
+        """
+        Page for the ``after``/``before`` cursor in ``params`` (usually
+        ``request.GET``); a malformed cursor falls back to the first page
+        """
+        try:
+            return self.page(params.get(self.AFTER), params.get(self.BEFORE), params)
+        except (ValueError, TypeError, binascii.Error, FieldDoesNotExist, ValidationError):
+            return self.page(params=params)
@@ -0,0 +1,167 @@
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+# Longest edge, in pixels, of each derivative
+VARIANTS: Dict[str, Tuple[int, int]] = {
+    'thumb': (256, 256),
+    'preview': (1024, 1024),
+}
+JPEG_QUALITY = 82
+PDF_RENDER_TIMEOUT = 30
+
+
+def derivative_path(path: str, variant: str) -> str:
+    """
+    ``attachments/ab/<sha256>.pdf`` -> ``attachments/ab/<sha256>.thumb.jpg``
+    """
+    return f"{os.path.splitext(path)[0]}.{variant}.jpg"
+
+
+def _save_atomically(image, target: str):
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.part')
+    os.close(fd)
+    try:
+        image.save(temp, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+        os.replace(temp, target)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+def _open_image(source: str, content_type: str, workdir: str):
+    from PIL import Image
+
+    if content_type == 'application/pdf':
+        renderer = shutil.which('pdftoppm')
+        if renderer is None:
+            return None
+        largest = max(max(size) for size in VARIANTS.values())
+        prefix = os.path.join(workdir, 'page')
+        subprocess.run(
+            [renderer, '-f', '1', '-l', '1', '-singlefile', '-png', '-scale-to', str(largest), source, prefix],
+            check=True, timeout=PDF_RENDER_TIMEOUT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        source = prefix + '.png'
+
+    image = Image.open(source)
+    # Let the JPEG decoder downscale while decoding instead of after
+    image.draft('RGB', max(VARIANTS.values()))
+    if image.mode not in ('RGB', 'L'):
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image.convert('RGBA'), mask=image.convert('RGBA').getchannel('A'))
+        image = background
+    return image
+
+
+def render_derivatives(source: str, content_type: str) -> List[str]:
+    """
+    Write every missing variant of ``source`` (an absolute path) next to it
+    and return the paths written. Runs inside the worker process, so it
+    only touches the filesystem
+    """
+    targets = {variant: derivative_path(source, variant) for variant in VARIANTS}
+    missing = {variant: target for variant, target in targets.items() if not os.path.exists(target)}
+    if not missing:
+        return []
+
+    with tempfile.TemporaryDirectory() as workdir:
+        image = _open_image(source, content_type, workdir)
+        if image is None:
+            return []
+        written = []
+        # Largest first, so each smaller variant is resampled from the one before it
+        for variant in sorted(missing, key=lambda name: VARIANTS[name], reverse=True):
+            image.thumbnail(VARIANTS[variant])
+            _save_atomically(image, missing[variant])
+            written.append(missing[variant])
+        return written
+
+
+class PreviewPool:
+    """
+    Generates bounded-size thumbnails and first-page previews for stored
+    uploads off the request path.
+
+    Jobs go to a per-process executor chosen by ``PREVIEW_EXECUTOR``:
+    ``'process'`` (default, image decoding holds the GIL), ``'thread'`` or
+    ``'sync'`` (inline, for tests and management commands). Derivatives are
+    JPEGs written next to the original as ``<sha256>.<variant>.jpg``, so
+    identical uploads share them and they are removed with the blob. PDFs
+    need ``pdftoppm`` (poppler-utils) on ``PATH``; without it they simply
+    get no preview.
+    """
+    CONTENT_TYPES = ('image/jpeg', 'image/png', 'application/pdf')
+
+    _lock = threading.Lock()
+    _executor = None
+    _pid = None
+
+    @staticmethod
+    def mode() -> str:
+        return getattr(settings, 'PREVIEW_EXECUTOR', 'process')
+
+    @classmethod
+    def executor(cls):
+        with cls._lock:
+            # A pool inherited across fork() has no live workers
+            if cls._executor is None or cls._pid != os.getpid():
+                workers = getattr(settings, 'PREVIEW_WORKERS', 2)
+                pool_class = ThreadPoolExecutor if cls.mode() == 'thread' else ProcessPoolExecutor
+                cls._executor = pool_class(max_workers=workers)
+                cls._pid = os.getpid()
+            return cls._executor
+
+    @staticmethod
+    def _log_result(path: str, future: Future):
+        error = future.exception()
+        if error is not None:
+            logger.warning(f"Preview generation failed for {path}: {error}")
+        elif future.result():
+            logger.info(f"Previews written for {path}: {len(future.result())}")
+
+    @classmethod
+    def submit(cls, path: str, content_type: str) -> Optional[Future]:
+        """
+        Queue derivative generation for the stored file at ``path``
+        """
+        if content_type not in cls.CONTENT_TYPES:
+            return None
+        source = default_storage.path(path)
+        if cls.mode() == 'sync':
+            future = Future()
+            try:
+                future.set_result(render_derivatives(source, content_type))
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            future = cls.executor().submit(render_derivatives, source, content_type)
+        future.add_done_callback(lambda done: cls._log_result(path, done))
+        return future
+
+    @staticmethod
+    def available(path: str, variant: str) -> bool:
+        return variant in VARIANTS and default_storage.exists(derivative_path(path, variant))
+
+    @staticmethod
+    def remove(path: str):
+        for variant in VARIANTS:
+            target = derivative_path(path, variant)
+            if default_storage.exists(target):
+                default_storage.delete(target)
+
+    @classmethod
+    def shutdown(cls):
+        with cls._lock:
+            if cls._executor is not None:
+                cls._executor.shutdown(wait=True)
+            cls._executor = cls._pid = None
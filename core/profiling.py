@@ -0,0 +1,146 @@
+import cProfile
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time as clock
+from collections import Counter
+from typing import Optional
+from django.conf import settings
+from .roles import RoleResolver
+
+logger = logging.getLogger(__name__)
+
+
+class StackSampler:
+    """
+    Wall-clock sampler for one thread. Every ``interval`` seconds a
+    background thread records the target thread's current stack; the
+    result is written in the collapsed format flamegraph tools read
+    (``outer;inner;leaf count`` per line).
+    """
+
+    def __init__(self, interval: float = 0.005, thread_id: Optional[int] = None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.counts = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    @staticmethod
+    def frame_label(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(self.frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def dump(self, path: str):
+        with open(path, 'w') as out:
+            for stack, count in self.counts.most_common():
+                out.write(f"{stack} {count}\n")
+
+
+class ViewProfiler:
+    """
+    Opt-in request profiling. Nothing happens unless ``PROFILING_ENABLED``
+    is set; then a request is profiled when an admin sends
+    ``X-Profile: 1`` (or ``?profile=1``), or at random for one request in
+    ``PROFILING_SAMPLE_RATE``. The flag value may name the mode,
+    ``cprofile`` (deterministic, pstats output) or ``sample`` (stack
+    sampler, collapsed-stack output); otherwise ``PROFILING_MODE`` applies.
+    Output goes to ``PROFILING_DIR/<url name>/``; ``profile_report``
+    aggregates it.
+    """
+    MODES = ('cprofile', 'sample')
+    EXTENSIONS = {'cprofile': '.prof', 'sample': '.folded'}
+    HEADER = 'HTTP_X_PROFILE'
+    QUERY_FLAG = 'profile'
+
+    @staticmethod
+    def enabled() -> bool:
+        return getattr(settings, 'PROFILING_ENABLED', False)
+
+    @staticmethod
+    def directory() -> str:
+        return getattr(settings, 'PROFILING_DIR', os.path.join(settings.BASE_DIR, 'profiles'))
+
+    @classmethod
+    def requested_mode(cls, request) -> Optional[str]:
+        """
+        The mode to profile this request with, or ``None``
+        """
+        default = getattr(settings, 'PROFILING_MODE', 'cprofile')
+        flag = request.META.get(cls.HEADER) or request.GET.get(cls.QUERY_FLAG)
+        if flag and RoleResolver.has(request.user, 'adminprofile'):
+            return flag if flag in cls.MODES else default
+        rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+        if rate and random.randrange(rate) == 0:
+            return default
+        return None
+
+    @staticmethod
+    def view_name(request) -> str:
+        match = getattr(request, 'resolver_match', None)
+        name = match.view_name if match is not None else 'unresolved'
+        return re.sub(r'[^\w.-]', '_', name)
+
+    @classmethod
+    def output_path(cls, view: str, mode: str) -> str:
+        directory = os.path.join(cls.directory(), view)
+        os.makedirs(directory, exist_ok=True)
+        stamp = f"{clock.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{threading.get_ident()}"
+        return os.path.join(directory, stamp + cls.EXTENSIONS[mode])
+
+    @classmethod
+    def run(cls, mode: str, request, get_response):
+        if mode == 'sample':
+            profiler = StackSampler(getattr(settings, 'PROFILING_INTERVAL', 0.005))
+            profiler.start()
+            try:
+                response = get_response(request)
+            finally:
+                profiler.stop()
+            path = cls.output_path(cls.view_name(request), mode)
+            profiler.dump(path)
+        else:
+            profiler = cProfile.Profile()
+            response = profiler.runcall(get_response, request)
+            path = cls.output_path(cls.view_name(request), mode)
+            profiler.dump_stats(path)
+        logger.info(f"Profiled {request.path} ({mode}) -> {path}")
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Goes last in ``MIDDLEWARE`` so the profile covers the view and
+    template rendering but not the middleware stack
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not ViewProfiler.enabled():
+            return self.get_response(request)
+        mode = ViewProfiler.requested_mode(request)
+        if mode is None:
+            return self.get_response(request)
+        return ViewProfiler.run(mode, request, self.get_response)
@@ -0,0 +1,84 @@
+import hashlib
+import math
+import time
+from typing import Optional, Tuple
+from django.conf import settings
+from django.core.cache import caches
+
+class RateLimiter:
+    """
+    Sliding-window rate limiter backed by a Django cache.
+
+    The store is whichever cache ``settings.RATE_LIMIT_CACHE`` names, so
+    switching between a per-process local-memory cache, a file-based cache
+    shared by all workers, or a database table (``DatabaseCache``) is a
+    settings change. Each window is a counter under its own key; the
+    previous window's count is weighted by how much of it still overlaps
+    the sliding window. A check costs one ``get_many`` and, when allowed,
+    one ``incr`` — no session or model writes.
+    """
+    KEY_PREFIX = 'rl'
+
+    @staticmethod
+    def cache():
+        return caches[getattr(settings, 'RATE_LIMIT_CACHE', 'default')]
+
+    @staticmethod
+    def client_ip(request) -> str:
+        if getattr(settings, 'RATE_LIMIT_TRUST_FORWARDED_FOR', False):
+            forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+            if forwarded:
+                return forwarded.split(',')[0].strip()
+        return request.META.get('REMOTE_ADDR', '')
+
+    @classmethod
+    def identity(cls, request) -> str:
+        """
+        Client IP plus username: the logged-in user, or the username being
+        submitted to login/registration forms
+        """
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            username = user.get_username()
+        else:
+            username = request.POST.get('username', '') if request.method == 'POST' else ''
+        return f"{cls.client_ip(request)}|{username.strip().lower()}"
+
+    @classmethod
+    def _key(cls, scope: str, identity: str, window: int) -> str:
+        digest = hashlib.sha256(f"{scope}|{identity}".encode()).hexdigest()[:32]
+        return f"{cls.KEY_PREFIX}:{digest}:{window}"
+
+    @classmethod
+    def hit(cls, scope: str, identity: str, limit: int, period: int,
+            now: Optional[float] = None) -> Tuple[bool, int]:
+        """
+        Record one request; return ``(allowed, retry_after_seconds)``
+        """
+        now = time.time() if now is None else now
+        window = int(now // period)
+        elapsed = (now % period) / period
+        current_key = cls._key(scope, identity, window)
+        previous_key = cls._key(scope, identity, window - 1)
+
+        cache = cls.cache()
+        counts = cache.get_many([current_key, previous_key])
+        current = counts.get(current_key, 0)
+        previous = counts.get(previous_key, 0)
+
+        if previous * (1 - elapsed) + current + 1 > limit:
+            if current >= limit:
+                retry_after = period - (now % period)
+            else:
+                # Wait until enough of the previous window has slid out
+                needed = (previous - (limit - 1 - current)) / previous if previous else 1
+                retry_after = max((needed - elapsed) * period, 1)
+            return False, math.ceil(retry_after)
+
+        # Keep each counter for two periods so it can serve as "previous"
+        if not cache.add(current_key, 1, timeout=2 * period):
+            try:
+                cache.incr(current_key)
+            except ValueError:
+                cache.set(current_key, 1, timeout=2 * period)
+        return True, 0
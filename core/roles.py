@@ -0,0 +1,70 @@
+from typing import Optional
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+
+class RoleResolver:
+    """
+    Resolve which profile (patient, doctor, employee, admin) a user has.
+
+    The reverse one-to-one relations are loaded together with one LEFT JOIN
+    query and stored in the user's related-object cache, after which
+    ``hasattr(user, 'doctor')`` and ``user.doctor`` no longer hit the
+    database, including for relations the user does not have.
+    """
+    RELATIONS = ('patient', 'doctor', 'employee', 'adminprofile')
+    ROLE_NAMES = {
+        'patient': 'patient',
+        'doctor': 'doctor',
+        'employee': 'employee',
+        'adminprofile': 'admin',
+    }
+
+    @staticmethod
+    def queryset():
+        return User.objects.select_related(*RoleResolver.RELATIONS)
+
+    @classmethod
+    def resolve(cls, user):
+        """
+        Load any profile relations not yet cached on ``user`` (at most one query)
+        """
+        if not getattr(user, 'is_authenticated', False) or user.pk is None:
+            return user
+
+        cached = user._state.fields_cache
+        missing = [relation for relation in cls.RELATIONS if relation not in cached]
+        if missing:
+            loaded = User.objects.select_related(*missing).get(pk=user.pk)
+            for relation in missing:
+                cached[relation] = loaded._state.fields_cache.get(relation)
+        return user
+
+    @classmethod
+    def has(cls, user, relation: str) -> bool:
+        if not getattr(user, 'is_authenticated', False):
+            return False
+        return cls.resolve(user)._state.fields_cache.get(relation) is not None
+
+    @classmethod
+    def role(cls, user) -> Optional[str]:
+        """
+        The user's primary role, in the order ``dashboard`` checks them
+        """
+        for relation in cls.RELATIONS:
+            if cls.has(user, relation):
+                return cls.ROLE_NAMES[relation]
+        return None
+
+
+class RoleBackend(ModelBackend):
+    """
+    ``ModelBackend`` that loads the session user together with its profile,
+    so role checks on ``request.user`` cost no extra queries
+    """
+
+    def get_user(self, user_id):
+        try:
+            user = RoleResolver.queryset().get(pk=user_id)
+        except User.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,283 @@
+import heapq
+from collections import defaultdict
+from itertools import islice
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from django.core.validators import MaxValueValidator
+from django.utils import timezone
+from .models import Appointment, Doctor
+
+class SlotEngine:
+    """
+    Batched slot availability.
+
+    A doctor's working day is split into fixed slots; each (doctor, day) is
+    represented as an integer bitmap with bit ``i`` set when slot ``i``
+    overlaps a booked appointment. Bookings for any number of doctors and
+    days are loaded with a single query.
+    """
+    DAY_START = time(9, 0)
+    DAY_END = time(17, 0)
+    SLOT_MINUTES = 30
+
+    @staticmethod
+    def _minutes(value: time) -> int:
+        return value.hour * 60 + value.minute
+
+    @classmethod
+    def slot_count(cls) -> int:
+        return (cls._minutes(cls.DAY_END) - cls._minutes(cls.DAY_START)) // cls.SLOT_MINUTES
+
+    @classmethod
+    def full_mask(cls) -> int:
+        return (1 << cls.slot_count()) - 1
+
+    @classmethod
+    def slot_time(cls, index: int) -> time:
+        minutes = cls._minutes(cls.DAY_START) + index * cls.SLOT_MINUTES
+        return time(minutes // 60, minutes % 60)
+
+    @classmethod
+    def slot_times(cls) -> List[time]:
+        return [cls.slot_time(i) for i in range(cls.slot_count())]
+
+    @classmethod
+    def booking_mask(cls, start: time, duration: int) -> int:
+        """
+        Bitmap of the slots overlapped by a booking of ``duration`` minutes
+        starting at ``start``
+        """
+        begin = cls._minutes(start) - cls._minutes(cls.DAY_START)
+        end = begin + (duration or cls.SLOT_MINUTES)
+        first = max(begin // cls.SLOT_MINUTES, 0)
+        last = min(-(-end // cls.SLOT_MINUTES), cls.slot_count())
+        if last <= first:
+            return 0
+        return ((1 << (last - first)) - 1) << first
+
+    @staticmethod
+    def date_range(start_date: date, end_date: Optional[date] = None) -> List[date]:
+        end_date = end_date or start_date
+        return [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+
+    @staticmethod
+    def bookings(doctor_ids: Iterable[int], start_date: date, end_date: date):
+        """
+        Blocking appointments for the given doctors and date range (one query)
+        """
+        return Appointment.objects.filter(
+            doctor_id__in=list(doctor_ids),
+            appointment_date__range=[start_date, end_date]
+        ).exclude(
+            status__in=Appointment.RELEASED_STATUSES
+        ).values_list('doctor_id', 'appointment_date', 'appointment_time', 'duration')
+
+    @classmethod
+    def occupancy(cls, doctor_ids: Iterable[int], start_date: date,
+                  end_date: Optional[date] = None) -> Dict[Tuple[int, date], Tuple[int, int]]:
+        """
+        Map ``(doctor_id, day)`` to ``(bitmap, booking_count)`` for every
+        day that has at least one booking
+        """
+        end_date = end_date or start_date
+        occupied = defaultdict(lambda: (0, 0))
+        for doctor_id, day, start, duration in cls.bookings(doctor_ids, start_date, end_date):
+            mask, count = occupied[(doctor_id, day)]
+            occupied[(doctor_id, day)] = (mask | cls.booking_mask(start, duration), count + 1)
+        return dict(occupied)
+
+    @classmethod
+    def free_times(cls, mask: int) -> List[time]:
+        return [cls.slot_time(i) for i in range(cls.slot_count()) if not mask >> i & 1]
+
+    @classmethod
+    def free_slots_for_doctors(cls, doctor_ids: Iterable[int], start_date: date,
+                               end_date: Optional[date] = None) -> Dict[int, Dict[date, List[time]]]:
+        """
+        Free slots per doctor per day for a whole date range, from one query
+        """
+        doctor_ids = list(doctor_ids)
+        days = cls.date_range(start_date, end_date)
+        occupied = cls.occupancy(doctor_ids, days[0], days[-1])
+        return {
+            doctor_id: {
+                day: cls.free_times(occupied.get((doctor_id, day), (0, 0))[0])
+                for day in days
+            }
+            for doctor_id in doctor_ids
+        }
+
+    @classmethod
+    def free_slots(cls, doctor, start_date: date, end_date: Optional[date] = None) -> Dict[date, List[time]]:
+        return cls.free_slots_for_doctors([doctor.pk], start_date, end_date)[doctor.pk]
+
+    @classmethod
+    def openings(cls, doctor, days: List[date], occupied, now: datetime):
+        """
+        Yield ``(datetime, doctor_id, day, time)`` for a doctor's future free
+        slots in chronological order, honouring ``max_patients_per_day``
+        """
+        for day in days:
+            mask, booked = occupied.get((doctor.pk, day), (0, 0))
+            remaining = doctor.max_patients_per_day - booked
+            if remaining <= 0:
+                continue
+            for slot in cls.free_times(mask):
+                if day == now.date() and slot <= now.time():
+                    continue
+                yield datetime.combine(day, slot), doctor.pk, day, slot
+                remaining -= 1
+                if not remaining:
+                    break
+
+    @staticmethod
+    def local_now() -> datetime:
+        return timezone.localtime().replace(tzinfo=None)
+
+    @classmethod
+    def first_available(cls, specialization: str, start_date: date, end_date: date,
+                        limit: int = 10, now: Optional[datetime] = None) -> List[Dict]:
+        """
+        Earliest ``limit`` free slots across all available doctors with the
+        given specialization: one doctors query, one appointments scan and a
+        k-way heap merge of the per-doctor slot streams
+        """
+        now = now or cls.local_now()
+        start_date = max(start_date, now.date())
+        if end_date < start_date:
+            return []
+
+        doctors = {
+            doctor.pk: doctor
+            for doctor in Doctor.objects.filter(
+                specialization=specialization,
+                is_available=True
+            ).select_related('user')
+        }
+        if not doctors:
+            return []
+
+        days = cls.date_range(start_date, end_date)
+        occupied = cls.occupancy(doctors, start_date, end_date)
+        streams = [cls.openings(doctor, days, occupied, now) for doctor in doctors.values()]
+
+        return [
+            {'doctor': doctors[doctor_id], 'date': day, 'time': slot}
+            for _, doctor_id, day, slot in islice(heapq.merge(*streams), limit)
+        ]
+
+    @staticmethod
+    def as_date(value) -> date:
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, str):
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        return value
+
+
+class ConflictChecker:
+    """
+    Duration-aware overlap detection for appointments.
+
+    Single bookings are checked with one range query on
+    ``(doctor, appointment_date, appointment_time)``; batches are checked
+    in memory with a sort-and-sweep over each doctor-day, O(n log n).
+    """
+    # The longest appointment the duration field accepts bounds how far back an overlap can start
+    MAX_DURATION = next(
+        validator.limit_value for validator in Appointment._meta.get_field('duration').validators
+        if isinstance(validator, MaxValueValidator)
+    )
+
+    @staticmethod
+    def bounds(day: date, start: time, duration: int) -> Tuple[datetime, datetime]:
+        begin = datetime.combine(day, start)
+        return begin, begin + timedelta(minutes=duration or SlotEngine.SLOT_MINUTES)
+
+    @classmethod
+    def conflicts(cls, doctor_id: int, day: date, start: time, duration: int,
+                  exclude_pk: Optional[int] = None) -> List[Appointment]:
+        """
+        Blocking appointments that overlap ``[start, start + duration)``
+        """
+        begin, end = cls.bounds(day, start, duration)
+        window_start = max(begin - timedelta(minutes=cls.MAX_DURATION), datetime.combine(day, time.min))
+        candidates = Appointment.objects.filter(
+            doctor_id=doctor_id,
+            appointment_date=day,
+            appointment_time__gte=window_start.time()
+        ).exclude(status__in=Appointment.RELEASED_STATUSES)
+        if end.date() == day:
+            candidates = candidates.filter(appointment_time__lt=end.time())
+        if exclude_pk is not None:
+            candidates = candidates.exclude(pk=exclude_pk)
+
+        return [
+            appointment for appointment in candidates
+            if cls.bounds(day, appointment.appointment_time, appointment.duration)[1] > begin
+        ]
+
+    @classmethod
+    def conflicts_for(cls, appointment: Appointment) -> List[Appointment]:
+        return cls.conflicts(
+            appointment.doctor_id,
+            appointment.appointment_date,
+            appointment.appointment_time,
+            appointment.duration,
+            exclude_pk=appointment.pk
+        )
+
+    @staticmethod
+    def _sweep(intervals) -> List[Tuple]:
+        """
+        Overlapping pairs among ``(begin, end, key)`` intervals
+        """
+        pairs = []
+        active = []  # heap of (end, sequence, key)
+        ordered = sorted(intervals, key=lambda interval: interval[:2])
+        for sequence, (begin, end, key) in enumerate(ordered):
+            while active and active[0][0] <= begin:
+                heapq.heappop(active)
+            pairs.extend((other, key) for _, _, other in active)
+            heapq.heappush(active, (end, sequence, key))
+        return pairs
+
+    @classmethod
+    def find_conflicts(cls, appointments: List[Appointment]) -> Dict[int, List]:
+        """
+        Check new or moved appointments against the database and each other.
+
+        Returns ``{index: [conflict, ...]}`` where a conflict is either an
+        existing ``Appointment`` or the index of another item in the batch.
+        Released appointments never conflict. Existing bookings are loaded
+        with one query.
+        """
+        if not appointments:
+            return {}
+
+        days = [appointment.appointment_date for appointment in appointments]
+        moving = {appointment.pk for appointment in appointments if appointment.pk}
+        existing = Appointment.objects.filter(
+            doctor_id__in={appointment.doctor_id for appointment in appointments},
+            appointment_date__range=[min(days), max(days)]
+        ).exclude(pk__in=moving).exclude(status__in=Appointment.RELEASED_STATUSES).order_by()
+
+        groups = defaultdict(list)
+        for booked in existing:
+            groups[(booked.doctor_id, booked.appointment_date)].append(
+                cls.bounds(booked.appointment_date, booked.appointment_time, booked.duration) + (('db', booked),)
+            )
+
+        found = defaultdict(list)
+        for index, appointment in enumerate(appointments):
+            groups[(appointment.doctor_id, appointment.appointment_date)].append(
+                cls.bounds(appointment.appointment_date, appointment.appointment_time, appointment.duration)
+                + (('new', index),)
+            )
+
+        for intervals in groups.values():
+            for first, second in cls._sweep(intervals):
+                for this, other in ((first, second), (second, first)):
+                    if this[0] == 'new':
+                        found[this[1]].append(other[1])
+        return dict(found)
@@ -2,6 +2,7 @@ from pydantic import BaseModel, EmailStr, Field, validator
 from typing import Optional
 from datetime import date, datetime
 import re
+from django.conf import settings
 
 class UserBase(BaseModel):
     username: str = Field(..., min_length=3, max_length=50)
@@ -82,6 +83,28 @@ class AppointmentCreate(BaseModel):
             raise ValueError('Invalid time format. Use HH:MM')
         return v
 
+class AppointmentRepeat(BaseModel):
+    interval_days: int = Field(7, ge=1, le=365)
+    count: int = Field(..., ge=1, le=52)
+
+class BulkAppointmentItem(BaseModel):
+    appointment_id: Optional[int] = None  # set to reschedule an existing appointment
+    patient_id: Optional[int] = None
+    doctor_id: Optional[int] = None
+    appointment_date: date
+    appointment_time: str
+    duration: Optional[int] = Field(None, ge=15, le=120)
+    reason: Optional[str] = Field(None, max_length=500)
+    repeat: Optional[AppointmentRepeat] = None
+
+    @validator('appointment_time')
+    def validate_appointment_time(cls, v):
+        try:
+            datetime.strptime(v, '%H:%M')
+        except ValueError:
+            raise ValueError('Invalid time format. Use HH:MM')
+        return v
+
 class MedicalRecordCreate(BaseModel):
     patient_id: int
     doctor_id: int
@@ -109,7 +132,7 @@ class FileUpload(BaseModel):
 
     @validator('file_size')
     def validate_file_size(cls, v):
-        max_size = 5 * 1024 * 1024  # 5MB
+        max_size = getattr(settings, 'FILE_UPLOAD_MAX_SIZE', 50 * 1024 * 1024)
         if v > max_size:
-            raise ValueError('File size must be less than 5MB')
+            raise ValueError(f'File size must be less than {max_size // (1024 * 1024)}MB')
         return v 
\ No newline at end of file
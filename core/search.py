@@ -0,0 +1,164 @@
+import logging
+import re
+from typing import Dict, Iterable, List, Tuple
+from django.db import DatabaseError, connection
+from .models import Patient, MedicalRecord
+
+logger = logging.getLogger(__name__)
+
+class SearchIndex:
+    """
+    Ranked full-text search over patients and medical records.
+
+    Backed by two SQLite FTS5 tables whose rowids are the ``Patient`` and
+    ``MedicalRecord`` primary keys. Signals keep them current one row at a
+    time; ``rebuild()`` repopulates them from the base tables with two
+    ``INSERT ... SELECT`` statements. Queries are ranked with BM25, with
+    names and diagnoses weighted above free-text notes. On databases
+    without FTS5 (other backends, or SQLite builds without the module, where
+    migration 0005 creates no tables) every method is a no-op and searches
+    return nothing; this is probed once per database.
+    """
+    PATIENT_TABLE = 'core_patient_fts'
+    RECORD_TABLE = 'core_medicalrecord_fts'
+
+    # BM25 column weights, in column order
+    PATIENT_WEIGHTS = (10.0, 5.0, 2.0)   # name, phone, allergies
+    RECORD_WEIGHTS = (5.0, 3.0, 1.0)     # diagnosis, prescription, notes
+
+    MAX_TERMS = 8
+    MIN_PREFIX = 3
+
+    _available: Dict[Tuple[str, str], bool] = {}
+
+    @classmethod
+    def enabled(cls) -> bool:
+        if connection.vendor != 'sqlite':
+            return False
+        key = (connection.alias, str(connection.settings_dict['NAME']))
+        if key not in cls._available:
+            cls._available[key] = cls.probe()
+        return cls._available[key]
+
+    @classmethod
+    def probe(cls) -> bool:
+        """
+        Whether both FTS5 tables can be read: fails without the FTS5 module
+        or when the migration skipped creating them
+        """
+        try:
+            with connection.cursor() as cursor:
+                for table in (cls.PATIENT_TABLE, cls.RECORD_TABLE):
+                    cursor.execute(f"SELECT rowid FROM {table} LIMIT 0")
+        except DatabaseError as e:
+            logger.warning(f"Full-text search disabled: {str(e)}")
+            return False
+        return True
+
+    @staticmethod
+    def patient_name(patient: Patient) -> str:
+        user = patient.user
+        return f"{user.first_name} {user.last_name} {user.username}"
+
+    @classmethod
+    def index_patient(cls, patient: Patient):
+        if not cls.enabled():
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {cls.PATIENT_TABLE} WHERE rowid = %s", [patient.pk])
+            cursor.execute(
+                f"INSERT INTO {cls.PATIENT_TABLE} (rowid, name, phone, allergies) VALUES (%s, %s, %s, %s)",
+                [patient.pk, cls.patient_name(patient), patient.phone or '', patient.allergies or '']
+            )
+
+    @classmethod
+    def index_record(cls, record: MedicalRecord):
+        if not cls.enabled():
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {cls.RECORD_TABLE} WHERE rowid = %s", [record.pk])
+            cursor.execute(
+                f"INSERT INTO {cls.RECORD_TABLE} (rowid, diagnosis, prescription, notes) VALUES (%s, %s, %s, %s)",
+                [record.pk, record.diagnosis or '', record.prescription or '', record.notes or '']
+            )
+
+    @classmethod
+    def remove(cls, table: str, pk: int):
+        if not cls.enabled():
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {table} WHERE rowid = %s", [pk])
+
+    @classmethod
+    def rebuild(cls) -> Tuple[int, int]:
+        """
+        Repopulate both tables from scratch; returns ``(patients, records)``
+        """
+        if not cls.enabled():
+            return 0, 0
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {cls.PATIENT_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {cls.PATIENT_TABLE} (rowid, name, phone, allergies) "
+                "SELECT p.id, u.first_name || ' ' || u.last_name || ' ' || u.username, "
+                "COALESCE(p.phone, ''), COALESCE(p.allergies, '') "
+                "FROM core_patient p JOIN auth_user u ON u.id = p.user_id"
+            )
+            patients = cursor.rowcount
+            cursor.execute(f"DELETE FROM {cls.RECORD_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {cls.RECORD_TABLE} (rowid, diagnosis, prescription, notes) "
+                "SELECT id, diagnosis, prescription, notes FROM core_medicalrecord"
+            )
+            records = cursor.rowcount
+            # Merge the b-tree segments written by the bulk load
+            for table in (cls.PATIENT_TABLE, cls.RECORD_TABLE):
+                cursor.execute(f"INSERT INTO {table} ({table}) VALUES ('optimize')")
+        return patients, records
+
+    @classmethod
+    def match_expression(cls, text: str) -> str:
+        """
+        FTS5 query for free text: every word must match, the last one as a
+        prefix (once it is ``MIN_PREFIX`` characters long) so results update
+        while typing. Words are quoted, so FTS5 operators in user input are
+        treated as plain text
+        """
+        terms = re.findall(r'\w+', text or '')[:cls.MAX_TERMS]
+        if not terms:
+            return ''
+        quoted = [f'"{term}"' for term in terms]
+        if len(terms[-1]) >= cls.MIN_PREFIX:
+            quoted[-1] += '*'
+        return ' '.join(quoted)
+
+    @classmethod
+    def _ranked_ids(cls, table: str, weights: Iterable[float], text: str, limit: int) -> List[int]:
+        expression = cls.match_expression(text)
+        if not expression or not cls.enabled():
+            return []
+        weight_sql = ', '.join(str(weight) for weight in weights)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {table} WHERE {table} MATCH %s "
+                f"ORDER BY bm25({table}, {weight_sql}) LIMIT %s",
+                [expression, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    @staticmethod
+    def _in_order(queryset, ids: List[int]) -> List:
+        found = queryset.in_bulk(ids)
+        return [found[pk] for pk in ids if pk in found]
+
+    @classmethod
+    def search_patients(cls, text: str, limit: int = 20) -> List[Patient]:
+        ids = cls._ranked_ids(cls.PATIENT_TABLE, cls.PATIENT_WEIGHTS, text, limit)
+        return cls._in_order(Patient.objects.select_related('user'), ids)
+
+    @classmethod
+    def search_records(cls, text: str, limit: int = 20) -> List[MedicalRecord]:
+        ids = cls._ranked_ids(cls.RECORD_TABLE, cls.RECORD_WEIGHTS, text, limit)
+        return cls._in_order(
+            MedicalRecord.objects.select_related('patient__user', 'doctor__user'), ids
+        )
@@ -0,0 +1,86 @@
+import logging
+import threading
+from collections import Counter
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+
+logger = logging.getLogger(__name__)
+
+class SessionStore(CachedDBStore):
+    """
+    ``cached_db`` sessions that only write when something changed.
+
+    With ``SESSION_SAVE_EVERY_REQUEST`` every response calls ``save()``.
+    This store remembers the serialized data and the expiry it last
+    persisted, and skips the write while the data is unchanged and the
+    sliding expiry has moved by less than ``SESSION_EXPIRY_WRITE_THRESHOLD``
+    seconds. An idle session can therefore expire up to that many seconds
+    early. The cache entry holds ``(data, expiry_timestamp)`` so the check
+    needs no database read.
+    """
+    metrics = Counter()
+    _metrics_lock = threading.Lock()
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        self._persisted = None
+        self.writes_avoided = 0
+
+    @staticmethod
+    def threshold() -> int:
+        return getattr(settings, 'SESSION_EXPIRY_WRITE_THRESHOLD', 300)
+
+    @classmethod
+    def _count(cls, outcome: str):
+        with cls._metrics_lock:
+            cls.metrics[outcome] += 1
+
+    def _serialized(self, data) -> bytes:
+        return self.serializer().dumps(data)
+
+    def _remember(self, data, expiry: float):
+        self._persisted = (self._serialized(data), expiry)
+
+    def load(self):
+        try:
+            cached = self._cache.get(self.cache_key)
+        except Exception:
+            cached = None
+
+        if isinstance(cached, tuple) and len(cached) == 2:
+            data, expiry = cached
+        else:
+            s = self._get_session_from_db()
+            if not s:
+                return {}
+            data = self.decode(s.session_data)
+            expiry = s.expire_date.timestamp()
+            self._cache.set(self.cache_key, (data, expiry), self.get_expiry_age(expiry=s.expire_date))
+
+        self._remember(data, expiry)
+        return data
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        if not must_create and self._persisted is not None:
+            blob, persisted_expiry = self._persisted
+            data = self._get_session()
+            expiry = self.get_expiry_date().timestamp()
+            if blob == self._serialized(data) and expiry - persisted_expiry < self.threshold():
+                self.writes_avoided += 1
+                self._count('avoided')
+                logger.debug('Session write avoided (%d this request)', self.writes_avoided)
+                return
+
+        DBStore.save(self, must_create)
+        expiry = self.get_expiry_date()
+        self._cache.set(self.cache_key, (self._session, expiry.timestamp()), self.get_expiry_age(expiry=expiry))
+        self._remember(self._session, expiry.timestamp())
+        self._count('written')
+
+    def delete(self, session_key=None):
+        super().delete(session_key)
+        if session_key is None or session_key == self.session_key:
+            self._persisted = None
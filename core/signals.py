@@ -0,0 +1,218 @@
+import logging
+from collections import Counter
+from decimal import Decimal
+from django.db import DatabaseError, transaction
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.db.models.signals import post_init, post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.contrib.auth.models import User
+from .models import (
+    Patient, Doctor, Employee, Appointment, Bill, MedicalRecord, HospitalStats, DoctorAvailability,
+    Attachment, StoredFile
+)
+from .search import SearchIndex
+from .filestore import ContentStore
+from .slowqueries import SlowQueryLog
+
+logger = logging.getLogger(__name__)
+
+# Plain row counters: model -> HospitalStats field
+TOTAL_FIELDS = {
+    Patient: 'total_patients',
+    Doctor: 'total_doctors',
+    Employee: 'total_employees',
+}
+
+def _appointment_counters(status) -> Counter:
+    counters = Counter(total_appointments=1)
+    field = HospitalStats.APPOINTMENT_STATUS_FIELDS.get(status)
+    if field:
+        counters[field] += 1
+    return counters
+
+def _bill_counters(state) -> Counter:
+    status, amount = state
+    counters = Counter(total_bills=1)
+    if status == 'PAID':
+        counters['paid_revenue'] += Decimal(str(amount or 0))
+    elif status == 'PENDING':
+        counters['pending_revenue'] += Decimal(str(amount or 0))
+    return counters
+
+def _bill_state(instance):
+    return instance.payment_status, instance.amount
+
+# Snapshot of an instance loaded with only()/defer() that left the counted
+# fields out; the stored values are read just before save or delete
+UNKNOWN = object()
+
+def _snapshot(instance, fields):
+    if any(field not in instance.__dict__ for field in fields):
+        return UNKNOWN
+    values = tuple(instance.__dict__[field] for field in fields)
+    return values if len(values) > 1 else values[0]
+
+def _load_stored_state(instance, fields):
+    if instance._stats_state is UNKNOWN and instance.pk is not None:
+        stored = type(instance).objects.filter(pk=instance.pk).values_list(*fields).first()
+        if stored is not None:
+            instance._stats_state = stored if len(fields) > 1 else stored[0]
+
+def _diff(new: Counter, old: Counter) -> dict:
+    return {field: new[field] - old[field] for field in set(new) | set(old)}
+
+@receiver(post_save, sender=Patient)
+@receiver(post_save, sender=Doctor)
+@receiver(post_save, sender=Employee)
+def count_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        HospitalStats.apply_deltas(**{TOTAL_FIELDS[sender]: 1})
+
+@receiver(post_delete, sender=Patient)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_delete, sender=Employee)
+def count_deleted(sender, instance, **kwargs):
+    HospitalStats.apply_deltas(**{TOTAL_FIELDS[sender]: -1})
+
+@receiver(post_init, sender=Appointment)
+def remember_appointment_state(sender, instance, **kwargs):
+    instance._stats_state = _snapshot(instance, ('status',))
+
+@receiver(pre_save, sender=Appointment)
+@receiver(pre_delete, sender=Appointment)
+def load_appointment_state(sender, instance, raw=False, signal=None, **kwargs):
+    if raw:
+        return
+    _load_stored_state(instance, ('status',))
+    # The availability refresh reads the doctor once the row is gone
+    if signal is pre_delete and 'doctor_id' not in instance.__dict__:
+        instance.refresh_from_db(fields=['doctor'])
+
+@receiver(post_save, sender=Appointment)
+def appointment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old = Counter() if created else _appointment_counters(instance._stats_state)
+    HospitalStats.apply_deltas(**_diff(_appointment_counters(instance.status), old))
+    instance._stats_state = instance.status
+
+@receiver(post_delete, sender=Appointment)
+def appointment_deleted(sender, instance, **kwargs):
+    HospitalStats.apply_deltas(**_diff(Counter(), _appointment_counters(instance._stats_state)))
+
+@receiver(post_init, sender=Bill)
+def remember_bill_state(sender, instance, **kwargs):
+    instance._stats_state = _snapshot(instance, ('payment_status', 'amount'))
+
+@receiver(pre_save, sender=Bill)
+@receiver(pre_delete, sender=Bill)
+def load_bill_state(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _load_stored_state(instance, ('payment_status', 'amount'))
+
+@receiver(post_save, sender=Bill)
+def bill_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old = Counter() if created else _bill_counters(instance._stats_state)
+    HospitalStats.apply_deltas(**_diff(_bill_counters(_bill_state(instance)), old))
+    instance._stats_state = _bill_state(instance)
+
+@receiver(post_delete, sender=Bill)
+def bill_deleted(sender, instance, **kwargs):
+    HospitalStats.apply_deltas(**_diff(Counter(), _bill_counters(instance._stats_state)))
+
+def _refresh_availability(doctor_ids):
+    # Runs after commit: a failure here must not be reported as a failed save
+    try:
+        for doctor in Doctor.objects.filter(pk__in=doctor_ids):
+            DoctorAvailability.refresh(doctor)
+    except DatabaseError as e:
+        logger.warning(f"Doctor availability refresh failed for {sorted(doctor_ids)}: {str(e)}")
+
+def _refresh_pending_availability(connection):
+    # The first callback after a commit refreshes every doctor queued on the
+    # connection; the callbacks queued by later saves find nothing left to do
+    doctor_ids, connection.availability_pending = connection.availability_pending, set()
+    if doctor_ids:
+        _refresh_availability(doctor_ids)
+
+def schedule_availability_refresh(doctor_ids):
+    """
+    Refresh the availability index for these doctors once the current
+    transaction commits, so a doctor deleted in the same transaction is skipped.
+    Each doctor is rescanned once per transaction however many saves queue it
+    """
+    doctor_ids = set(doctor_ids) - {None}
+    if doctor_ids:
+        connection = transaction.get_connection()
+        connection.__dict__.setdefault('availability_pending', set()).update(doctor_ids)
+        transaction.on_commit(lambda: _refresh_pending_availability(connection))
+
+@receiver(post_init, sender=Appointment)
+def remember_appointment_doctor(sender, instance, **kwargs):
+    instance._availability_doctor_id = instance.__dict__.get('doctor_id')
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def refresh_doctor_availability(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    schedule_availability_refresh({instance.doctor_id, instance._availability_doctor_id})
+    instance._availability_doctor_id = instance.doctor_id
+
+@receiver(post_save, sender=Doctor)
+def doctor_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_availability_refresh({instance.pk})
+
+# Full-text search index. Updates run in the saving transaction so the
+# index commits or rolls back together with the row.
+SEARCH_NAME_FIELDS = {'first_name', 'last_name', 'username'}
+
+@receiver(post_save, sender=Patient)
+def index_patient(sender, instance, raw=False, **kwargs):
+    if not raw:
+        SearchIndex.index_patient(instance)
+
+@receiver(post_save, sender=User)
+def index_patient_name(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    if raw or created or (update_fields is not None and not SEARCH_NAME_FIELDS & set(update_fields)):
+        return
+    # Move the profiles past the typeahead index watermark
+    for model in (Patient, Doctor):
+        model.objects.filter(user=instance).update(updated_at=timezone.now())
+    patient = Patient.objects.filter(user=instance).first()
+    if patient is not None:
+        patient.user = instance
+        SearchIndex.index_patient(patient)
+
+@receiver(post_delete, sender=Patient)
+def unindex_patient(sender, instance, **kwargs):
+    SearchIndex.remove(SearchIndex.PATIENT_TABLE, instance.pk)
+
+@receiver(post_save, sender=MedicalRecord)
+def index_medical_record(sender, instance, raw=False, **kwargs):
+    if not raw:
+        SearchIndex.index_record(instance)
+
+@receiver(post_delete, sender=MedicalRecord)
+def unindex_medical_record(sender, instance, **kwargs):
+    SearchIndex.remove(SearchIndex.RECORD_TABLE, instance.pk)
+
+# Attachment reference counts. A blob is removed once nothing refers to
+# it; the file itself goes only after the deleting transaction commits.
+@receiver(post_save, sender=Attachment)
+def attachment_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        StoredFile.objects.filter(pk=instance.blob_id).update(ref_count=F('ref_count') + 1)
+
+@receiver(post_delete, sender=Attachment)
+def attachment_deleted(sender, instance, **kwargs):
+    ContentStore.release(instance.blob_id, attachment=True)
+
+@receiver(connection_created)
+def install_slow_query_log(sender, connection, **kwargs):
+    SlowQueryLog.install(connection)
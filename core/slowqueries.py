@@ -0,0 +1,172 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time as clock
+from typing import Iterator, List, Optional
+from django.conf import settings
+from django.db import DatabaseError
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# Frames in these files are instrumentation, not the code that ran the query
+SKIP_FILES = {os.path.abspath(__file__), os.path.join(APP_DIR, 'metrics.py')}
+
+
+class SlowQueryLog:
+    """
+    ``execute_wrapper`` that logs queries slower than
+    ``SLOW_QUERY_THRESHOLD_MS`` to the ``core.slowqueries`` logger, with
+    the parameters, the innermost ``core`` frame that issued the query and,
+    on SQLite, the ``EXPLAIN QUERY PLAN`` output.
+
+    Queries are grouped by shape (the SQL with literals and ``IN`` lists
+    collapsed) and a shape is only explained the first time this process
+    sees it. ``slow_query_report`` ranks the shapes in the JSON log by
+    total time. Installed on every connection by ``core.signals``.
+    """
+    EXPLAINABLE = ('select', 'with', 'insert', 'update', 'delete')
+    MAX_PARAM_LENGTH = 200
+    MAX_EXPLAINED = 2000
+
+    _lock = threading.Lock()
+    _explained = set()
+
+    @classmethod
+    def install(cls, connection):
+        # First in the list is outermost, and stays put while execute_wrapper() contexts push and pop
+        if not any(isinstance(wrapper, cls) for wrapper in connection.execute_wrappers):
+            connection.execute_wrappers.insert(0, cls())
+
+    @staticmethod
+    def threshold() -> Optional[float]:
+        return getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', None)
+
+    def __call__(self, execute, sql, params, many, context):
+        threshold = self.threshold()
+        if threshold is None:
+            return execute(sql, params, many, context)
+        start = clock.perf_counter()
+        result = execute(sql, params, many, context)
+        elapsed_ms = (clock.perf_counter() - start) * 1000
+        if elapsed_ms >= threshold:
+            try:
+                self.record(context['connection'], sql, params, many, elapsed_ms)
+            except Exception as e:
+                logger.debug(f"Could not record slow query: {e}")
+        return result
+
+    @staticmethod
+    def shape(sql: str) -> str:
+        shape = re.sub(r"'(?:[^']|'')*'", "'?'", sql)
+        shape = re.sub(r'\b\d+(?:\.\d+)?\b', '?', shape)
+        return re.sub(r'\(\s*%s(?:\s*,\s*%s)*\s*\)', '(%s, ...)', shape)
+
+    @classmethod
+    def fingerprint(cls, sql: str) -> str:
+        return hashlib.sha1(cls.shape(sql).encode()).hexdigest()[:12]
+
+    @staticmethod
+    def caller() -> str:
+        frame = sys._getframe(1)
+        while frame is not None:
+            filename = os.path.abspath(frame.f_code.co_filename)
+            if filename.startswith(APP_DIR + os.sep) and filename not in SKIP_FILES:
+                return f"{os.path.relpath(filename, os.path.dirname(APP_DIR))}:{frame.f_lineno} in {frame.f_code.co_name}"
+            frame = frame.f_back
+        return 'unknown'
+
+    @classmethod
+    def explain(cls, connection, sql: str, params) -> Optional[List[str]]:
+        """
+        The query plan as indented lines, or ``None`` where unsupported
+        """
+        if connection.vendor != 'sqlite' or not sql.lstrip().lower().startswith(cls.EXPLAINABLE):
+            return None
+        # A backend cursor: not wrapped, so neither logged nor counted again
+        cursor = connection.create_cursor()
+        try:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            rows = cursor.fetchall()
+        except DatabaseError:
+            return None
+        finally:
+            cursor.close()
+        depth = {0: -1}
+        lines = []
+        for node, parent, _, detail in rows:
+            depth[node] = depth.get(parent, -1) + 1
+            lines.append('  ' * depth[node] + detail)
+        return lines
+
+    @classmethod
+    def format_params(cls, params) -> str:
+        if params is None or not getattr(settings, 'SLOW_QUERY_LOG_PARAMS', True):
+            return ''
+        values = params if isinstance(params, (list, tuple)) else [params]
+        return json.dumps([
+            value if isinstance(value, (int, float, bool, type(None))) else str(value)[:cls.MAX_PARAM_LENGTH]
+            for value in values
+        ])
+
+    @classmethod
+    def record(cls, connection, sql: str, params, many: bool, elapsed_ms: float):
+        fingerprint = cls.fingerprint(sql)
+        with cls._lock:
+            first = fingerprint not in cls._explained
+            if first:
+                if len(cls._explained) >= cls.MAX_EXPLAINED:
+                    cls._explained.clear()
+                cls._explained.add(fingerprint)
+
+        plan = cls.explain(connection, sql, params) if first and not many else None
+        caller = cls.caller()
+        logger.info(
+            f"Slow query {elapsed_ms:.1f} ms [{fingerprint}] from {caller}",
+            extra={
+                'query_fingerprint': fingerprint,
+                'query_ms': round(elapsed_ms, 3),
+                'query_sql': cls.shape(sql),
+                'query_statement': sql,
+                'query_params': '' if many else cls.format_params(params),
+                'query_caller': caller,
+                'query_plan': '\n'.join(plan) if plan else '',
+            }
+        )
+
+    @staticmethod
+    def log_files(path: str) -> List[str]:
+        """
+        ``path`` and its rotations, oldest first
+        """
+        # Compressed rotations (LOG_FILE.2.gz) are skipped
+        rotations = [name for name in glob.glob(f'{path}.[0-9]*') if name.rsplit('.', 1)[1].isdigit()]
+        rotations.sort(key=lambda name: -int(name.rsplit('.', 1)[1]))
+        return rotations + [path]
+
+    @classmethod
+    def read_log(cls, path: str, since: Optional[str] = None) -> Iterator[dict]:
+        """
+        Slow query records from the JSON log at ``path`` and its rotations
+        """
+        for name in cls.log_files(path):
+            try:
+                with open(name) as log:
+                    for line in log:
+                        if __name__ not in line:
+                            continue
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue
+                        if entry.get('logger') != __name__ or 'query_fingerprint' not in entry:
+                            continue
+                        if since is None or entry.get('ts', '') >= since:
+                            yield entry
+            except FileNotFoundError:
+                continue
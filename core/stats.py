@@ -0,0 +1,168 @@
+from datetime import datetime, timedelta
+from typing import Dict, Any
+from django.contrib.auth.models import User
+from django.db.models import Q, Count, Sum
+from django.utils import timezone
+from .models import Patient, Doctor, Appointment, MedicalRecord, Bill, Employee, HospitalStats
+
+class DashboardStats:
+    """
+    Dashboard numbers for each role, computed with conditional aggregation
+    so that every table is read at most once per page load. Whole-table
+    totals come from the ``HospitalStats`` rollup instead of being recounted
+    """
+
+    @staticmethod
+    def _today(today=None):
+        return today or timezone.now().date()
+
+    @staticmethod
+    def for_patient(patient: Patient, today=None) -> Dict[str, Any]:
+        """
+        Patient dashboard counters (3 queries)
+        """
+        today = DashboardStats._today(today)
+
+        appointments = Appointment.objects.filter(patient=patient).aggregate(
+            upcoming=Count('id', filter=Q(appointment_date__gte=today, status='SCHEDULED'))
+        )
+        records = MedicalRecord.objects.filter(patient=patient).aggregate(total=Count('id'))
+        bills = Bill.objects.filter(patient=patient).aggregate(
+            total=Count('id'),
+            pending=Count('id', filter=Q(payment_status='PENDING'))
+        )
+
+        return {
+            'upcoming_appointments_count': appointments['upcoming'],
+            'medical_records_count': records['total'],
+            'pending_bills_count': bills['pending'],
+            'total_bills_count': bills['total'],
+        }
+
+    @staticmethod
+    def for_doctor(doctor: Doctor, today=None) -> Dict[str, Any]:
+        """
+        Doctor dashboard counters (2 queries)
+        """
+        today = DashboardStats._today(today)
+
+        appointments = Appointment.objects.filter(doctor=doctor).aggregate(
+            today_scheduled=Count('id', filter=Q(appointment_date=today, status='SCHEDULED')),
+            patients=Count('patient', distinct=True)
+        )
+        records = MedicalRecord.objects.filter(doctor=doctor).aggregate(total=Count('id'))
+
+        return {
+            'today_appointments_count': appointments['today_scheduled'],
+            'total_patients_count': appointments['patients'],
+            'medical_records_count': records['total'],
+        }
+
+    @staticmethod
+    def for_employee(today=None) -> Dict[str, Any]:
+        """
+        Counters shared by the employee branch of ``dashboard`` and by
+        ``employee_dashboard`` (3 queries)
+        """
+        today = DashboardStats._today(today)
+        totals = HospitalStats.get()
+
+        bills = Bill.objects.aggregate(
+            pending=Count('id', filter=Q(payment_status='PENDING')),
+            unpaid=Count('id', filter=Q(paid=False)),
+            revenue=Sum('amount', filter=Q(paid=True))
+        )
+
+        return {
+            'today_appointments_count': Appointment.objects.filter(
+                appointment_date=today,
+                status='SCHEDULED'
+            ).count(),
+            'total_appointments': totals.total_appointments,
+            'pending_bills_count': bills['pending'],
+            'pending_bills': bills['unpaid'],
+            'total_revenue': bills['revenue'] or 0,
+            'total_patients': totals.total_patients,
+            'total_doctors': totals.total_doctors,
+        }
+
+    @staticmethod
+    def for_admin_summary() -> Dict[str, Any]:
+        """
+        Hospital-wide totals for the admin branch of ``dashboard`` (3 queries)
+        """
+        totals = HospitalStats.get()
+
+        return {
+            'total_users_count': User.objects.count(),
+            'total_doctors_count': totals.total_doctors,
+            'total_patients_count': totals.total_patients,
+            'total_employees_count': totals.total_employees,
+            'total_appointments_count': totals.total_appointments,
+            'total_medical_records_count': MedicalRecord.objects.count(),
+            'total_bills_count': totals.total_bills,
+            'total_revenue': totals.paid_revenue,
+        }
+
+    @staticmethod
+    def for_admin(end_date=None, days: int = 30) -> Dict[str, Any]:
+        """
+        Totals and 30-day analytics for ``admin_dashboard`` (6 queries, each
+        bounded by the date window or an indexed filter)
+        """
+        end_date = DashboardStats._today(end_date)
+        start_date = end_date - timedelta(days=days)
+        totals = HospitalStats.get()
+
+        appointments = Appointment.objects.filter(
+            appointment_date__range=[start_date, end_date]
+        ).aggregate(
+            active_patients=Count('patient', distinct=True),
+            scheduled=Count('id', filter=Q(status='SCHEDULED')),
+            completed=Count('id', filter=Q(status='COMPLETED')),
+            cancelled=Count('id', filter=Q(status='CANCELLED'))
+        )
+        # Datetime bounds rather than __date lookups, which cast every row and cannot use an index
+        window = [
+            timezone.make_aware(datetime.combine(day, datetime.min.time()))
+            for day in (start_date, end_date + timedelta(days=1))
+        ]
+        bills = Bill.objects.filter(
+            created_at__gte=window[0], created_at__lt=window[1]
+        ).aggregate(
+            revenue=Sum('amount', filter=Q(payment_status='PAID')),
+            pending=Sum('amount', filter=Q(payment_status='PENDING'))
+        )
+        employees = Employee.objects.filter(position__in=['NURSE', 'TECHNICIAN']).aggregate(
+            nurses=Count('id', filter=Q(position='NURSE')),
+            technicians=Count('id', filter=Q(position='TECHNICIAN'))
+        )
+
+        return {
+            'total_patients': totals.total_patients,
+            'total_doctors': totals.total_doctors,
+            'total_employees': totals.total_employees,
+            'total_appointments': totals.total_appointments,
+            'total_bills': totals.total_bills,
+            'revenue': totals.paid_revenue,
+            'patient_stats': {
+                'new_patients': Patient.objects.filter(
+                    user__date_joined__gte=window[0], user__date_joined__lt=window[1]
+                ).count(),
+                'active_patients': appointments['active_patients'],
+            },
+            'appointment_stats': {
+                'scheduled': appointments['scheduled'],
+                'completed': appointments['completed'],
+                'cancelled': appointments['cancelled'],
+            },
+            'revenue_stats': {
+                'total': bills['revenue'] or 0,
+                'pending': bills['pending'] or 0,
+            },
+            'staff_stats': {
+                'doctors': Doctor.objects.filter(is_available=True).count(),
+                'nurses': employees['nurses'],
+                'technicians': employees['technicians'],
+            },
+        }
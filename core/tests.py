@@ -1,3 +1,1312 @@
-from django.test import TestCase
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, connection, connections, transaction
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.utils import timezone
+from .models import (
+    Patient, Doctor, Appointment, MedicalRecord, Bill, Employee, HospitalStats, DoctorAvailability,
+    Attachment, StoredFile, AdminProfile
+)
+from .stats import DashboardStats
+from .scheduling import SlotEngine, ConflictChecker
+from .booking import BookingService, BulkBookingService
+from .ratelimit import RateLimiter
+from .checks import check_session_cache
+from .sessions import SessionStore
+from .roles import RoleResolver, RoleBackend
+from .pagination import KeysetPaginator
+from .search import SearchIndex
+from .autocomplete import PrefixIndex
+from .utils import FileHandler
+from .filestore import ContentStore
+from .downloads import AttachmentServer
+from .previews import PreviewPool, derivative_path
+from .logqueue import JsonFormatter, QueueLogHandler, SamplingFilter
+from . import logqueue
+from .metrics import RequestMetrics
+from .memory import MemoryTracer
+from .slowqueries import SlowQueryLog
+from .indexes import IndexAdvisor, QueryShape
+from .backends.sqlite3.base import DatabaseWrapper, pragma_statements
+from . import views
 
-# Create your tests here.
+
+class HospitalTestMixin:
+    """
+    Small fixture set shared by the test cases below
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = timezone.now().date()
+        cls.patient = Patient.objects.create(
+            user=User.objects.create_user('patient1', first_name='Pat', last_name='One'),
+            phone='1234567890'
+        )
+        cls.other_patient = Patient.objects.create(
+            user=User.objects.create_user('patient2', first_name='Pam', last_name='Two'),
+            phone='1234567891'
+        )
+        cls.doctor = Doctor.objects.create(
+            user=User.objects.create_user('doctor1', first_name='Dan', last_name='Doc'),
+            specialization='CARDIOLOGY'
+        )
+        cls.employee = Employee.objects.create(
+            user=User.objects.create_user('nurse1', first_name='Nia', last_name='Nurse'),
+            position='NURSE'
+        )
+        Appointment.objects.create(
+            patient=cls.patient, doctor=cls.doctor, appointment_date=cls.today,
+            appointment_time=time(9, 0), reason='Checkup'
+        )
+        Appointment.objects.create(
+            patient=cls.other_patient, doctor=cls.doctor, appointment_date=cls.today,
+            appointment_time=time(10, 0), reason='Follow up', status='COMPLETED'
+        )
+        MedicalRecord.objects.create(
+            patient=cls.patient, doctor=cls.doctor, diagnosis='Flu', prescription='Rest'
+        )
+        Bill.objects.create(
+            patient=cls.patient, amount=Decimal('100.00'), due_date=cls.today + timedelta(days=7)
+        )
+        Bill.objects.create(
+            patient=cls.patient, amount=Decimal('50.00'), paid_amount=Decimal('50.00'),
+            due_date=cls.today + timedelta(days=7)
+        )
+
+
+class DashboardStatsTests(HospitalTestMixin, TestCase):
+    def test_patient_query_budget(self):
+        with self.assertNumQueries(3):
+            stats = DashboardStats.for_patient(self.patient, self.today)
+        self.assertEqual(stats['upcoming_appointments_count'], 1)
+        self.assertEqual(stats['medical_records_count'], 1)
+        self.assertEqual(stats['pending_bills_count'], 1)
+        self.assertEqual(stats['total_bills_count'], 2)
+
+    def test_doctor_query_budget(self):
+        with self.assertNumQueries(2):
+            stats = DashboardStats.for_doctor(self.doctor, self.today)
+        self.assertEqual(stats['today_appointments_count'], 1)
+        self.assertEqual(stats['total_patients_count'], 2)
+        self.assertEqual(stats['medical_records_count'], 1)
+
+    def test_employee_query_budget(self):
+        with self.assertNumQueries(3):
+            stats = DashboardStats.for_employee(self.today)
+        self.assertEqual(stats['today_appointments_count'], 1)
+        self.assertEqual(stats['total_appointments'], 2)
+        self.assertEqual(stats['pending_bills'], 1)
+        self.assertEqual(stats['total_revenue'], Decimal('50.00'))
+
+    def test_admin_summary_query_budget(self):
+        with self.assertNumQueries(3):
+            stats = DashboardStats.for_admin_summary()
+        self.assertEqual(stats['total_users_count'], 4)
+        self.assertEqual(stats['total_bills_count'], 2)
+        self.assertEqual(stats['total_revenue'], Decimal('50.00'))
+
+    def test_admin_query_budget(self):
+        with self.assertNumQueries(6):
+            stats = DashboardStats.for_admin(self.today)
+        self.assertEqual(stats['total_patients'], 2)
+        self.assertEqual(stats['patient_stats'], {'new_patients': 2, 'active_patients': 2})
+        self.assertEqual(stats['appointment_stats'], {'scheduled': 1, 'completed': 1, 'cancelled': 0})
+        self.assertEqual(stats['revenue_stats'], {'total': Decimal('50.00'), 'pending': Decimal('100.00')})
+        self.assertEqual(stats['staff_stats'], {'doctors': 1, 'nurses': 1, 'technicians': 0})
+
+
+class HospitalStatsTests(HospitalTestMixin, TestCase):
+    def assertNoDrift(self):
+        self.assertEqual(HospitalStats.get().drift(), {})
+
+    def test_signals_keep_rollup_in_sync(self):
+        stats = HospitalStats.get()
+        self.assertEqual(stats.total_patients, 2)
+        self.assertEqual(stats.appointments_scheduled, 1)
+        self.assertEqual(stats.paid_revenue, Decimal('50.00'))
+        self.assertEqual(stats.pending_revenue, Decimal('100.00'))
+
+        appointment = Appointment.objects.get(appointment_time=time(9, 0))
+        appointment.status = 'CANCELLED'
+        appointment.save()
+        bill = Bill.objects.get(amount=Decimal('100.00'))
+        bill.paid_amount = bill.amount
+        bill.save()
+        self.assertNoDrift()
+
+        self.other_patient.user.delete()
+        self.assertNoDrift()
+        self.assertEqual(HospitalStats.get().total_appointments, 1)
+
+    def test_deferred_fields_are_diffed_against_stored_values(self):
+        appointment = Appointment.objects.only('id').get(appointment_time=time(9, 0))
+        appointment.status = 'COMPLETED'
+        appointment.save()
+        bill = Bill.objects.defer('payment_status', 'amount').get(amount=Decimal('100.00'))
+        bill.paid_amount = Decimal('100.00')
+        bill.save()
+        self.assertNoDrift()
+
+        Appointment.objects.only('id').get(pk=appointment.pk).delete()
+        Bill.objects.only('id').get(pk=bill.pk).delete()
+        self.assertNoDrift()
+
+    def test_rebuild_command_reports_and_fixes_drift(self):
+        Appointment.objects.update(status='NO_SHOW')
+        out = StringIO()
+        with self.assertRaises(SystemExit):
+            call_command('rebuild_hospital_stats', '--check', stdout=out)
+        self.assertIn('appointments_no_show', out.getvalue())
+
+        call_command('rebuild_hospital_stats', stdout=StringIO())
+        self.assertNoDrift()
+
+
+class SlotEngineTests(HospitalTestMixin, TestCase):
+    def test_duration_blocks_overlapping_slots(self):
+        Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, appointment_date=self.today,
+            appointment_time=time(11, 15), reason='Long consult', duration=60
+        )
+        slots = self.doctor.get_available_slots(self.today)
+        self.assertNotIn(time(9, 0), slots)
+        self.assertNotIn(time(11, 0), slots)
+        self.assertNotIn(time(12, 0), slots)
+        self.assertIn(time(12, 30), slots)
+        self.assertEqual(len(slots), SlotEngine.slot_count() - 5)
+
+    def test_many_doctors_and_days_in_one_query(self):
+        other = Doctor.objects.create(user=User.objects.create_user('doctor2'))
+        end = self.today + timedelta(days=6)
+        with self.assertNumQueries(1):
+            slots = SlotEngine.free_slots_for_doctors([self.doctor.pk, other.pk], self.today, end)
+        self.assertEqual(len(slots[other.pk]), 7)
+        self.assertEqual(slots[other.pk][end], SlotEngine.slot_times())
+        self.assertEqual(len(slots[self.doctor.pk][self.today]), SlotEngine.slot_count() - 2)
+
+    def test_first_available_merges_doctors_and_respects_daily_cap(self):
+        self.doctor.max_patients_per_day = 3
+        self.doctor.save()
+        other = Doctor.objects.create(
+            user=User.objects.create_user('doctor2', first_name='Ann', last_name='Other'),
+            specialization='CARDIOLOGY', max_patients_per_day=1
+        )
+        now = datetime.combine(self.today, time(8, 0))
+        with self.assertNumQueries(2):
+            slots = SlotEngine.first_available(
+                'CARDIOLOGY', self.today, self.today + timedelta(days=1), limit=5, now=now
+            )
+        self.assertEqual(
+            [(slot['doctor'].pk, slot['date'], slot['time']) for slot in slots],
+            [
+                (other.pk, self.today, time(9, 0)),
+                (self.doctor.pk, self.today, time(9, 30)),
+                (self.doctor.pk, self.today + timedelta(days=1), time(9, 0)),
+                (other.pk, self.today + timedelta(days=1), time(9, 0)),
+                (self.doctor.pk, self.today + timedelta(days=1), time(9, 30)),
+            ]
+        )
+
+    def test_first_available_json(self):
+        self.client.force_login(self.patient.user)
+        response = self.client.get('/appointments/first-available/', {
+            'specialization': 'CARDIOLOGY', 'format': 'json', 'limit': 2,
+            'start_date': (self.today + timedelta(days=1)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([slot['time'] for slot in response.json()['slots']], ['09:00', '09:30'])
+
+        response = self.client.get('/appointments/first-available/', {'specialization': 'X', 'format': 'json'})
+        self.assertEqual(response.status_code, 400)
+
+
+class DoctorAvailabilityTests(HospitalTestMixin, TestCase):
+    def test_refreshed_when_appointments_change(self):
+        tomorrow = self.today + timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.max_patients_per_day = 1
+            self.doctor.save()
+            appointment = Appointment.objects.create(
+                patient=self.patient, doctor=self.doctor, appointment_date=tomorrow,
+                appointment_time=time(9, 0), reason='Checkup'
+            )
+        availability = DoctorAvailability.objects.get(doctor=self.doctor)
+        self.assertEqual(availability.free_slots_today, 0)
+        self.assertEqual(
+            timezone.localtime(availability.next_free_datetime).replace(tzinfo=None),
+            datetime.combine(tomorrow + timedelta(days=1), time(9, 0))
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.status = 'CANCELLED'
+            appointment.save()
+        availability.refresh_from_db()
+        self.assertEqual(timezone.localtime(availability.next_free_datetime).date(), tomorrow)
+
+    def test_one_refresh_per_doctor_per_transaction(self):
+        refreshed = []
+        refresh = DoctorAvailability.refresh
+        DoctorAvailability.refresh = lambda doctor: refreshed.append(doctor.pk)
+        try:
+            with self.captureOnCommitCallbacks(execute=True):
+                for hour in (9, 10, 11):
+                    Appointment.objects.create(
+                        patient=self.patient, doctor=self.doctor, appointment_date=self.today + timedelta(days=1),
+                        appointment_time=time(hour, 0), reason='Checkup'
+                    )
+        finally:
+            DoctorAvailability.refresh = refresh
+        self.assertEqual(refreshed, [self.doctor.pk])
+
+    def test_directory_attaches_missing_or_stale_rows(self):
+        DoctorAvailability.objects.create(doctor=self.doctor, as_of_date=self.today - timedelta(days=1))
+        self.client.force_login(self.patient.user)
+        response = self.client.get('/doctors/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(DoctorAvailability.objects.get(doctor=self.doctor).as_of_date, timezone.localdate())
+        with self.assertNumQueries(1):
+            DoctorAvailability.attach(Doctor.objects.select_related('user', 'availability'))
+
+
+class ConflictCheckerTests(HospitalTestMixin, TestCase):
+    def test_long_appointment_blocks_later_start(self):
+        tomorrow = self.today + timedelta(days=1)
+        Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, appointment_date=tomorrow,
+            appointment_time=time(9, 0), reason='Procedure', duration=60
+        )
+        with self.assertNumQueries(1):
+            conflicts = ConflictChecker.conflicts(self.doctor.pk, tomorrow, time(9, 30), 30)
+        self.assertEqual(len(conflicts), 1)
+        self.assertEqual(ConflictChecker.conflicts(self.doctor.pk, tomorrow, time(10, 0), 30), [])
+
+        appointment = Appointment(
+            patient=self.other_patient, doctor=self.doctor, appointment_date=tomorrow,
+            appointment_time=time(9, 45), reason='Checkup'
+        )
+        with self.assertRaises(ValidationError):
+            appointment.clean()
+
+    def test_batch_conflicts_in_one_query(self):
+        batch = [
+            Appointment(doctor=self.doctor, appointment_date=self.today, appointment_time=time(9, 15), duration=30),
+            Appointment(doctor=self.doctor, appointment_date=self.today, appointment_time=time(13, 0), duration=60),
+            Appointment(doctor=self.doctor, appointment_date=self.today, appointment_time=time(13, 30), duration=30),
+            Appointment(doctor=self.doctor, appointment_date=self.today, appointment_time=time(15, 0), duration=30),
+        ]
+        with self.assertNumQueries(1):
+            conflicts = ConflictChecker.find_conflicts(batch)
+        self.assertEqual(set(conflicts), {0, 1, 2})
+        self.assertEqual(conflicts[0][0].appointment_time, time(9, 0))
+        self.assertEqual(conflicts[1], [2])
+        self.assertEqual(conflicts[2], [1])
+
+
+class BookingServiceTests(HospitalTestMixin, TestCase):
+    def booking(self, start, **kwargs):
+        return Appointment(
+            patient=self.other_patient, doctor=self.doctor, reason='Checkup',
+            appointment_date=self.today + timedelta(days=1), appointment_time=start, **kwargs
+        )
+
+    def test_books_and_reports_structured_conflicts(self):
+        booked, conflicts = BookingService.book(self.booking(time(11, 0), duration=60))
+        self.assertIsNotNone(booked.pk)
+        self.assertEqual(conflicts, [])
+
+        booked, conflicts = BookingService.book(self.booking(time(11, 30)))
+        self.assertIsNone(booked)
+        self.assertEqual(conflicts[0]['start'], '11:00')
+        self.assertEqual(conflicts[0]['end'], '12:00')
+
+    def test_cancelled_start_can_be_rebooked(self):
+        cancelled, _ = BookingService.book(self.booking(time(14, 0)))
+        cancelled.status = 'CANCELLED'
+        cancelled.save()
+        booked, conflicts = BookingService.book(self.booking(time(14, 0)))
+        self.assertEqual(conflicts, [])
+        self.assertNotEqual(booked.pk, cancelled.pk)
+
+        # Only one appointment may hold the start
+        cancelled.status = 'SCHEDULED'
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            cancelled.save()
+
+
+class BulkBookingTests(HospitalTestMixin, TestCase):
+    def item(self, day, start, **kwargs):
+        return dict({
+            'patient_id': self.patient.pk, 'doctor_id': self.doctor.pk, 'reason': 'Follow up',
+            'appointment_date': day.isoformat(), 'appointment_time': start,
+        }, **kwargs)
+
+    def test_recurring_series_conflicts_and_reschedules(self):
+        start = self.today + timedelta(days=1)
+        Appointment.objects.create(
+            patient=self.other_patient, doctor=self.doctor, appointment_date=start + timedelta(days=14),
+            appointment_time=time(9, 0), reason='Existing', duration=60
+        )
+        to_move = Appointment.objects.get(appointment_time=time(9, 0), appointment_date=self.today)
+        items = [
+            self.item(start, '09:30', repeat={'interval_days': 7, 'count': 4}),
+            self.item(start, '09:45'),
+            self.item(start, '25:00'),
+            {'appointment_id': to_move.pk, 'appointment_date': start.isoformat(), 'appointment_time': '15:00'},
+        ]
+        # 8 statements plus the savepoint pair, independent of batch size
+        with self.assertNumQueries(10):
+            summary = BulkBookingService.process(items)
+
+        statuses = [(r['index'], r['occurrence'], r['status']) for r in summary['results']]
+        self.assertEqual(statuses, [
+            (0, 0, 'created'), (0, 1, 'created'), (0, 2, 'conflict'), (0, 3, 'created'),
+            (1, 0, 'conflict'), (2, 0, 'invalid'), (3, 0, 'rescheduled'),
+        ])
+        self.assertEqual(summary['results'][4]['conflicts'][0]['start'], '09:30')
+        self.assertEqual((summary['created'], summary['rescheduled'], summary['rejected']), (3, 1, 3))
+        to_move.refresh_from_db()
+        self.assertEqual((to_move.appointment_date, to_move.appointment_time), (start, time(15, 0)))
+        self.assertEqual(HospitalStats.get().drift(), {})
+
+    def test_all_or_nothing_endpoint(self):
+        user = self.employee.user
+        self.client.force_login(user)
+        body = {'all_or_nothing': True, 'appointments': [
+            self.item(self.today + timedelta(days=2), '11:00'),
+            self.item(self.today - timedelta(days=2), '11:00'),
+        ]}
+        response = self.client.post('/appointments/bulk/', json.dumps(body), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['status'] for r in response.json()['results']], ['skipped', 'invalid'])
+        self.assertEqual(Appointment.objects.count(), 2)
+
+
+class RateLimiterTests(TestCase):
+
+    def setUp(self):
+        caches['rate_limit'].clear()
+
+    def test_sliding_window(self):
+        hits = [RateLimiter.hit('scope', 'ip|user', 3, 60, now=600 + i)[0] for i in range(4)]
+        self.assertEqual(hits, [True, True, True, False])
+        # Halfway into the next window half of the old hits still count
+        self.assertEqual(RateLimiter.hit('scope', 'ip|user', 3, 60, now=690), (True, 0))
+        self.assertFalse(RateLimiter.hit('scope', 'ip|user', 3, 60, now=691)[0])
+        self.assertTrue(RateLimiter.hit('scope', 'ip|other', 3, 60, now=691)[0])
+
+    def test_login_is_limited_per_ip_and_username(self):
+        for _ in range(5):
+            self.client.post('/login/', {'username': 'mallory', 'password': 'x'})
+        response = self.client.post('/login/', {'username': 'mallory', 'password': 'x'})
+        self.assertEqual(response.status_code, 403)
+        self.assertIn('Retry-After', response)
+        response = self.client.post('/login/', {'username': 'alice', 'password': 'x'})
+        self.assertNotEqual(response.status_code, 403)
+
+
+class SessionStoreTests(TestCase):
+
+    def test_unchanged_session_is_not_rewritten(self):
+        session = SessionStore()
+        session['user_type'] = 'patient'
+        session.save()
+
+        reloaded = SessionStore(session.session_key)
+        reloaded['user_type'] = 'patient'
+        with self.assertNumQueries(0):
+            reloaded.save()
+        self.assertEqual(reloaded.writes_avoided, 1)
+
+        # The UPDATE plus its savepoint pair
+        reloaded['user_type'] = 'doctor'
+        with self.assertNumQueries(3):
+            reloaded.save()
+        self.assertEqual(SessionStore(session.session_key)['user_type'], 'doctor')
+
+    def test_expiry_moves_after_threshold(self):
+        session = SessionStore()
+        session['key'] = 'value'
+        session.save()
+        blob, expiry = session._persisted
+        session._persisted = (blob, expiry - SessionStore.threshold())
+        with self.assertNumQueries(3):
+            session.save()
+        self.assertEqual(session.writes_avoided, 0)
+
+    def test_process_local_session_cache_fails_check(self):
+        self.assertEqual(check_session_cache(None), [])
+        local = {**settings.CACHES, 'sessions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with override_settings(CACHES=local):
+            self.assertEqual([error.id for error in check_session_cache(None)], ['core.E001'])
+
+
+class RoleResolverTests(HospitalTestMixin, TestCase):
+
+    def test_one_query_resolves_every_role(self):
+        user = User.objects.get(pk=self.employee.user.pk)
+        with self.assertNumQueries(1):
+            checks = [views.is_patient(user), views.is_doctor(user), views.is_employee(user), views.is_admin(user)]
+            self.assertEqual(checks, [False, False, True, False])
+            self.assertEqual(RoleResolver.role(user), 'employee')
+            self.assertFalse(hasattr(user, 'doctor'))
+            self.assertEqual(user.employee, self.employee)
+
+    def test_backend_loads_roles_with_user(self):
+        with self.assertNumQueries(1):
+            user = RoleBackend().get_user(self.doctor.user.pk)
+            self.assertFalse(hasattr(user, 'patient'))
+            self.assertTrue(views.is_doctor(user))
+            self.assertEqual(RoleResolver.role(user), 'doctor')
+        self.assertIsNone(RoleResolver.role(AnonymousUser()))
+
+
+class KeysetPaginatorTests(HospitalTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for i in range(7):
+            Appointment.objects.create(
+                patient=cls.patient, doctor=cls.doctor, created_by=cls.patient.user,
+                appointment_date=cls.today + timedelta(days=1 + i // 3),
+                appointment_time=time(9 + i % 3, 0), reason='Follow-up'
+            )
+
+    def walk(self, per_page):
+        pages, params = [], {}
+        while True:
+            page = KeysetPaginator(Appointment.objects.all(), per_page=per_page).page(**params)
+            pages.append(page)
+            if not page.has_next():
+                return pages
+            params = {'after': page.next_cursor}
+
+    def test_pages_follow_meta_ordering(self):
+        expected = list(Appointment.objects.values_list('pk', flat=True))
+        pages = self.walk(per_page=3)
+        self.assertEqual([a.pk for page in pages for a in page], expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 3])
+        self.assertFalse(pages[0].has_previous())
+
+        back = KeysetPaginator(Appointment.objects.all(), per_page=3).page(before=pages[2].previous_cursor)
+        self.assertEqual([a.pk for a in back], [a.pk for a in pages[1]])
+        self.assertTrue(back.has_previous())
+
+    def test_no_count_or_offset(self):
+        cursor = self.walk(per_page=2)[1].next_cursor
+        with self.assertNumQueries(1) as queries:
+            KeysetPaginator(Appointment.objects.all(), per_page=2).page(after=cursor)
+        sql = queries.captured_queries[0]['sql'].upper()
+        self.assertNotIn('COUNT(', sql)
+        self.assertNotIn('OFFSET', sql)
+
+    def test_related_ordering_and_bad_cursor(self):
+        paginator = KeysetPaginator(Doctor.objects.select_related('user'))
+        self.assertEqual(
+            paginator.decode(paginator.encode(self.doctor)),
+            [self.doctor.specialization, self.doctor.user.first_name, self.doctor.pk]
+        )
+        self.client.force_login(self.employee.user)
+        response = self.client.get('/doctors/', {'after': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['doctors']), [self.doctor])
+
+
+class SearchIndexTests(HospitalTestMixin, TestCase):
+
+    def test_disabled_without_fts_tables(self):
+        table = SearchIndex.PATIENT_TABLE
+        SearchIndex._available.clear()
+        SearchIndex.PATIENT_TABLE = 'core_missing_fts'
+        try:
+            with self.assertLogs('core.search', 'WARNING'):
+                self.assertFalse(SearchIndex.enabled())
+            with self.assertNumQueries(0):
+                self.assertFalse(SearchIndex.enabled())
+                SearchIndex.index_patient(self.patient)
+                self.assertEqual(SearchIndex.search_patients('one pat'), [])
+        finally:
+            SearchIndex.PATIENT_TABLE = table
+            SearchIndex._available.clear()
+        self.assertTrue(SearchIndex.enabled())
+
+    def test_signals_keep_index_current(self):
+        self.assertEqual(SearchIndex.search_patients('one pat'), [self.patient])
+        self.assertEqual(SearchIndex.search_patients('1234567891'), [self.other_patient])
+
+        user = self.other_patient.user
+        user.last_name = 'Hypertensa'
+        user.save()
+        self.assertEqual(SearchIndex.search_patients('hypert'), [self.other_patient])
+
+        record = MedicalRecord.objects.create(
+            patient=self.other_patient, doctor=self.doctor,
+            diagnosis='Hypertension', prescription='Lisinopril'
+        )
+        self.assertEqual(SearchIndex.search_records('lisinopril'), [record])
+        record.delete()
+        self.assertEqual(SearchIndex.search_records('lisinopril'), [])
+
+    def test_ranking_and_operator_input(self):
+        noted = MedicalRecord.objects.create(
+            patient=self.patient, doctor=self.doctor,
+            diagnosis='Sprain', prescription='Ice', notes='Rule out asthma'
+        )
+        diagnosed = MedicalRecord.objects.create(
+            patient=self.other_patient, doctor=self.doctor, diagnosis='Asthma', prescription='Inhaler'
+        )
+        self.assertEqual(SearchIndex.search_records('asthma'), [diagnosed, noted])
+        self.assertEqual(SearchIndex.search_records('asthma OR "NEAR('), [])
+        self.assertEqual(SearchIndex.match_expression('  '), '')
+
+    def test_rebuild_and_view(self):
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 2 patients and 1 medical records', out.getvalue())
+
+        self.client.force_login(self.doctor.user)
+        response = self.client.get('/patients/search/', {'q': 'flu'})
+        self.assertEqual([r.diagnosis for r in response.context['records']], ['Flu'])
+
+        self.client.force_login(self.patient.user)
+        self.assertEqual(self.client.get('/patients/search/', {'q': 'flu'}).status_code, 403)
+
+
+class PrefixIndexTests(HospitalTestMixin, TestCase):
+
+    def setUp(self):
+        PrefixIndex.clear()
+
+    def labels(self, text, **kwargs):
+        return [item['label'] for item in PrefixIndex.search(text, **kwargs)]
+
+    def test_prefix_lookup(self):
+        self.assertEqual(self.labels('pa'), ['Pam Two', 'Pat One'])
+        self.assertEqual(self.labels('pat o'), ['Pat One'])
+        self.assertEqual(self.labels('(123) 456-7891'), ['Pam Two'])
+        self.assertEqual(self.labels('cardio'), ['Dr. Dan Doc'])
+        self.assertEqual(self.labels('pa', kinds=('doctor',)), [])
+
+    def test_watermark_refresh(self):
+        self.assertEqual(self.labels('zed'), [])
+        user = self.other_patient.user
+        user.first_name = 'Zed'
+        user.save()
+        # Within the refresh interval nothing is reloaded
+        with self.assertNumQueries(0):
+            self.assertEqual(self.labels('zed'), [])
+        PrefixIndex._checked_at -= PrefixIndex.REFRESH_SECONDS
+        with self.assertNumQueries(2):
+            self.assertEqual(self.labels('zed'), ['Zed Two'])
+        self.assertEqual(self.labels('pam'), [])
+
+    def test_searches_during_rebuild_see_the_old_index(self):
+        self.assertEqual(self.labels('pa'), ['Pam Two', 'Pat One'])
+        seen = []
+        describe = PrefixIndex.describe
+
+        def searching_describe(kind, obj):
+            seen.append(self.labels('pa'))
+            return describe(kind, obj)
+
+        PrefixIndex.describe = searching_describe
+        try:
+            PrefixIndex.rebuild()
+        finally:
+            PrefixIndex.describe = describe
+        self.assertEqual(seen, [['Pam Two', 'Pat One']] * 3)
+
+    def test_endpoint_permissions(self):
+        self.client.force_login(self.patient.user)
+        response = self.client.get('/autocomplete/', {'q': 'd'})
+        self.assertEqual([item['type'] for item in response.json()['results']], ['doctor'])
+        self.assertEqual(self.client.get('/autocomplete/', {'q': 'p', 'type': 'patient'}).status_code, 403)
+        self.assertContains(self.client.get('/appointments/book/'), 'data-typeahead')
+
+        self.client.force_login(self.employee.user)
+        response = self.client.get('/autocomplete/', {'q': 'p', 'type': 'patient'})
+        self.assertEqual([item['id'] for item in response.json()['results']],
+                         [self.other_patient.pk, self.patient.pk])
+
+    def test_forms_require_a_chosen_suggestion(self):
+        self.client.force_login(self.patient.user)
+        for doctor in ('', 'Dan Doc'):
+            response = self.client.post('/appointments/book/', {
+                'doctor': doctor, 'appointment_date': self.today.isoformat(), 'appointment_time': '09:00',
+                'reason': 'Checkup',
+            })
+            self.assertContains(response, 'Please choose a doctor from the suggestions.')
+
+        self.client.force_login(self.employee.user)
+        bills = Bill.objects.count()
+        response = self.client.post('/employee/create-bill/', {'patient': '', 'amount': '10', 'description': 'X'})
+        self.assertContains(response, 'Please choose a patient from the suggestions.')
+        self.assertEqual(Bill.objects.count(), bills)
+
+
+class FileHandlerTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def upload(self, content, name='report.pdf', content_type='application/pdf'):
+        return SimpleUploadedFile(name, content, content_type=content_type)
+
+    def meta(self, upload, file_type='application/pdf'):
+        return {'file_name': 'report', 'file_type': file_type, 'file_size': upload.size}
+
+    def test_streams_and_hashes(self):
+        content = b'%PDF-1.7\n' + b'x' * (3 * 64 * 1024 + 17)
+        upload = self.upload(content)
+        path, digest, size = FileHandler.stream_to_storage(upload, 'reports/report.pdf')
+        self.assertEqual((digest, size), (hashlib.sha256(content).hexdigest(), len(content)))
+        with default_storage.open(path) as stored:
+            self.assertEqual(stored.read(), content)
+
+        ok, saved = FileHandler.save_file(self.upload(content), self.meta(upload), 'reports')
+        self.assertTrue(ok)
+        self.assertTrue(default_storage.exists(saved))
+
+    def test_rejects_mismatched_content(self):
+        upload = self.upload(b'\x89PNG\r\n\x1a\n' + b'0' * 100)
+        ok, message = FileHandler.save_file(upload, self.meta(upload), 'reports')
+        self.assertFalse(ok)
+        self.assertIn('does not match', message)
+
+    def test_oversized_stream_leaves_no_file(self):
+        upload = self.upload(b'%PDF-1.7\n' + b'x' * 1000)
+        original = FileHandler.MAX_FILE_SIZE
+        FileHandler.MAX_FILE_SIZE = 100
+        try:
+            with self.assertRaises(ValidationError):
+                FileHandler.stream_to_storage(upload, 'reports/big.pdf')
+        finally:
+            FileHandler.MAX_FILE_SIZE = original
+        self.assertFalse(default_storage.exists('reports/big.pdf'))
+
+
+class ContentStoreTests(HospitalTestMixin, TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def pdf(self, body=b'referral'):
+        return SimpleUploadedFile('referral.pdf', b'%PDF-1.4\n' + body, content_type='application/pdf')
+
+    def test_duplicate_uploads_share_one_blob(self):
+        meta = {'file_name': 'referral', 'file_type': 'application/pdf', 'file_size': 20}
+        first = FileHandler.save_file(self.pdf(), meta, 'attachments')
+        second = FileHandler.save_file(self.pdf(), meta, 'attachments')
+        self.assertEqual(first, second)
+        self.assertEqual(StoredFile.objects.count(), 1)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'attachments', 'tmp')), [])
+
+        other = FileHandler.save_file(self.pdf(b'another'), meta, 'attachments')
+        self.assertNotEqual(other[1], first[1])
+
+    def test_saved_paths_are_references(self):
+        meta = {'file_name': 'referral', 'file_type': 'application/pdf', 'file_size': 20}
+        _, first = FileHandler.save_file(self.pdf(), meta, 'attachments')
+        _, second = FileHandler.save_file(self.pdf(), meta, 'attachments')
+        self.assertEqual(StoredFile.objects.get().ref_count, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(FileHandler.delete_file(first)[0], True)
+        self.assertTrue(default_storage.exists(second))
+        self.assertEqual(StoredFile.objects.get().ref_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(FileHandler.delete_file(second)[0], True)
+        self.assertFalse(default_storage.exists(second))
+        self.assertFalse(StoredFile.objects.exists())
+
+    def test_file_removed_with_last_reference(self):
+        blob = ContentStore.put(self.pdf(), 'application/pdf')
+        record = MedicalRecord.objects.get()
+        by_patient = ContentStore.attach(blob, 'referral.pdf', patient=self.patient)
+        ContentStore.attach(blob, 'referral.pdf', medical_record=record)
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 2)
+
+        self.assertEqual(FileHandler.delete_file(blob.path)[0], False)
+        with self.captureOnCommitCallbacks(execute=True):
+            by_patient.delete()
+        self.assertTrue(default_storage.exists(blob.path))
+
+        # Cascading from the medical record drops the last reference
+        with self.captureOnCommitCallbacks(execute=True):
+            record.delete()
+        self.assertFalse(StoredFile.objects.exists())
+        self.assertFalse(default_storage.exists(blob.path))
+
+
+class AttachmentDownloadTests(HospitalTestMixin, TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root, ATTACHMENT_SERVE_MODE='django')
+        self.override.enable()
+        self.body = b'%PDF-1.4\n' + b'0123456789' * 10
+        blob = ContentStore.put(
+            SimpleUploadedFile('scan.pdf', self.body, content_type='application/pdf'), 'application/pdf'
+        )
+        self.attachment = ContentStore.attach(blob, 'scan.pdf', patient=self.patient)
+        self.url = f'/attachments/{self.attachment.pk}/download/'
+        self.etag = f'"{blob.sha256}"'
+        self.client.force_login(self.patient.user)
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_full_download_and_revalidation(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], self.etag)
+        self.assertEqual(response['Content-Length'], str(len(self.body)))
+        self.assertIn('attachment; filename="scan.pdf"', response['Content-Disposition'])
+        self.assertEqual(b''.join(response.streaming_content), self.body)
+        response.close()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=self.etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_byte_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-3')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 0-3/{len(self.body)}')
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-2')
+        self.assertEqual(b''.join(response.streaming_content), self.body[-2:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.body)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.body)}')
+
+        # A stale If-Range validator gets the whole (changed) file instead
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+    def test_offload_to_front_server(self):
+        with override_settings(ATTACHMENT_SERVE_MODE='x-accel'):
+            response = self.client.get(self.url)
+        self.assertEqual(
+            response['X-Accel-Redirect'], '/protected-media/' + self.attachment.blob.path.replace(os.sep, '/')
+        )
+        self.assertEqual(response.content, b'')
+
+    def test_other_patients_are_refused(self):
+        self.client.force_login(self.other_patient.user)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.client.force_login(self.doctor.user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+    def test_confidential_records_limit_every_role(self):
+        record = MedicalRecord.objects.get()
+        record.is_confidential = True
+        record.save()
+        attachment = ContentStore.attach(self.attachment.blob, 'notes.pdf', medical_record=record)
+        attachment = Attachment.objects.select_related('medical_record').get(pk=attachment.pk)
+        allowed = {
+            user.username: AttachmentServer.can_view(user, attachment)
+            for user in (self.patient.user, self.other_patient.user, self.doctor.user, self.employee.user)
+        }
+        self.assertEqual(allowed, {'patient1': True, 'patient2': False, 'doctor1': True, 'nurse1': False})
+
+
+@override_settings(PREVIEW_EXECUTOR='sync')
+class PreviewPoolTests(HospitalTestMixin, TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def png(self, size=(2000, 1000)):
+        from PIL import Image
+        buffer = BytesIO()
+        Image.new('RGBA', size, (200, 30, 30, 128)).save(buffer, 'PNG')
+        return SimpleUploadedFile('xray.png', buffer.getvalue(), content_type='image/png')
+
+    def test_previews_rendered_after_commit_and_removed_with_blob(self):
+        from PIL import Image
+        meta = {'file_name': 'xray', 'file_type': 'image/png', 'file_size': 100}
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            saved, path = FileHandler.save_file(self.png(), meta, 'attachments')
+        self.assertTrue(saved)
+        # Nothing is decoded inside the request's transaction
+        self.assertFalse(PreviewPool.available(path, 'thumb'))
+        for callback in callbacks:
+            callback()
+
+        for variant, bound in (('thumb', 256), ('preview', 1024)):
+            with Image.open(default_storage.path(derivative_path(path, variant))) as image:
+                self.assertEqual(image.format, 'JPEG')
+                self.assertEqual(max(image.size), bound)
+
+        blob = StoredFile.objects.get(path=path)
+        attachment = ContentStore.attach(blob, 'xray.png', patient=self.patient)
+        self.client.force_login(self.patient.user)
+        response = self.client.get(f'/attachments/{attachment.pk}/preview/thumb/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertTrue(response['Content-Disposition'].startswith('inline'))
+        response.close()
+        self.assertEqual(self.client.get(f'/attachments/{attachment.pk}/preview/huge/').status_code, 404)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            attachment.delete()
+            FileHandler.delete_file(path)
+        self.assertFalse(default_storage.exists(derivative_path(path, 'thumb')))
+
+    def test_scheduling_failure_keeps_the_upload(self):
+        meta = {'file_name': 'xray', 'file_type': 'image/png', 'file_size': 1}
+        submit = PreviewPool.submit
+
+        def shut_down(path, content_type):
+            raise RuntimeError('cannot schedule new futures after shutdown')
+
+        PreviewPool.submit = shut_down
+        try:
+            with self.assertLogs('core.utils', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+                saved, path = FileHandler.save_file(self.png(), meta, 'attachments')
+        finally:
+            PreviewPool.submit = submit
+        self.assertTrue(saved)
+        self.assertEqual(StoredFile.objects.get(path=path).ref_count, 1)
+
+    def test_existing_previews_are_not_redone(self):
+        blob = ContentStore.put(self.png((300, 300)), 'image/png')
+        self.assertEqual(len(PreviewPool.submit(blob.path, blob.content_type).result()), 2)
+        self.assertEqual(PreviewPool.submit(blob.path, blob.content_type).result(), [])
+        self.assertIsNone(PreviewPool.submit(blob.path, 'text/plain'))
+
+
+class QueuedLoggingTests(TestCase):
+
+    def record(self, name='core.views', level=logging.ERROR, msg='failed %s', args=('x',), exc_info=None):
+        return logging.LogRecord(name, level, __file__, 1, msg, args, exc_info)
+
+    def test_sampling_caps_each_logger(self):
+        sampler = SamplingFilter(rates={'': 5, 'core': 2}, period=60)
+        passed = [sampler.filter(self.record()) for _ in range(4)]
+        self.assertEqual(passed, [True, True, False, False])
+        self.assertTrue(sampler.filter(self.record(level=logging.INFO)))
+        self.assertTrue(sampler.filter(self.record(name='django.request')))
+
+        sampler._windows['core.views'][0] -= 60
+        record = self.record()
+        self.assertTrue(sampler.filter(record))
+        self.assertEqual(record.suppressed, 2)
+
+    def test_records_written_as_json_by_listener(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        handler = QueueLogHandler(os.path.join(directory, 'app.log'), console=False)
+        try:
+            raise ValueError('bad')
+        except ValueError:
+            handler.handle(self.record(exc_info=sys.exc_info()))
+        handler.handle(self.record(name='django.request', msg='Forbidden', args=()))
+        handler.close()
+
+        with open(os.path.join(directory, 'app.log')) as log:
+            first, second = [json.loads(line) for line in log]
+        self.assertEqual((first['logger'], first['message']), ('core.views', 'failed x'))
+        self.assertIn('ValueError: bad', first['exc'])
+        self.assertEqual(second['level'], 'ERROR')
+
+    def test_reopens_file_rotated_outside_the_process(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'app.log')
+        handler = QueueLogHandler(path, console=False)
+        self.assertIn(handler, logqueue._handlers)
+        handler.handle(self.record(msg='before', args=()))
+        handler.stop()
+        os.rename(path, path + '.1')
+        handler.start()
+        handler.handle(self.record(msg='after', args=()))
+        handler.close()
+        self.assertNotIn(handler, logqueue._handlers)
+
+        self.assertEqual(SlowQueryLog.log_files(path), [path + '.1', path])
+        for name, message in ((path + '.1', 'before'), (path, 'after')):
+            with open(name) as log:
+                self.assertEqual([json.loads(line)['message'] for line in log], [message])
+
+
+class RequestMetricsTests(HospitalTestMixin, TestCase):
+
+    def setUp(self):
+        RequestMetrics.clear()
+
+    def test_requests_timed_per_url_name(self):
+        self.client.force_login(self.doctor.user)
+        with override_settings(SERVER_TIMING=False):
+            self.assertNotIn('Server-Timing', self.client.get('/doctors/'))
+        RequestMetrics.clear()
+        with override_settings(SERVER_TIMING=True):
+            response = self.client.get('/doctors/')
+        self.assertEqual(response.status_code, 200)
+        metrics = {part.strip().split(';')[0] for part in response['Server-Timing'].split(',')}
+        self.assertEqual(metrics, {'db', 'tpl', 'app'})
+        self.assertIn('queries', response['Server-Timing'])
+
+        key = ('request_db_queries', 'doctor_profiles', 'GET')
+        self.assertEqual(RequestMetrics._histograms[key].count, 1)
+        self.assertGreater(RequestMetrics._histograms[key].sum, 0)
+        self.assertGreater(RequestMetrics._histograms[('request_template_seconds', 'doctor_profiles', 'GET')].sum, 0)
+        self.assertEqual(
+            RequestMetrics._histograms[('response_size_bytes', 'doctor_profiles', 'GET')].sum, len(response.content)
+        )
+
+    def test_metrics_endpoint_is_admin_only(self):
+        self.client.force_login(self.doctor.user)
+        self.assertEqual(self.client.get('/metrics/').status_code, 302)
+
+        admin = User.objects.create_user('admin1')
+        AdminProfile.objects.create(user=admin, phone='1234567899', address='HQ')
+        self.client.force_login(admin)
+        self.client.get('/doctors/')
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('# TYPE hospital_request_duration_seconds histogram', body)
+        self.assertIn('hospital_request_duration_seconds_count{view="doctor_profiles",method="GET"} 1', body)
+        self.assertIn('hospital_request_db_queries_bucket{view="doctor_profiles",method="GET",le="+Inf"} 1', body)
+        self.assertIn('hospital_session_saves_total{outcome="avoided"}', body)
+
+
+class ProfilingTests(HospitalTestMixin, TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.override = override_settings(PROFILING_ENABLED=True, PROFILING_DIR=self.directory)
+        self.override.enable()
+        self.addCleanup(self.override.disable)
+        admin = User.objects.create_user('admin1')
+        AdminProfile.objects.create(user=admin, phone='1234567899', address='HQ')
+        self.admin = admin
+
+    def profiles(self, view='doctor_profiles'):
+        directory = os.path.join(self.directory, view)
+        return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+    def test_flag_only_honoured_for_admins(self):
+        self.client.force_login(self.doctor.user)
+        self.client.get('/doctors/', HTTP_X_PROFILE='1')
+        self.assertEqual(self.profiles(), [])
+
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get('/doctors/?profile=1').status_code, 200)
+        self.client.get('/doctors/', HTTP_X_PROFILE='sample')
+        self.assertEqual([os.path.splitext(name)[1] for name in self.profiles()], ['.folded', '.prof'])
+
+        out = StringIO()
+        call_command('profile_report', stdout=out)
+        self.assertIn('doctor_profiles: 1 cProfile runs', out.getvalue())
+        self.assertIn('doctor_profiles: 1 sampled runs', out.getvalue())
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_sampled_requests(self):
+        self.client.force_login(self.doctor.user)
+        self.client.get('/doctors/')
+        self.assertEqual(len(self.profiles()), 1)
+        with override_settings(PROFILING_ENABLED=False):
+            self.client.get('/doctors/')
+        self.assertEqual(len(self.profiles()), 1)
+
+
+class AllocationBudgetMixin:
+    """
+    ``with self.assertAllocationUnder(bytes):`` fails the test when the
+    block's peak traced allocation exceeds the budget
+    """
+
+    @contextmanager
+    def assertAllocationUnder(self, budget: int):
+        with MemoryTracer.measure() as usage:
+            yield usage
+        self.assertLess(usage.peak, budget, f'Peak allocation {usage.peak} bytes is over the {budget} byte budget')
+
+    @staticmethod
+    def seed_doctors(count: int):
+        users = User.objects.bulk_create(User(username=f'seed_doctor_{i}', first_name='Seed') for i in range(count))
+        Doctor.objects.bulk_create(Doctor(user=user, phone='1234567890') for user in users)
+
+
+class MemoryDiagnosticsTests(AllocationBudgetMixin, HospitalTestMixin, TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_user('admin1')
+        AdminProfile.objects.create(user=self.admin, phone='1234567899', address='HQ')
+        self.addCleanup(MemoryTracer.stop)
+
+    def test_admin_can_trace_and_diff(self):
+        self.client.force_login(self.doctor.user)
+        self.assertEqual(self.client.post('/diagnostics/memory/', {'action': 'start'}).status_code, 302)
+
+        self.client.force_login(self.admin)
+        self.assertTrue(self.client.post('/diagnostics/memory/', {'action': 'start', 'frames': 5}).json()['tracing'])
+        self.client.post('/diagnostics/memory/', {'action': 'snapshot', 'label': 'before'})
+        retained = [bytearray(1024) for _ in range(100)]
+        status = self.client.get('/diagnostics/memory/', {'limit': 5}).json()
+        self.assertEqual(status['snapshots'], ['before'])
+        self.assertLessEqual(len(status['top']), 5)
+
+        diff = self.client.get('/diagnostics/memory/', {'diff': 'before', 'limit': 50}).json()['diff']
+        self.assertTrue(any('tests.py' in entry['site'][0] and entry['size_diff'] >= 100 * 1024 for entry in diff))
+        self.assertEqual(self.client.get('/diagnostics/memory/', {'diff': 'missing'}).status_code, 400)
+        self.assertFalse(self.client.post('/diagnostics/memory/', {'action': 'stop'}).json()['tracing'])
+        del retained
+
+    def test_doctor_list_allocation_is_bounded_by_page_size(self):
+        self.seed_doctors(500)
+        self.client.force_login(self.doctor.user)
+        self.client.get('/doctors/')  # warm caches and imports
+        with self.assertAllocationUnder(1024 * 1024) as usage:
+            response = self.client.get('/doctors/')
+        self.assertEqual(len(response.context['doctors'].object_list), 25)
+        self.assertGreater(usage.peak, 0)
+
+
+class SlowQueryLogTests(HospitalTestMixin, TestCase):
+
+    def setUp(self):
+        SlowQueryLog._explained.clear()
+
+    @contextmanager
+    def logging_every_query(self):
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=0), self.assertLogs('core.slowqueries', 'INFO') as logs:
+            yield logs
+
+    def test_slow_queries_logged_with_plan_once_per_shape(self):
+        with self.logging_every_query() as logs:
+            list(Bill.objects.filter(insurance_provider='Acme'))
+            list(Bill.objects.filter(insurance_provider='Other'))
+            list(Patient.objects.filter(id__in=[self.patient.pk, self.other_patient.pk]))
+            list(Patient.objects.filter(id__in=[self.patient.pk]))
+
+        first, second, third, fourth = logs.records
+        self.assertEqual(first.query_fingerprint, second.query_fingerprint)
+        self.assertEqual(third.query_fingerprint, fourth.query_fingerprint)
+        self.assertIn('SCAN core_bill', first.query_plan)
+        self.assertEqual(second.query_plan, '')
+        self.assertEqual(json.loads(second.query_params), ['Other'])
+        self.assertIn('core/tests.py', first.query_caller)
+        self.assertIn('test_slow_queries_logged_with_plan_once_per_shape', first.query_caller)
+
+    def test_report_ranks_shapes_by_total_time(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'app.log')
+        with self.logging_every_query() as logs:
+            list(Bill.objects.filter(insurance_provider='Acme'))
+            Patient.objects.count()
+        formatter = JsonFormatter()
+        with open(path, 'w') as log:
+            bill, count = logs.records
+            bill.query_ms, count.query_ms = 5.0, 50.0
+            log.write(formatter.format(bill) + '\n')
+            log.write(formatter.format(count) + '\n')
+
+        out = StringIO()
+        call_command('slow_query_report', file=path, stdout=out)
+        report = out.getvalue()
+        self.assertLess(report.index(count.query_fingerprint), report.index(bill.query_fingerprint))
+        self.assertIn('FULL SCAN', report)
+        self.assertIn('2 distinct shapes, 2 slow queries', report)
+
+
+class IndexAdvisorTests(HospitalTestMixin, TestCase):
+
+    def setUp(self):
+        SlowQueryLog._explained.clear()
+
+    @contextmanager
+    def captured(self, entries, caller='core/views.py:1 in view'):
+        """
+        Slow query log entries for the block, as read back from the JSON log
+        """
+        formatter = JsonFormatter()
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=0), self.assertLogs('core.slowqueries', 'INFO') as logs:
+            yield
+        for record in logs.records:
+            record.query_caller = caller
+            entries.append(json.loads(formatter.format(record)))
+
+    def test_query_shape(self):
+        entries = []
+        with self.captured(entries):
+            list(Bill.objects.filter(paid=False, due_date__lt=self.today, patient__in=[self.patient]).order_by('-created_at'))
+            DashboardStats.for_patient(self.patient, self.today)
+        bills = QueryShape(entries[0]['query_statement'])
+        self.assertEqual(bills.equal['core_bill'], ['patient_id'])
+        self.assertEqual(bills.ranges['core_bill'], ['due_date'])
+        self.assertEqual(bills.booleans['core_bill'], [('paid', False)])
+        self.assertEqual(bills.order['core_bill'], [('created_at', True)])
+        # Predicates inside FILTER (WHERE ...) only pick rows for one aggregate
+        aggregate = QueryShape(entries[-1]['query_statement'])
+        self.assertEqual(aggregate.equal['core_bill'], ['patient_id'])
+        self.assertIn('payment_status', aggregate.columns['core_bill'])
+
+    def test_suggests_only_indexes_sqlite_uses(self):
+        entries = []
+        with self.captured(entries):
+            list(Bill.objects.filter(insurance_provider='Acme'))
+            list(Bill.objects.filter(paid=False, due_date__lt=self.today))
+            DashboardStats.for_patient(self.patient, self.today)
+            DashboardStats.for_employee(self.today)
+        with self.captured(entries, caller='core/tests.py:1 in test'):
+            list(Bill.objects.filter(transaction_id='T1'))
+
+        candidates = {candidate.django_index(): candidate for candidate in IndexAdvisor.advise(entries)}
+        self.assertEqual(set(candidates), {
+            "models.Index(fields=['insurance_provider'])",
+            "models.Index(fields=['due_date'], condition=models.Q(paid=False), name='bill_due_da_partial')",
+        })
+        partial = candidates["models.Index(fields=['due_date'], condition=models.Q(paid=False), name='bill_due_da_partial')"]
+        self.assertIn('WHERE NOT "paid"', partial.create_sql('probe'))
+        before, after = partial.plans[0]
+        self.assertIn('SCAN core_bill', before)
+        self.assertIn(IndexAdvisor.PROBE_NAME, ' '.join(after))
+        # Probes are rolled back
+        self.assertNotIn(['due_date'], IndexAdvisor.existing_indexes('core_bill'))
+
+    def test_command_reports_candidates(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'app.log')
+        entries = []
+        with self.captured(entries):
+            list(Bill.objects.filter(insurance_provider='Acme'))
+        with open(path, 'w') as log:
+            log.writelines(json.dumps(entry) + '\n' for entry in entries)
+
+        out = StringIO()
+        call_command('index_advisor', file=path, benchmark=2, stdout=out)
+        report = out.getvalue()
+        self.assertIn("models.Index(fields=['insurance_provider'])", report)
+        self.assertIn('from core/views.py:1', report)
+        self.assertIn('replayed:', report)
+
+    def test_writes_are_explained_not_replayed(self):
+        entries = []
+        with self.captured(entries):
+            Bill.objects.filter(insurance_provider='Acme').update(paid=True)
+            with connection.cursor() as cursor:
+                cursor.execute('DELETE FROM "core_bill" WHERE "core_bill"."insurance_provider" = %s', ['Acme'])
+        # Rows the statements would now change if they were replayed
+        Bill.objects.update(insurance_provider='Acme')
+
+        candidates = IndexAdvisor.advise(entries, repeat=3)
+        self.assertEqual([candidate.django_index() for candidate in candidates], [
+            "models.Index(fields=['insurance_provider'])",
+        ])
+        self.assertEqual(candidates[0].timings, [])
+        self.assertEqual(Bill.objects.count(), 2)
+        self.assertEqual(Bill.objects.filter(paid=True).count(), 1)
+
+
+class SQLiteTuningTests(TestCase):
+
+    def wrapper(self, **options):
+        """
+        A backend connection to a scratch database file
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        wrapper = DatabaseWrapper({
+            **connection.settings_dict, 'NAME': os.path.join(directory, 'tuning.sqlite3'), 'OPTIONS': options
+        }, alias='tuning')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_pragmas_applied_to_new_connections(self):
+        wrapper = self.wrapper(pragmas={
+            'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 1234,
+            'cache_size': -4000, 'temp_store': 'MEMORY',
+        })
+        wrapper.ensure_connection()
+        values = {
+            name: wrapper.connection.execute(f'PRAGMA {name}').fetchone()[0]
+            for name in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'temp_store')
+        }
+        self.assertEqual(values, {
+            'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 1234, 'cache_size': -4000, 'temp_store': 2
+        })
+
+    def test_immediate_transactions_take_the_write_lock_up_front(self):
+        for mode, locked in (('IMMEDIATE', True), (None, False)):
+            wrapper = self.wrapper(**({'transaction_mode': mode} if mode else {}))
+            wrapper.ensure_connection()
+            other = sqlite3.connect(wrapper.settings_dict['NAME'], timeout=0, isolation_level=None)
+            self.addCleanup(other.close)
+            wrapper.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+            try:
+                if locked:
+                    with self.assertRaisesMessage(sqlite3.OperationalError, 'locked'):
+                        other.execute('BEGIN IMMEDIATE')
+                else:
+                    other.execute('BEGIN IMMEDIATE')
+                    other.execute('ROLLBACK')
+            finally:
+                wrapper.rollback()
+                wrapper.set_autocommit(True)
+
+    def test_rejects_invalid_options(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.wrapper(transaction_mode='LAZY').ensure_connection()
+        with self.assertRaises(ImproperlyConfigured):
+            pragma_statements({'journal_mode': 'WAL; DROP TABLE core_bill'})
+        self.assertEqual(pragma_statements({'cache_size': -2000}), ['PRAGMA cache_size = -2000'])
+
+    def test_benchmark_compares_stock_and_configured(self):
+        out = StringIO()
+        call_command('benchmark_sqlite', readers=2, writers=2, seconds=0.3, rows=200, stdout=out)
+        report = out.getvalue()
+        self.assertIn('stock', report)
+        configured = report[report.index('configured\n'):]
+        self.assertIn('locked=0 errors=0', configured)
+        self.assertIn('configured vs stock: reads x', report)
+        self.assertNotIn('sqlite_benchmark', connections.settings)
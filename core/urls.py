@@ -23,6 +23,8 @@ urlpatterns = [
     
     # Admin URLs
     path('admin/dashboard/', views.admin_dashboard, name='admin_dashboard'),
+    path('metrics/', views.metrics, name='metrics'),
+    path('diagnostics/memory/', views.memory_diagnostics, name='memory_diagnostics'),
     path('admin/doctors/', views.manage_doctors, name='manage_doctors'),
     path('admin/employees/', views.manage_employees, name='manage_employees'),
     path('admin/patients/', views.manage_patients, name='manage_patients'),
@@ -42,9 +44,14 @@ urlpatterns = [
     
     # Appointment URLs
     path('appointments/book/', views.book_appointment, name='book_appointment'),
+    path('appointments/first-available/', views.first_available, name='first_available'),
+    path('appointments/bulk/', views.bulk_book_appointments, name='bulk_book_appointments'),
     
     # Patient URLs
     path('patients/search/', views.patient_search, name='patient_search'),
+    path('autocomplete/', views.autocomplete, name='autocomplete'),
+    path('attachments/<int:attachment_id>/download/', views.download_attachment, name='download_attachment'),
+    path('attachments/<int:attachment_id>/preview/<str:variant>/', views.download_attachment, name='attachment_preview'),
     path('patients/<int:patient_id>/', views.patient_detail, name='patient_detail'),
     path('patients/<int:patient_id>/bills/', views.patient_bills, name='patient_bills'),
     path('patients/<int:patient_id>/reports/', views.patient_reports, name='patient_reports'),
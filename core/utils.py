@@ -1,4 +1,3 @@
-import os
 import logging
 import re
 import hashlib
@@ -6,31 +5,75 @@ import secrets
 from datetime import datetime, timedelta
 from typing import Optional, Tuple, Dict, Any
 from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
+from django.core.files.base import File
 from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 from .schemas import FileUpload
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('hospital_management.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+class HashingFile(File):
+    """
+    Wraps an upload so that storage backends reading it through
+    ``chunks()`` also feed a SHA-256 digest and a byte count. Only one chunk
+    is held in memory at a time; exceeding ``max_size`` aborts the write.
+    """
+
+    def __init__(self, file, max_size: int):
+        super().__init__(file, name=getattr(file, 'name', None))
+        self.max_size = max_size
+        self.sha256 = hashlib.sha256()
+        self.bytes_written = 0
+
+    def chunks(self, chunk_size=None):
+        for chunk in self.file.chunks(chunk_size):
+            self.bytes_written += len(chunk)
+            if self.bytes_written > self.max_size:
+                raise ValidationError(_('File exceeds the maximum upload size'))
+            self.sha256.update(chunk)
+            yield chunk
+
+    def read(self, *args, **kwargs):
+        chunk = self.file.read(*args, **kwargs)
+        self.bytes_written += len(chunk)
+        if self.bytes_written > self.max_size:
+            raise ValidationError(_('File exceeds the maximum upload size'))
+        self.sha256.update(chunk)
+        return chunk
+
 class FileHandler:
     ALLOWED_EXTENSIONS = {
         'image/jpeg': '.jpg',
         'image/png': '.png',
         'application/pdf': '.pdf'
     }
+
+    # Leading bytes that identify each allowed type
+    MAGIC_NUMBERS = {
+        'image/jpeg': (b'\xff\xd8\xff',),
+        'image/png': (b'\x89PNG\r\n\x1a\n',),
+        'application/pdf': (b'%PDF-',),
+    }
+    MAGIC_LENGTH = 8
     
-    MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
+    MAX_FILE_SIZE = getattr(settings, 'FILE_UPLOAD_MAX_SIZE', 50 * 1024 * 1024)
+
+    @staticmethod
+    def sniff_type(file) -> Optional[str]:
+        """
+        Detect the content type from the first bytes of the upload
+        """
+        for chunk in file.chunks():
+            head = chunk[:FileHandler.MAGIC_LENGTH]
+            break
+        else:
+            return None
+        for content_type, signatures in FileHandler.MAGIC_NUMBERS.items():
+            if any(head.startswith(signature) for signature in signatures):
+                return content_type
+        return None
     
     @staticmethod
     def validate_file(file, file_data: FileUpload) -> Tuple[bool, str]:
@@ -45,6 +88,10 @@ class FileHandler:
             # Validate file type
             if file_data.file_type not in FileHandler.ALLOWED_EXTENSIONS:
                 return False, f"Unsupported file type: {file_data.file_type}"
+
+            # Check the content matches the declared type
+            if FileHandler.sniff_type(file) != file_data.file_type:
+                return False, f"File content does not match declared type {file_data.file_type}"
             
             # Validate file name
             if not re.match(r'^[a-zA-Z0-9_-]+$', file_data.file_name):
@@ -70,27 +117,67 @@ class FileHandler:
             if not is_valid:
                 return False, message
             
-            # Generate unique filename
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            extension = FileHandler.ALLOWED_EXTENSIONS.get(file_data.file_type)
-            filename = f"{timestamp}_{file_data.file_name}{extension}"
-            file_path = os.path.join(directory, filename)
-            
-            # Save file
-            path = default_storage.save(file_path, ContentFile(file.read()))
-            logger.info(f"File saved successfully: {path}")
-            return True, path
+            # Stream into the content-addressed store; identical content is kept once,
+            # and the caller holds a reference until delete_file()
+            from .filestore import ContentStore
+            with transaction.atomic():
+                blob = ContentStore.put(file, file_data.file_type, directory)
+                ContentStore.retain(blob)
+            logger.info(f"File saved successfully: {blob.path} ({blob.size} bytes, sha256 {blob.sha256})")
+            # Thumbnails are rendered off the request path once the blob row is committed.
+            # Outside a transaction this runs right away, and the upload is stored and
+            # referenced by then: a scheduling failure must not report it as failed
+            from .previews import PreviewPool
+
+            def schedule_previews():
+                try:
+                    PreviewPool.submit(blob.path, blob.content_type)
+                except Exception as e:
+                    logger.warning(f"Could not schedule previews for {blob.path}: {str(e)}")
+
+            transaction.on_commit(schedule_previews)
+            return True, blob.path
             
         except Exception as e:
             logger.error(f"Error saving file: {str(e)}")
             return False, str(e)
     
+    @staticmethod
+    def stream_to_storage(file, file_path: str) -> Tuple[str, str, int]:
+        """
+        Write ``file`` to ``default_storage`` without reading it into memory;
+        returns ``(path, sha256_hex, size)``
+        """
+        stream = HashingFile(file, FileHandler.MAX_FILE_SIZE)
+        path = default_storage.get_available_name(file_path)
+        try:
+            path = default_storage.save(path, stream)
+        except Exception:
+            # Don't leave a partial file behind
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            raise
+        return path, stream.sha256.hexdigest(), stream.bytes_written
+
     @staticmethod
     def delete_file(file_path: str) -> Tuple[bool, str]:
         """
         Delete a file with proper error handling
         """
         try:
+            # Content-addressed blobs are shared: release this reference, the file goes with the last one
+            from .filestore import ContentStore
+            from .models import StoredFile
+            blob = StoredFile.objects.filter(path=file_path).first()
+            if blob is not None:
+                remaining = ContentStore.release(blob.pk)
+                if remaining is None:
+                    return False, f"File is still referenced by {blob.ref_count} attachment(s)"
+                if remaining:
+                    return True, f"Reference released; file kept for {remaining} other reference(s)"
+                logger.info(f"File deleted successfully: {file_path}")
+                return True, "File deleted successfully"
+
             if default_storage.exists(file_path):
                 default_storage.delete(file_path)
                 logger.info(f"File deleted successfully: {file_path}")
@@ -121,10 +208,10 @@ class ErrorHandler:
         # Get user-friendly message
         user_message = ErrorHandler.ERROR_TYPES.get(error_type, 'An unexpected error occurred')
         
-        # Log the error with stack trace
+        # Expected failures are logged without a stack trace; only unexpected ones need it
         logger.error(
             f"Error in {context if context else 'unknown context'}: {error_type} - {error_message}",
-            exc_info=True
+            exc_info=error_type not in ErrorHandler.ERROR_TYPES
         )
         
         # Return error response
@@ -262,14 +349,19 @@ class SecurityHandler:
             if not request.session.session_key:
                 return False
             
+            now = datetime.now()
+            last_activity = None
+
             # Check session expiry
             if 'last_activity' in request.session:
                 last_activity = datetime.fromisoformat(request.session['last_activity'])
-                if datetime.now() - last_activity > timedelta(minutes=settings.SESSION_COOKIE_AGE):
+                if now - last_activity > timedelta(minutes=settings.SESSION_COOKIE_AGE):
                     return False
             
-            # Update last activity
-            request.session['last_activity'] = datetime.now().isoformat()
+            # Update last activity, coarsely so the session is not rewritten on every request
+            threshold = getattr(settings, 'SESSION_EXPIRY_WRITE_THRESHOLD', 300)
+            if last_activity is None or (now - last_activity).total_seconds() >= threshold:
+                request.session['last_activity'] = now.isoformat()
             return True
             
         except Exception as e:
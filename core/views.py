@@ -4,66 +4,77 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.contrib.auth.models import User
 from django.utils import timezone
-from django.db.models import Q, Count, Sum
+from django.db.models import Q, Count
 from django.core.exceptions import PermissionDenied, ValidationError
 from django.core.validators import validate_email
 from django.db import transaction
-from django.http import JsonResponse, HttpResponseForbidden
+from django.http import HttpResponse, JsonResponse, HttpResponseForbidden
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_protect
-from django.core.paginator import Paginator
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_control
 from django.views.decorators.vary import vary_on_cookie
-from .models import Patient, Doctor, Appointment, MedicalRecord, Bill, Employee, AdminProfile
+from .models import (
+    Patient, Doctor, Appointment, MedicalRecord, Bill, Employee, AdminProfile, DoctorAvailability, Attachment
+)
 from datetime import datetime, timedelta, date
+import json
 import logging
 import re
 from .schemas import PatientCreate, DoctorCreate, EmployeeCreate
 from .utils import ErrorHandler, DatabaseHandler, SecurityHandler
+from .stats import DashboardStats
+from .scheduling import SlotEngine
+from .booking import BookingService, BulkBookingService
+from .ratelimit import RateLimiter
+from .roles import RoleResolver
+from .pagination import KeysetPaginator
+from .search import SearchIndex
+from .autocomplete import PrefixIndex
+from .downloads import AttachmentServer
+from .metrics import RequestMetrics
+from .memory import MemoryTracer
 from functools import wraps
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm
 
 logger = logging.getLogger(__name__)
 
 def rate_limit(limit=5, period=60):
-    """Rate limiting decorator"""
+    """Rate limiting decorator, keyed by client IP and username"""
     def decorator(view_func):
+        scope = f'{view_func.__module__}.{view_func.__name__}'
+
         @wraps(view_func)
         def wrapped_view(request, *args, **kwargs):
-            if not hasattr(request, 'session'):
-                request.session = {}
-
-            now = timezone.now().isoformat()
-            key = f'rate_limit_{view_func.__name__}'
-
-            if key in request.session:
-                last_time_str, count = request.session[key]
-                last_time = datetime.fromisoformat(last_time_str)
-                if (datetime.fromisoformat(now) - last_time).seconds < period:
-                    if count >= limit:
-                        return HttpResponseForbidden('Rate limit exceeded')
-                    request.session[key] = (last_time_str, count + 1)
-                else:
-                    request.session[key] = (now, 1)
-            else:
-                request.session[key] = (now, 1)
+            allowed, retry_after = RateLimiter.hit(scope, RateLimiter.identity(request), limit, period)
+            if not allowed:
+                response = HttpResponseForbidden('Rate limit exceeded')
+                response['Retry-After'] = str(retry_after)
+                return response
 
             return view_func(request, *args, **kwargs)
         return wrapped_view
     return decorator
 
 def is_admin(user):
-    return hasattr(user, 'adminprofile')
+    return RoleResolver.has(user, 'adminprofile')
 
 def is_doctor(user):
-    return hasattr(user, 'doctor')
+    return RoleResolver.has(user, 'doctor')
 
 def is_patient(user):
-    return hasattr(user, 'patient')
+    return RoleResolver.has(user, 'patient')
 
 def is_employee(user):
-    return hasattr(user, 'employee')
+    return RoleResolver.has(user, 'employee')
+
+def is_front_desk(user):
+    return is_employee(user) or is_admin(user)
+
+def posted_id(request, field):
+    """The primary key posted in ``field``, or None if it is missing or not a number"""
+    value = request.POST.get(field, '').strip()
+    return int(value) if value.isdigit() else None
 
 def validate_phone_number(phone):
     if not re.match(r'^[0-9]{10}$', phone):
@@ -301,71 +312,34 @@ def dashboard(request):
         if hasattr(request.user, 'patient'):
             # Patient Dashboard
             patient = request.user.patient
-            context.update({
-                'upcoming_appointments_count': Appointment.objects.filter(
-                    patient=patient,
-                    appointment_date__gte=today,
-                    status='SCHEDULED'
-                ).count(),
-                'medical_records_count': MedicalRecord.objects.filter(patient=patient).count(),
-                'pending_bills_count': Bill.objects.filter(
-                    patient=patient,
-                    payment_status='PENDING'
-                ).count(),
-                'total_bills_count': Bill.objects.filter(patient=patient).count(),
-                'recent_appointments': Appointment.objects.filter(
-                    patient=patient
-                ).order_by('-appointment_date', '-appointment_time')[:5]
-            })
+            context.update(DashboardStats.for_patient(patient, today))
+            context['recent_appointments'] = Appointment.objects.filter(
+                patient=patient
+            ).select_related('doctor__user').order_by('-appointment_date', '-appointment_time')[:5]
 
         elif hasattr(request.user, 'doctor'):
             # Doctor Dashboard
             doctor = request.user.doctor
-            context.update({
-                'today_appointments_count': Appointment.objects.filter(
-                    doctor=doctor,
-                    appointment_date=today,
-                    status='SCHEDULED'
-                ).count(),
-                'total_patients_count': Patient.objects.filter(
-                    appointment__doctor=doctor
-                ).distinct().count(),
-                'medical_records_count': MedicalRecord.objects.filter(doctor=doctor).count(),
-                'today_appointments': Appointment.objects.filter(
-                    doctor=doctor,
-                    appointment_date=today
-                ).order_by('appointment_time')
-            })
+            context.update(DashboardStats.for_doctor(doctor, today))
+            context['today_appointments'] = Appointment.objects.filter(
+                doctor=doctor,
+                appointment_date=today
+            ).select_related('patient__user').order_by('appointment_time')
 
         elif hasattr(request.user, 'employee'):
             # Employee Dashboard
+            stats = DashboardStats.for_employee(today)
             context.update({
-                'today_appointments_count': Appointment.objects.filter(
-                    appointment_date=today,
-                    status='SCHEDULED'
-                ).count(),
-                'pending_bills_count': Bill.objects.filter(
-                    payment_status='PENDING'
-                ).count(),
-                'total_patients_count': Patient.objects.count(),
-                'total_doctors_count': Doctor.objects.count(),
+                'today_appointments_count': stats['today_appointments_count'],
+                'pending_bills_count': stats['pending_bills_count'],
+                'total_patients_count': stats['total_patients'],
+                'total_doctors_count': stats['total_doctors'],
                 'recent_activities': []  # You can implement an activity log system later
             })
 
         elif hasattr(request.user, 'adminprofile'):
             # Admin Dashboard
-            context.update({
-                'total_users_count': User.objects.count(),
-                'total_doctors_count': Doctor.objects.count(),
-                'total_patients_count': Patient.objects.count(),
-                'total_employees_count': Employee.objects.count(),
-                'total_appointments_count': Appointment.objects.count(),
-                'total_medical_records_count': MedicalRecord.objects.count(),
-                'total_bills_count': Bill.objects.count(),
-                'total_revenue': Bill.objects.filter(
-                    payment_status='PAID'
-                ).aggregate(total=Sum('amount'))['total'] or 0
-            })
+            context.update(DashboardStats.for_admin_summary())
 
         return render(request, 'core/dashboard.html', context)
 
@@ -451,66 +425,6 @@ def profile_view(request):
             'error_details': str(e)
         })
 
-@login_required
-@user_passes_test(is_patient)
-def book_appointment(request):
-    try:
-        if request.method == 'POST':
-            try:
-                doctor = get_object_or_404(Doctor, id=request.POST['doctor'])
-                appointment_date = request.POST['appointment_date']
-                appointment_time = request.POST['appointment_time']
-                reason = request.POST['reason']
-
-                # Validate appointment date
-                if datetime.strptime(appointment_date, '%Y-%m-%d').date() < timezone.now().date():
-                    messages.error(request, 'Cannot book appointments for past dates')
-                    return redirect('book_appointment')
-
-                # Check if doctor is available
-                if not doctor.is_available:
-                    messages.error(request, 'Doctor is not available at the moment')
-                    return redirect('book_appointment')
-
-                # Check if time slot is available
-                if Appointment.objects.filter(
-                    doctor=doctor,
-                    appointment_date=appointment_date,
-                    appointment_time=appointment_time,
-                    status__in=['PENDING', 'CONFIRMED']
-                ).exists():
-                    messages.error(request, 'This time slot is already booked')
-                    return redirect('book_appointment')
-
-                Appointment.objects.create(
-                    patient=request.user.patient,
-                    doctor=doctor,
-                    appointment_date=appointment_date,
-                    appointment_time=appointment_time,
-                    reason=reason
-                )
-
-                messages.success(request, 'Appointment booked successfully')
-                return redirect('dashboard')
-            except Exception as e:
-                logger.error(f"Appointment booking error: {str(e)}")
-                return render(request, 'core/error.html', {
-                    'error_title': 'Booking Error',
-                    'error_message': 'Failed to book appointment.',
-                    'error_details': str(e)
-                })
-
-        doctors = Doctor.objects.filter(is_available=True)
-        return render(request, 'core/book_appointment.html', {'doctors': doctors})
-    
-    except Exception as e:
-        logger.error(f"Book appointment error: {str(e)}")
-        return render(request, 'core/error.html', {
-            'error_title': 'Appointment Error',
-            'error_message': 'An error occurred while accessing the booking page.',
-            'error_details': str(e)
-        })
-
 @login_required
 def medical_records(request):
     try:
@@ -563,7 +477,7 @@ def appointments(request):
 def patients(request):
     try:
         patients = Patient.objects.filter(
-            appointment__doctor=request.user.doctor
+            appointments__doctor=request.user.doctor
         ).distinct()
         
         return render(request, 'core/patients.html', {'patients': patients})
@@ -693,66 +607,65 @@ def appointment_detail(request, appointment_id):
 
 @login_required
 @user_passes_test(is_admin)
-def admin_dashboard(request):
+def metrics(request):
+    """Per-view request histograms for this process, in the Prometheus text format"""
+    return HttpResponse(RequestMetrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@login_required
+@user_passes_test(is_admin)
+@require_http_methods(['GET', 'POST'])
+def memory_diagnostics(request):
+    """
+    tracemalloc control for the worker that answers: POST ``action`` =
+    start/stop/snapshot; GET returns the top allocation sites (now or of
+    ``?snapshot=``) or, with ``?diff=<label>[&to=<label>]``, the growth
+    between two snapshots
+    """
+    params = request.POST if request.method == 'POST' else request.GET
     try:
-        # Get date range for analytics
-        end_date = timezone.now().date()
-        start_date = end_date - timedelta(days=30)
+        limit = max(1, min(int(params.get('limit', 20)), 200))
+        frames = int(params.get('frames', MemoryTracer.DEFAULT_FRAMES))
+    except ValueError:
+        return JsonResponse({'error': 'limit and frames must be integers'}, status=400)
+    key_type = params.get('group', 'lineno')
+    if key_type not in MemoryTracer.KEY_TYPES:
+        return JsonResponse({'error': f"group must be one of {', '.join(MemoryTracer.KEY_TYPES)}"}, status=400)
 
-        context = {
-            # Basic Statistics
-            'total_patients': Patient.objects.count(),
-            'total_doctors': Doctor.objects.count(),
-            'total_employees': Employee.objects.count(),
-            'total_appointments': Appointment.objects.count(),
-            'total_bills': Bill.objects.count(),
-            'revenue': Bill.objects.filter(payment_status='PAID').aggregate(
-                total=Sum('amount')
-            )['total'] or 0,
+    try:
+        if request.method == 'POST':
+            action = request.POST.get('action')
+            if action == 'start':
+                MemoryTracer.start(frames)
+            elif action == 'stop':
+                MemoryTracer.stop()
+            elif action == 'snapshot':
+                MemoryTracer.snapshot(request.POST.get('label') or timezone.now().isoformat(timespec='seconds'))
+            else:
+                return JsonResponse({'error': 'action must be start, stop or snapshot'}, status=400)
 
+        data = MemoryTracer.status()
+        data['snapshots'] = MemoryTracer.labels()
+        if request.method == 'GET' and MemoryTracer.tracing():
+            if request.GET.get('diff'):
+                data['diff'] = MemoryTracer.diff(request.GET['diff'], request.GET.get('to') or None, limit, key_type)
+            else:
+                data['top'] = MemoryTracer.top(request.GET.get('snapshot') or None, limit, key_type)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(data)
+
+@login_required
+@user_passes_test(is_admin)
+def admin_dashboard(request):
+    try:
+        context = DashboardStats.for_admin()
+        context.update({
             # Recent Activity
-            'recent_appointments': Appointment.objects.all().order_by('-created_at')[:5],
-            'recent_bills': Bill.objects.all().order_by('-created_at')[:5],
-
-            # Analytics Data
-            'patient_stats': {
-                'new_patients': Patient.objects.filter(
-                    user__date_joined__date__range=[start_date, end_date]
-                ).count(),
-                'active_patients': Patient.objects.filter(
-                    appointment__appointment_date__range=[start_date, end_date]
-                ).distinct().count(),
-            },
-            'appointment_stats': {
-                'scheduled': Appointment.objects.filter(
-                    appointment_date__range=[start_date, end_date],
-                    status='SCHEDULED'
-                ).count(),
-                'completed': Appointment.objects.filter(
-                    appointment_date__range=[start_date, end_date],
-                    status='COMPLETED'
-                ).count(),
-                'cancelled': Appointment.objects.filter(
-                    appointment_date__range=[start_date, end_date],
-                    status='CANCELLED'
-                ).count(),
-            },
-            'revenue_stats': {
-                'total': Bill.objects.filter(
-                    created_at__date__range=[start_date, end_date],
-                    payment_status='PAID'
-                ).aggregate(total=Sum('amount'))['total'] or 0,
-                'pending': Bill.objects.filter(
-                    created_at__date__range=[start_date, end_date],
-                    payment_status='PENDING'
-                ).aggregate(total=Sum('amount'))['total'] or 0,
-            },
-            'staff_stats': {
-                'doctors': Doctor.objects.filter(is_available=True).count(),
-                'nurses': Employee.objects.filter(position='NURSE').count(),
-                'technicians': Employee.objects.filter(position='TECHNICIAN').count(),
-            },
-        }
+            'recent_appointments': Appointment.objects.select_related(
+                'patient__user', 'doctor__user'
+            ).order_by('-created_at')[:5],
+            'recent_bills': Bill.objects.select_related('patient__user').order_by('-created_at')[:5],
+        })
 
         return render(request, 'core/admin/dashboard.html', context)
     except Exception as e:
@@ -764,7 +677,7 @@ def admin_dashboard(request):
 @user_passes_test(is_admin)
 def manage_doctors(request):
     try:
-        doctors = Doctor.objects.all().select_related('user')
+        doctors = KeysetPaginator(Doctor.objects.all().select_related('user')).get_page(request.GET)
         context = {
             'doctors': doctors,
             'title': 'Manage Doctors'
@@ -779,7 +692,7 @@ def manage_doctors(request):
 @user_passes_test(is_admin)
 def manage_employees(request):
     try:
-        employees = Employee.objects.all().select_related('user')
+        employees = KeysetPaginator(Employee.objects.all().select_related('user')).get_page(request.GET)
         context = {
             'employees': employees,
             'title': 'Manage Staff'
@@ -794,7 +707,7 @@ def manage_employees(request):
 @user_passes_test(is_admin)
 def manage_patients(request):
     try:
-        patients = Patient.objects.all().select_related('user')
+        patients = KeysetPaginator(Patient.objects.all().select_related('user')).get_page(request.GET)
         context = {
             'patients': patients,
             'title': 'Manage Patients'
@@ -967,17 +880,16 @@ def delete_user(request, user_type, user_id):
 def employee_dashboard(request):
     try:
         today = timezone.now().date()
+        stats = DashboardStats.for_employee(today)
         context = {
             'today_appointments': Appointment.objects.filter(
                 appointment_date=today
-            ).order_by('appointment_time'),
-            'total_appointments': Appointment.objects.count(),
-            'total_patients': Patient.objects.count(),
-            'total_doctors': Doctor.objects.count(),
-            'pending_bills': Bill.objects.filter(paid=False).count(),
-            'total_revenue': Bill.objects.filter(paid=True).aggregate(
-                total=Sum('amount')
-            )['total'] or 0,
+            ).select_related('patient__user', 'doctor__user').order_by('appointment_time'),
+            'total_appointments': stats['total_appointments'],
+            'total_patients': stats['total_patients'],
+            'total_doctors': stats['total_doctors'],
+            'pending_bills': stats['pending_bills'],
+            'total_revenue': stats['total_revenue'],
         }
         return render(request, 'core/employee/dashboard.html', context)
     except Exception as e:
@@ -989,7 +901,7 @@ def employee_dashboard(request):
 @user_passes_test(is_employee)
 def manage_appointments_employee(request):
     try:
-        appointments = Appointment.objects.all().select_related('patient', 'doctor')
+        appointments = Appointment.objects.all().select_related('patient__user', 'doctor__user')
         if request.method == 'POST':
             appointment_id = request.POST.get('appointment_id')
             action = request.POST.get('action')
@@ -1010,6 +922,7 @@ def manage_appointments_employee(request):
             
             return redirect('manage_appointments_employee')
         
+        appointments = KeysetPaginator(appointments).get_page(request.GET)
         return render(request, 'core/employee/manage_appointments.html', {'appointments': appointments})
     except Exception as e:
         logger.error(f"Manage appointments error: {str(e)}")
@@ -1020,7 +933,7 @@ def manage_appointments_employee(request):
 @user_passes_test(is_employee)
 def manage_bills_employee(request):
     try:
-        bills = Bill.objects.all().select_related('patient')
+        bills = Bill.objects.all().select_related('patient__user')
         if request.method == 'POST':
             bill_id = request.POST.get('bill_id')
             action = request.POST.get('action')
@@ -1036,6 +949,7 @@ def manage_bills_employee(request):
             
             return redirect('manage_bills_employee')
         
+        bills = KeysetPaginator(bills, ordering=['-created_at']).get_page(request.GET)
         return render(request, 'core/employee/manage_bills.html', {'bills': bills})
     except Exception as e:
         logger.error(f"Manage bills error: {str(e)}")
@@ -1047,10 +961,13 @@ def manage_bills_employee(request):
 def create_bill(request):
     try:
         if request.method == 'POST':
-            patient_id = request.POST.get('patient')
+            patient_id = posted_id(request, 'patient')
             amount = request.POST.get('amount')
             description = request.POST.get('description')
-            
+            if patient_id is None:
+                messages.error(request, 'Please choose a patient from the suggestions.')
+                return render(request, 'core/employee/create_bill.html')
+
             patient = get_object_or_404(Patient, id=patient_id)
             
             Bill.objects.create(
@@ -1063,8 +980,7 @@ def create_bill(request):
             messages.success(request, 'Bill created successfully')
             return redirect('manage_bills_employee')
         
-        patients = Patient.objects.all()
-        return render(request, 'core/employee/create_bill.html', {'patients': patients})
+        return render(request, 'core/employee/create_bill.html')
     except Exception as e:
         logger.error(f"Create bill error: {str(e)}")
         messages.error(request, 'An error occurred while creating the bill.')
@@ -1074,7 +990,7 @@ def create_bill(request):
 @user_passes_test(is_employee)
 def patient_records(request):
     try:
-        patients = Patient.objects.all().select_related('user')
+        patients = KeysetPaginator(Patient.objects.all().select_related('user')).get_page(request.GET)
         return render(request, 'core/employee/patient_records.html', {'patients': patients})
     except Exception as e:
         logger.error(f"Patient records error: {str(e)}")
@@ -1085,7 +1001,9 @@ def patient_records(request):
 @user_passes_test(is_employee)
 def doctor_schedule(request):
     try:
-        doctors = Doctor.objects.filter(is_available=True).select_related('user')
+        doctors = DoctorAvailability.attach(
+            Doctor.objects.filter(is_available=True).select_related('user', 'availability')
+        )
         return render(request, 'core/employee/doctor_schedule.html', {'doctors': doctors})
     except Exception as e:
         logger.error(f"Doctor schedule error: {str(e)}")
@@ -1094,7 +1012,10 @@ def doctor_schedule(request):
 
 @login_required
 def doctor_profiles(request):
-    doctors = Doctor.objects.all().select_related('user')
+    doctors = KeysetPaginator(
+        Doctor.objects.all().select_related('user', 'availability')
+    ).get_page(request.GET)
+    DoctorAvailability.attach(doctors)
     return render(request, 'core/doctor/profiles.html', {
         'doctors': doctors
     })
@@ -1108,7 +1029,7 @@ def doctor_detail(request, doctor_id):
 
 @login_required
 def employee_list(request):
-    employees = Employee.objects.all().select_related('user')
+    employees = KeysetPaginator(Employee.objects.all().select_related('user')).get_page(request.GET)
     return render(request, 'core/employee/list.html', {
         'employees': employees
     })
@@ -1150,10 +1071,14 @@ def employee_delete(request, employee_id):
     })
 
 @login_required
+@user_passes_test(is_patient)
 def book_appointment(request):
     if request.method == 'POST':
         # Handle appointment booking
-        doctor_id = request.POST.get('doctor')
+        doctor_id = posted_id(request, 'doctor')
+        if doctor_id is None:
+            messages.error(request, 'Please choose a doctor from the suggestions.')
+            return render(request, 'core/appointment/book.html')
         appointment_date = request.POST.get('appointment_date')
         appointment_time = request.POST.get('appointment_time')
         reason = request.POST.get('reason')
@@ -1161,7 +1086,7 @@ def book_appointment(request):
         doctor = get_object_or_404(Doctor, id=doctor_id)
         patient = request.user.patient
         
-        appointment = Appointment.objects.create(
+        appointment = Appointment(
             patient=patient,
             doctor=doctor,
             appointment_date=appointment_date,
@@ -1169,13 +1094,135 @@ def book_appointment(request):
             reason=reason,
             created_by=request.user
         )
+        try:
+            # Validates, then locks the doctor and checks overlaps before inserting
+            booked, conflicts = BookingService.book(appointment)
+        except ValidationError as e:
+            messages.error(request, ' '.join(e.messages))
+            return redirect('book_appointment')
+        if conflicts:
+            taken = ', '.join(f"{c['start']}-{c['end']}" for c in conflicts)
+            messages.error(request, f'This time slot overlaps an existing booking ({taken}).')
+            return redirect('book_appointment')
         messages.success(request, 'Appointment booked successfully.')
         return redirect('appointment_detail', appointment_id=appointment.id)
     
-    doctors = Doctor.objects.filter(is_available=True)
-    return render(request, 'core/appointment/book.html', {
-        'doctors': doctors
-    })
+    return render(request, 'core/appointment/book.html')
+
+@login_required
+def first_available(request):
+    """Earliest free slots across all available doctors of a specialization"""
+    wants_json = request.GET.get('format') == 'json'
+    specialization = request.GET.get('specialization', '')
+    context = {
+        'specializations': Doctor.SPECIALIZATION_CHOICES,
+        'specialization': specialization,
+        'results': [],
+    }
+
+    if specialization:
+        try:
+            if specialization not in dict(Doctor.SPECIALIZATION_CHOICES):
+                raise ValidationError('Invalid specialization')
+            start_date = SlotEngine.as_date(request.GET.get('start_date') or timezone.localdate())
+            days = min(max(int(request.GET.get('days', 14)), 1), 60)
+            limit = min(max(int(request.GET.get('limit', 10)), 1), 50)
+            end_date = start_date + timedelta(days=days - 1)
+            context['results'] = SlotEngine.first_available(specialization, start_date, end_date, limit)
+        except (ValueError, ValidationError) as e:
+            if wants_json:
+                return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+            messages.error(request, str(e))
+
+    if wants_json:
+        return JsonResponse({
+            'specialization': specialization,
+            'slots': [
+                {
+                    'doctor_id': slot['doctor'].id,
+                    'doctor_name': f"Dr. {slot['doctor'].user.get_full_name()}",
+                    'date': slot['date'].isoformat(),
+                    'time': slot['time'].strftime('%H:%M'),
+                }
+                for slot in context['results']
+            ],
+        })
+    return render(request, 'core/appointment/first_available.html', context)
+
+@login_required
+@user_passes_test(is_front_desk)
+@require_http_methods(['POST'])
+def bulk_book_appointments(request):
+    """
+    Book or reschedule many appointments from a JSON body:
+    {"appointments": [...], "all_or_nothing": false}
+    """
+    try:
+        payload = json.loads(request.body)
+        items = payload['appointments']
+        if not isinstance(items, list):
+            raise TypeError('appointments must be a list')
+    except (ValueError, KeyError, TypeError) as e:
+        return JsonResponse({'status': 'error', 'message': f'Invalid request body: {str(e)}'}, status=400)
+
+    try:
+        summary = BulkBookingService.process(
+            items,
+            created_by=request.user,
+            all_or_nothing=bool(payload.get('all_or_nothing'))
+        )
+    except ValidationError as e:
+        return JsonResponse({'status': 'error', 'message': ' '.join(e.messages)}, status=400)
+    except Exception as e:
+        return JsonResponse(ErrorHandler.handle_error(e, 'bulk_book_appointments'), status=500)
+
+    return JsonResponse(summary)
+
+@login_required
+@require_http_methods(['GET'])
+def autocomplete(request):
+    """Typeahead lookup of doctors and, for staff, patients"""
+    kind = request.GET.get('type')
+    if kind is not None and kind not in PrefixIndex.KINDS:
+        return JsonResponse({'status': 'error', 'message': 'Unknown type'}, status=400)
+
+    can_see_patients = is_doctor(request.user) or is_front_desk(request.user)
+    if kind == 'patient' and not can_see_patients:
+        raise PermissionDenied
+    kinds = (kind,) if kind else PrefixIndex.KINDS if can_see_patients else ('doctor',)
+
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), 25))
+    except ValueError:
+        limit = 10
+
+    results = [
+        dict(item) for item in PrefixIndex.search(
+            request.GET.get('q', ''), kinds, limit,
+            available_only=request.GET.get('available') == '1'
+        )
+    ]
+    doctor_ids = [item['id'] for item in results if item['type'] == 'doctor']
+    if doctor_ids:
+        next_free = dict(DoctorAvailability.objects.filter(
+            doctor_id__in=doctor_ids
+        ).values_list('doctor_id', 'next_free_datetime'))
+        for item in results:
+            if item['type'] == 'doctor':
+                item['next_free'] = next_free.get(item['id'])
+    return JsonResponse({'results': results})
+
+@login_required
+@require_http_methods(['GET', 'HEAD'])
+def download_attachment(request, attachment_id, variant=None):
+    """Permission-checked attachment download or preview; the transfer itself may be offloaded"""
+    attachment = get_object_or_404(
+        Attachment.objects.select_related('blob', 'medical_record__doctor', 'medical_record__patient', 'lab_test'),
+        pk=attachment_id
+    )
+    if not AttachmentServer.can_view(request.user, attachment):
+        raise PermissionDenied
+    return AttachmentServer.serve(request, attachment, variant)
 
 @login_required
 def patient_search(request):
@@ -1186,7 +1233,17 @@ def patient_search(request):
             return redirect('patient_detail', patient_id=patient.id)
         except Patient.DoesNotExist:
             messages.error(request, 'Patient not found.')
-    return render(request, 'core/patient/search.html')
+
+    query = request.GET.get('q', '').strip()
+    context = {'query': query}
+    if query:
+        if not (is_doctor(request.user) or is_front_desk(request.user)):
+            raise PermissionDenied
+        context['patients'] = SearchIndex.search_patients(query)
+        context['records'] = [
+            record for record in SearchIndex.search_records(query) if record.visible_to(request.user)
+        ]
+    return render(request, 'core/patient/search.html', context)
 
 @login_required
 def patient_detail(request, patient_id):
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
+import tempfile
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -52,6 +54,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "core.metrics.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -60,13 +63,15 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "core.profiling.ProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "hospitalmanagement.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # DjangoTemplates with render time reported to core.metrics
+        "BACKEND": "core.metrics.TimedTemplates",
         "DIRS": [os.path.join(BASE_DIR, 'templates')],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -82,14 +87,49 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "hospitalmanagement.wsgi.application"
 
+# Send each request's db/template/total time to the browser (Server-Timing).
+# It reveals backend timings, so it is off unless DEBUG is on
+SERVER_TIMING = os.getenv('SERVER_TIMING', str(DEBUG)) == 'True'
+
+# Opt-in profiling (core.profiling): admins add X-Profile: 1 or ?profile=1
+# (or =sample), and/or one request in PROFILING_SAMPLE_RATE is profiled.
+# Summarise the output with `manage.py profile_report`.
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False') == 'True'
+PROFILING_SAMPLE_RATE = int(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_MODE = os.getenv('PROFILING_MODE', 'cprofile')
+PROFILING_DIR = os.getenv('PROFILING_DIR', os.path.join(BASE_DIR, 'profiles'))
+
+# Queries slower than this (ms) are logged with their plan to core.slowqueries;
+# `manage.py slow_query_report` ranks them. Empty disables the wrapper.
+_slow_query_ms = os.getenv('SLOW_QUERY_THRESHOLD_MS', '100')
+SLOW_QUERY_THRESHOLD_MS = float(_slow_query_ms) if _slow_query_ms else None
+SLOW_QUERY_LOG_PARAMS = os.getenv('SLOW_QUERY_LOG_PARAMS', 'True') == 'True'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# core.backends.sqlite3 applies OPTIONS["pragmas"] to every new connection and
+# BEGINs atomic() blocks in OPTIONS["transaction_mode"]. IMMEDIATE takes the
+# write lock up front, so concurrent writers queue on busy_timeout instead of
+# failing with "database is locked". Compare with `manage.py benchmark_sqlite`.
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
+        "ENGINE": "core.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "CONN_MAX_AGE": int(os.getenv('DB_CONN_MAX_AGE', '600')),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "transaction_mode": os.getenv('SQLITE_TRANSACTION_MODE', 'IMMEDIATE'),
+            "pragmas": {
+                "journal_mode": os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+                "synchronous": os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+                "busy_timeout": int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+                "mmap_size": int(os.getenv('SQLITE_MMAP_SIZE', str(128 * 1024 * 1024))),
+                "cache_size": int(os.getenv('SQLITE_CACHE_SIZE', '-20000')),  # negative: KiB
+                "temp_store": os.getenv('SQLITE_TEMP_STORE', 'MEMORY'),
+            },
+        },
     }
 }
 
@@ -145,6 +185,9 @@ CRISPY_ALLOWED_TEMPLATE_PACKS = "tailwind"
 CRISPY_TEMPLATE_PACK = "tailwind"
 
 # Authentication
+# RoleBackend loads the user's patient/doctor/employee/admin profile in the
+# same query as the user, so role checks are free for the rest of the request
+AUTHENTICATION_BACKENDS = ['core.roles.RoleBackend']
 LOGIN_REDIRECT_URL = 'dashboard'
 LOGOUT_REDIRECT_URL = 'login'
 LOGIN_URL = 'login'
@@ -158,36 +201,53 @@ EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
 
 # Logging Configuration
+# Test runs log to a scratch file, not the application log or the console
+TESTING = sys.argv[1:2] == ['test']
+LOG_FILE = os.getenv('LOG_FILE', os.path.join(
+    tempfile.gettempdir() if TESTING else BASE_DIR, 'hospital_management.log'
+))
+
+# Request threads only enqueue log records; one listener thread per process
+# appends them as JSON lines to LOG_FILE (see core.logqueue). Rotate it with
+# logrotate (without copytruncate); workers reopen the file once it is moved.
+# Warnings and errors are capped per logger per minute so a failure storm
+# cannot saturate the disk.
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
-    'formatters': {
-        'verbose': {
-            'format': '{levelname} {asctime} {module} {process:d} {thread:d} {message}',
-            'style': '{',
+    'filters': {
+        'sampling': {
+            '()': 'core.logqueue.SamplingFilter',
+            'rates': {
+                '': int(os.getenv('LOG_SAMPLE_RATE', '200')),
+                'django.request': int(os.getenv('LOG_SAMPLE_RATE_REQUEST', '60')),
+                'django.security': 30,
+            },
+            'period': 60,
+            'level': 'WARNING',
         },
     },
     'handlers': {
-        'file': {
+        'queue': {
+            '()': 'core.logqueue.QueueLogHandler',
+            'filename': LOG_FILE,
+            'console': DEBUG and not TESTING,
             'level': 'INFO',
-            'class': 'logging.FileHandler',
-            'filename': os.path.join(BASE_DIR, 'hospital_management.log'),
-            'formatter': 'verbose',
-        },
-        'console': {
-            'level': 'INFO',
-            'class': 'logging.StreamHandler',
-            'formatter': 'verbose',
+            'filters': ['sampling'],
         },
     },
+    'root': {
+        'handlers': ['queue'],
+        'level': 'INFO',
+    },
     'loggers': {
         'django': {
-            'handlers': ['file', 'console'],
+            'handlers': [],
             'level': 'INFO',
             'propagate': True,
         },
         'core': {
-            'handlers': ['file', 'console'],
+            'handlers': [],
             'level': 'INFO',
             'propagate': True,
         },
@@ -226,11 +286,73 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10,
 }
 
+# Cache Settings
+# RATE_LIMIT_STORE picks where rate-limit counters live: 'locmem' (per
+# process), 'file' (shared by every worker on the host) or 'db' (a SQLite
+# table, created with `manage.py createcachetable`)
+RATE_LIMIT_STORES = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'rate-limit',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'rate_limit'),
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'rate_limit_cache',
+    },
+}
+# Sessions are cached in front of the database, so every worker must see
+# the same entries: SESSION_CACHE_STORE is 'file' or 'db' (a process-local
+# cache fails the core.E001 system check)
+SESSION_CACHE_STORES = {
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'sessions'),
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'session_cache',
+    },
+}
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'rate_limit': RATE_LIMIT_STORES[os.getenv('RATE_LIMIT_STORE', 'locmem')],
+    'sessions': SESSION_CACHE_STORES[os.getenv('SESSION_CACHE_STORE', 'file')],
+}
+
+# Rate Limiting
+RATE_LIMIT_CACHE = 'rate_limit'
+RATE_LIMIT_TRUST_FORWARDED_FOR = os.getenv('RATE_LIMIT_TRUST_FORWARDED_FOR', 'False') == 'True'
+
 # Session Settings
+SESSION_ENGINE = 'core.sessions'
+SESSION_CACHE_ALIAS = 'sessions'
 SESSION_COOKIE_AGE = 3600  # 1 hour
 SESSION_SAVE_EVERY_REQUEST = True
+# Unchanged sessions are only re-saved once the sliding expiry has moved
+# by this many seconds
+SESSION_EXPIRY_WRITE_THRESHOLD = 300
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
 
 # File Upload Settings
+# Uploads above FILE_UPLOAD_MAX_MEMORY_SIZE are spooled to a temporary file
+# and streamed to storage in chunks, so FILE_UPLOAD_MAX_SIZE can be larger
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
+FILE_UPLOAD_MAX_SIZE = int(os.getenv('FILE_UPLOAD_MAX_SIZE', 50 * 1024 * 1024))  # 50MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
+
+# Attachment downloads are permission-checked in Django; the bytes can be
+# handed to the front server: 'x-accel' (nginx X-Accel-Redirect to an
+# internal location aliased to MEDIA_ROOT), 'x-sendfile' (Apache/lighttpd)
+# or 'django' (served by the app with Range and conditional support)
+ATTACHMENT_SERVE_MODE = os.getenv('ATTACHMENT_SERVE_MODE', 'django')
+ATTACHMENT_ACCEL_PREFIX = '/protected-media/'
+
+# Thumbnails/previews of uploads: 'process' pool, 'thread' pool or 'sync'
+PREVIEW_EXECUTOR = os.getenv('PREVIEW_EXECUTOR', 'process')
+PREVIEW_WORKERS = int(os.getenv('PREVIEW_WORKERS', '2'))